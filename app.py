@@ -30,6 +30,7 @@ home_page = st.Page("pages/home.py", title="Home", default=True)
 aplica_procedimento_page = st.Page('pages/aplica_procedimentos.py', title="Aplica Procedimentos")
 carrega_auditoria_page = st.Page('pages/carrega_auditoria.py', title="Carregar Resultado")
 visualiza_resultados_page = st.Page('pages/visualiza_resultados.py', title="Visualiza Resultado")
+desempenho_page = st.Page('pages/desempenho.py', title="Desempenho")
 gera_relatorios_individuais_page = st.Page('pages/gera_relatorios_individuais.py', title="Gera Relatórios Individuais")
 gera_anexo_evidencias_page = st.Page('pages/gera_anexo_evidencias.py', title="Gera Anexo Evidências")
 analise_gemini_auditados_page = st.Page('pages/analise_gemini.py', title="Análise de Auditados com IA")
@@ -43,7 +44,7 @@ navigation_items = {
 
 # Adiciona páginas condicionalmente se a auditoria foi concluída
 if st.session_state.audit_completed:
-    navigation_items["Procedimentos"].append(visualiza_resultados_page)
+    navigation_items["Procedimentos"].extend([visualiza_resultados_page, desempenho_page])
     navigation_items["Relatório"].extend([gera_relatorios_individuais_page, gera_anexo_evidencias_page])
     navigation_items["Análise IA"].append(analise_gemini_auditados_page)
 
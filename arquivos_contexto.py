@@ -0,0 +1,142 @@
+import io
+import os
+import hashlib
+import zipfile
+import threading
+
+from cache_respostas import hash_conteudo
+
+
+TAMANHO_BLOCO = 1024 ** 2
+
+
+class ArquivoZip:
+    """
+    Arquivo ZIP de contexto aberto sob demanda.
+
+    Apenas o diretório central é lido ao indexar; o conteúdo de cada membro só é descomprimido
+    quando for usado. `origem` é o caminho do arquivo ou um objeto binário (ex: o arquivo carregado
+    no Streamlit). Ao serializar com pickle (jobs em segundo plano) só a origem é levada, e o ZIP é
+    reaberto no outro processo.
+    """
+    def __init__(self, origem, nome=None):
+        self.origem = origem
+        self.nome = nome or getattr(origem, 'name', str(origem))
+        self._zip = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"ArquivoZip(nome='{self.nome}')"
+
+    def __getstate__(self):
+        estado = self.__dict__.copy()
+        estado['_zip'] = None
+        del estado['_lock']
+        return estado
+
+    def __setstate__(self, estado):
+        self.__dict__.update(estado)
+        self._lock = threading.Lock()
+
+    @property
+    def zip(self):
+        with self._lock:
+            if self._zip is None:
+                self._zip = zipfile.ZipFile(self.origem, 'r')
+            return self._zip
+
+    def membros(self):
+        """Retorna o índice nome -> `MembroZip` dos arquivos do ZIP, sem descomprimir nenhum deles."""
+        return {info.filename: MembroZip(self, info) for info in self.zip.infolist() if not info.is_dir()}
+
+
+class MembroZip:
+    """
+    Referência preguiçosa a um arquivo dentro de um `ArquivoZip`.
+
+    Oferece a mesma interface usada dos arquivos carregados (`name`, `size`, `getvalue()`), mas o
+    conteúdo não fica em memória: `getvalue()` descomprime o membro a cada chamada e `abre()` retorna
+    um fluxo para leitura em blocos.
+    """
+    def __init__(self, arquivo_zip, info):
+        self.arquivo_zip = arquivo_zip
+        self.name = info.filename
+        self.size = info.file_size
+        self._hash = None
+
+    def __repr__(self):
+        return f"MembroZip(zip='{self.arquivo_zip.nome}', name='{self.name}', size={self.size})"
+
+    def abre(self):
+        """Abre o membro para leitura em fluxo (binário e com suporte a seek)."""
+        return self.arquivo_zip.zip.open(self.name, 'r')
+
+    def getvalue(self):
+        with self.abre() as f:
+            return f.read()
+
+    def hash(self):
+        """Hash SHA-256 do conteúdo, calculado lendo o membro em blocos."""
+        if self._hash is None:
+            sha = hashlib.sha256()
+            with self.abre() as f:
+                for bloco in iter(lambda: f.read(TAMANHO_BLOCO), b''):
+                    sha.update(bloco)
+            self._hash = sha.hexdigest()
+        return self._hash
+
+
+def indexa_arquivos(arquivos_carregados):
+    """
+    Mapeia pelo nome os arquivos carregados, expandindo os ZIPs em referências preguiçosas aos seus membros.
+    """
+    arquivos = {}
+    for arquivo in arquivos_carregados or []:
+        if arquivo.name.lower().endswith('.zip'):
+            arquivos.update(ArquivoZip(arquivo).membros())
+        else:
+            arquivos[arquivo.name] = arquivo
+    return arquivos
+
+
+def hash_arquivo(arquivo):
+    """Hash do conteúdo de um arquivo de contexto, sem carregar membros de ZIP inteiros na memória."""
+    if isinstance(arquivo, MembroZip):
+        return arquivo.hash()
+    return hash_conteudo(arquivo.getvalue())
+
+
+def tamanho_arquivo(arquivo):
+    """Tamanho em bytes de um arquivo de contexto, sem descomprimi-lo."""
+    tamanho = getattr(arquivo, 'size', None)
+    return tamanho if tamanho is not None else len(arquivo.getvalue())
+
+
+def abre_arquivo(arquivo):
+    """Retorna um fluxo binário com o conteúdo de um arquivo de contexto, posicionado no início."""
+    if isinstance(arquivo, MembroZip):
+        return arquivo.abre()
+    return io.BytesIO(arquivo.getvalue())
+
+
+class ArquivoPreparado:
+    """
+    Arquivo de contexto pronto para upload: um fluxo aberto ou o caminho de um arquivo temporário,
+    com a configuração do upload. `descarta()` fecha o fluxo ou remove o arquivo temporário e pode
+    ser chamado mais de uma vez.
+    """
+    def __init__(self, arquivo, fonte, config_upload=None, temporario=False):
+        self.arquivo = arquivo
+        self.fonte = fonte
+        self.config_upload = config_upload
+        self.temporario = temporario
+
+    def __repr__(self):
+        return f"ArquivoPreparado(nome='{self.arquivo.name}', temporario={self.temporario})"
+
+    def descarta(self):
+        if self.temporario:
+            if os.path.exists(self.fonte):
+                os.remove(self.fonte)
+        else:
+            self.fonte.close()
@@ -0,0 +1,211 @@
+"""
+Execução da auditoria pela linha de comando, sem o Streamlit (ex: execuções noturnas agendadas).
+
+Lê a base de auditados, o mapa de verificação e as fontes de informação de um diretório, aplica os
+procedimentos com o mesmo modelo das páginas (`FonteInformacao` → `AcaoVerificacao` →
+`ProcedimentoAuditoria` → `Auditado`) e grava no diretório de saída o objeto auditados (.pkl), as
+tabelas consolidadas (.xlsx) e os relatórios de procedimentos (.zip). Exemplo:
+
+    python auditoria_cli.py --auditados bd_auditados.xlsx --mapa mapa-verificacao-achados.xlsx \\
+        --fontes fontes/ --saida resultado/ --workers 4
+"""
+import io
+import os
+import sys
+import time
+import pickle
+import zipfile
+import argparse
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+
+from classes import (le_planilha, cria_fontes_informacao, cria_acoes_verificacao, cria_procedimentos, cria_auditados,
+                     executar_auditoria, gerar_resultados, grava_tabelas_excel)
+
+
+ARQUIVO_PICKLE = 'auditados.pkl'
+ARQUIVO_TABELAS = 'tabelas_consolidadas_auditoria.xlsx'
+ARQUIVO_RELATORIOS = 'relatorios_procedimentos_auditados.zip'
+LOTES_POR_WORKER = 4  # Lotes menores equilibram melhor a carga entre os workers
+
+# Procedimentos do mapa, recebidos uma única vez por processo worker (ver `_inicializa_worker`)
+_procedimentos_worker = None
+
+
+class ProgressoTerminal:
+    """Imprime o andamento da execução; mesma interface de `jobs.Progresso`, limitada a uma linha por `intervalo` segundos."""
+    def __init__(self, intervalo=1.0):
+        self.intervalo = intervalo
+        self._ultima = 0.0
+
+    def __repr__(self):
+        return f"ProgressoTerminal(intervalo={self.intervalo})"
+
+    def atualiza(self, fracao=None, mensagem=None):
+        agora = time.monotonic()
+        if agora - self._ultima < self.intervalo and not (fracao is not None and fracao >= 1):
+            return
+        self._ultima = agora
+        prefixo = f"[{fracao:4.0%}] " if fracao is not None else ""
+        print(f"  {prefixo}{mensagem or ''}", flush=True)
+
+
+@contextmanager
+def etapa(nome, tempos):
+    """Imprime o início e a duração de uma etapa e a registra em `tempos`."""
+    print(f"{nome}...", flush=True)
+    inicio = time.perf_counter()
+    yield
+    tempos[nome] = time.perf_counter() - inicio
+    print(f"  concluída em {tempos[nome]:.1f} s", flush=True)
+
+
+def _inicializa_worker(procedimentos):
+    global _procedimentos_worker
+    _procedimentos_worker = procedimentos
+
+
+def _aplica_lote(auditados):
+    for auditado in auditados:
+        auditado.aplicar_procedimentos(_procedimentos_worker)
+    return auditados
+
+
+def _documenta_lote(auditados):
+    relatorios = []
+    for auditado in auditados:
+        if auditado.foi_auditado:
+            bio = io.BytesIO()
+            auditado.documenta_procedimentos().save(bio)
+            relatorios.append((auditado.sigla, bio.getvalue()))
+    return relatorios
+
+
+def _lotes(itens, workers):
+    tamanho = max(1, -(-len(itens) // (workers * LOTES_POR_WORKER)))
+    return [itens[i:i + tamanho] for i in range(0, len(itens), tamanho)]
+
+
+def _pool(workers, procedimentos=None):
+    # 'spawn' para o mesmo comportamento em Linux, macOS e Windows (ver `jobs.GerenciadorJobs`)
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                               initializer=_inicializa_worker, initargs=(procedimentos,))
+
+
+def aplica_procedimentos(auditados, procedimentos, workers=1):
+    """
+    Aplica os procedimentos em todos os auditados e retorna o resultado (auditados e tabelas). Com mais de
+    um worker, os auditados são divididos em lotes processados em paralelo, em processos separados.
+    """
+    if workers <= 1:
+        return executar_auditoria(auditados, procedimentos, progresso=ProgressoTerminal())
+
+    lotes = _lotes(list(auditados.values()), workers)
+    processados = {}
+    with _pool(workers, procedimentos) as pool:
+        for auditados_lote in pool.map(_aplica_lote, lotes):
+            processados.update((auditado.sigla, auditado) for auditado in auditados_lote)
+            print(f"  [{len(processados) / len(auditados):4.0%}] Procedimentos aplicados em {len(processados)}/{len(auditados)} auditados.", flush=True)
+    # Mantém a ordem da base de auditados
+    return gerar_resultados({sigla: processados[sigla] for sigla in auditados})
+
+
+def grava_relatorios(auditados, caminho_zip, diretorio_individuais=None, workers=1):
+    """
+    Gera os relatórios de procedimentos e os grava no .zip à medida que ficam prontos, sem manter todos
+    em memória; opcionalmente grava também cada .docx em `diretorio_individuais`. Retorna a quantidade.
+    """
+    lotes = _lotes(list(auditados.values()), workers)
+    if workers <= 1:
+        relatorios_por_lote = map(_documenta_lote, lotes)
+        pool = None
+    else:
+        pool = _pool(workers)
+        relatorios_por_lote = pool.map(_documenta_lote, lotes)
+
+    total, gerados = len(auditados), 0
+    progresso = ProgressoTerminal()
+    try:
+        with zipfile.ZipFile(caminho_zip, 'w', zipfile.ZIP_DEFLATED) as zip_f:
+            for relatorios in relatorios_por_lote:
+                for sigla, docx_bytes in relatorios:
+                    nome = f"{sigla} - Relatorio.docx"
+                    zip_f.writestr(nome, docx_bytes)
+                    if diretorio_individuais:
+                        with open(os.path.join(diretorio_individuais, nome), 'wb') as f:
+                            f.write(docx_bytes)
+                    gerados += 1
+                progresso.atualiza(gerados / total, f"Relatórios gerados: {gerados}/{total}.")
+    finally:
+        if pool:
+            pool.shutdown()
+    return gerados
+
+
+def grava_tabelas(resultados, caminho):
+    """Grava as tabelas consolidadas com as mesmas abas do download da página 'Visualizar Resultado'."""
+    grava_tabelas_excel(resultados, caminho)
+
+
+def _argumentos(argv=None):
+    parser = argparse.ArgumentParser(description="Aplica os procedimentos de auditoria do mapa de verificação, sem interface.")
+    parser.add_argument('--auditados', required=True, help="Planilha da base de auditados (colunas 'sigla' e 'orgao').")
+    parser.add_argument('--mapa', required=True, help="Planilha do mapa de verificação e achados.")
+    parser.add_argument('--fontes', required=True, help="Diretório com as planilhas das fontes de informação citadas no mapa.")
+    parser.add_argument('--saida', required=True, help="Diretório onde serão gravados os resultados.")
+    parser.add_argument('--workers', type=int, default=1, help="Processos em paralelo na aplicação dos procedimentos e nos relatórios.")
+    parser.add_argument('--sem-relatorios', action='store_true', help="Não gera os relatórios de procedimentos (.docx).")
+    parser.add_argument('--relatorios-individuais', action='store_true',
+                        help="Grava também cada relatório .docx no subdiretório 'relatorios' da saída.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _argumentos(argv)
+    os.makedirs(args.saida, exist_ok=True)
+    tempos = {}
+    inicio = time.perf_counter()
+
+    with etapa("Carregando planilhas", tempos):
+        df_jurisdicionados = le_planilha(args.auditados, skiprows=0)
+        df_procedimentos = le_planilha(args.mapa, sheet_name='Procedimentos de Auditoria')
+        df_acoes_verificacao = le_planilha(args.mapa, sheet_name='Ações de Verificação')
+        df_fontes = le_planilha(args.mapa, sheet_name='Fontes de Informação')
+
+    with etapa("Lendo fontes de informação", tempos):
+        arquivos_fontes = {nome: os.path.join(args.fontes, nome) for nome in os.listdir(args.fontes)}
+        fontes, erros_fontes = cria_fontes_informacao(df_fontes, arquivos_fontes)
+        acoes, erros_acoes = cria_acoes_verificacao(df_acoes_verificacao, fontes)
+        for erro in erros_fontes + erros_acoes:
+            print(f"  ERRO: {erro}", file=sys.stderr, flush=True)
+        procedimentos = list(cria_procedimentos(df_procedimentos, acoes).values())
+        auditados = cria_auditados(df_jurisdicionados)
+        print(f"  {len(fontes)} fontes, {len(acoes)} ações, {len(procedimentos)} procedimentos, {len(auditados)} auditados.")
+
+    with etapa("Aplicando procedimentos", tempos):
+        resultados = aplica_procedimentos(auditados, procedimentos, workers=args.workers)
+
+    with etapa("Gravando objeto auditados e tabelas", tempos):
+        with open(os.path.join(args.saida, ARQUIVO_PICKLE), 'wb') as f:
+            pickle.dump(resultados["auditados"], f)
+        grava_tabelas(resultados, os.path.join(args.saida, ARQUIVO_TABELAS))
+
+    if not args.sem_relatorios:
+        with etapa("Gerando relatórios de procedimentos", tempos):
+            diretorio_individuais = None
+            if args.relatorios_individuais:
+                diretorio_individuais = os.path.join(args.saida, 'relatorios')
+                os.makedirs(diretorio_individuais, exist_ok=True)
+            grava_relatorios(resultados["auditados"], os.path.join(args.saida, ARQUIVO_RELATORIOS),
+                             diretorio_individuais, workers=args.workers)
+
+    print(f"\nAuditoria concluída em {time.perf_counter() - inicio:.1f} s. Resultados em '{args.saida}'.")
+    for nome, segundos in tempos.items():
+        print(f"  {nome:<40} {segundos:>8.1f} s")
+    print(f"  Auditados com achados: {sum(1 for a in resultados['auditados'].values() if a.tem_achados)}/{len(auditados)}")
+    return 1 if erros_fontes or erros_acoes else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
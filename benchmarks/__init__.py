@@ -0,0 +1,11 @@
+"""
+Benchmarks do Argos com dados sintéticos em escala.
+
+`gerador` cria a base de auditados, o mapa de verificação e as fontes de informação com os tamanhos
+pedidos; `executa` mede cada etapa do processamento (carga do mapa, leitura das fontes, aplicação dos
+procedimentos, tabelas, pickle, planilha e relatórios DOCX), além do tempo de importação a frio dos
+pontos de entrada (`importacao`), e grava os tempos em JSON, para comparação entre commits. Com
+`--memoria`, `memoria` mede também o pico e a memória retida de cada etapa, e `--orcamento-memoria` faz
+a execução falhar se um limite for excedido (ver `orcamento_memoria_pequeno.json`).
+Uso: `python -m benchmarks --help`.
+"""
@@ -0,0 +1,3 @@
+from benchmarks.executa import main
+
+main()
@@ -0,0 +1,204 @@
+import argparse
+import io
+import json
+import os
+import pickle
+import platform
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+from benchmarks.gerador import PERFIS, ParametrosSinteticos, gera_arquivos
+from benchmarks.medicao import MedicaoEtapas
+from benchmarks.importacao import mede_importacoes
+from benchmarks.memoria import MedicaoMemoria, carrega_orcamento, verifica_orcamento, rss_pico_processo, MB
+from classes import (cria_fontes_informacao, cria_acoes_verificacao, cria_procedimentos, cria_auditados,
+                     gerar_tabela_achados, gerar_tabela_encaminhamentos, gerar_tabela_situacoes_inconformes,
+                     gerar_indicadores, gerar_arquivos_download, grava_tabelas_excel, le_planilha)
+
+
+def _commit_atual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def prepara_dados(parametros, diretorio):
+    """
+    Gera a massa sintética em `diretorio`, reaproveitando a já existente se tiver sido gerada com os mesmos
+    parâmetros (a geração das planilhas grandes leva mais que o próprio processamento).
+    """
+    caminho_parametros = os.path.join(diretorio, 'parametros.json')
+    if os.path.exists(caminho_parametros):
+        with open(caminho_parametros, encoding='utf-8') as f:
+            if json.load(f) == parametros.como_dict():
+                return {
+                    'auditados': os.path.join(diretorio, 'bd_auditados.xlsx'),
+                    'mapa': os.path.join(diretorio, 'mapa-verificacao-achados.xlsx'),
+                    'fontes': sorted(os.path.join(diretorio, nome) for nome in os.listdir(diretorio) if nome.startswith('fonte_')),
+                }
+    caminhos = gera_arquivos(parametros, diretorio)
+    with open(caminho_parametros, 'w', encoding='utf-8') as f:
+        json.dump(parametros.como_dict(), f)
+    return caminhos
+
+
+def _carrega_mapa(caminhos):
+    df_jurisdicionados = le_planilha(caminhos['auditados'], skiprows=0)
+    df_procedimentos = le_planilha(caminhos['mapa'], sheet_name='Procedimentos de Auditoria')
+    df_acoes_verificacao = le_planilha(caminhos['mapa'], sheet_name='Ações de Verificação')
+    df_fontes = le_planilha(caminhos['mapa'], sheet_name='Fontes de Informação')
+    return df_jurisdicionados, df_procedimentos, df_acoes_verificacao, df_fontes
+
+
+def _aplica_procedimentos(auditados, procedimentos):
+    for auditado in auditados.values():
+        auditado.aplicar_procedimentos(procedimentos)
+
+
+def _gera_excel(resultados):
+    buffer = io.BytesIO()
+    grava_tabelas_excel(resultados, buffer)
+    return buffer.getvalue()
+
+
+def executa_benchmark(parametros, diretorio, max_docx=50, medicao=None):
+    """
+    Executa todas as etapas do processamento sobre a massa sintética, na mesma sequência da página
+    'Aplicar Procedimentos' e da geração de relatórios. Os relatórios DOCX são gerados para uma amostra
+    de até `max_docx` auditados, pois o tempo por auditado é constante. Retorna a `MedicaoEtapas`.
+    """
+    medicao = medicao or MedicaoEtapas()
+    print(f"Gerando dados sintéticos em '{diretorio}': {parametros}", flush=True)
+    # A geração não faz parte do processamento; é medida só em tempo, mesmo na medição de memória
+    caminhos = MedicaoEtapas.mede(medicao, 'geracao_dados', lambda: prepara_dados(parametros, diretorio))
+
+    print("Executando etapas:", flush=True)
+    df_jurisdicionados, df_procedimentos, df_acoes_verificacao, df_fontes = medicao.mede(
+        'carga_mapa', lambda: _carrega_mapa(caminhos), itens=parametros.acoes + parametros.procedimentos)
+    arquivos_fontes = {os.path.basename(caminho): caminho for caminho in caminhos['fontes']}
+    fontes, erros = medicao.mede('leitura_fontes', lambda: cria_fontes_informacao(df_fontes, arquivos_fontes),
+                                 itens=parametros.fontes)
+    if erros:
+        raise RuntimeError("; ".join(erros))
+    acoes, erros = cria_acoes_verificacao(df_acoes_verificacao, fontes)
+    if erros:
+        raise RuntimeError("; ".join(erros))
+    procedimentos = list(cria_procedimentos(df_procedimentos, acoes).values())
+    auditados = cria_auditados(df_jurisdicionados)
+
+    medicao.mede('aplicacao_procedimentos', lambda: _aplica_procedimentos(auditados, procedimentos),
+                 itens=len(auditados) * len(procedimentos))
+    resultados = {"auditados": auditados}
+    resultados["tabela_achados"] = medicao.mede('tabela_achados', lambda: gerar_tabela_achados(auditados), itens=len(auditados))
+    resultados["tabela_encaminhamentos"] = medicao.mede('tabela_encaminhamentos', lambda: gerar_tabela_encaminhamentos(auditados), itens=len(auditados))
+    resultados["tabela_situacoes"] = medicao.mede('tabela_situacoes', lambda: gerar_tabela_situacoes_inconformes(auditados), itens=len(auditados))
+    resultados["indicadores"] = medicao.mede('indicadores', lambda: gerar_indicadores(
+        resultados["tabela_achados"], resultados["tabela_encaminhamentos"], resultados["tabela_situacoes"]), itens=len(auditados))
+
+    dados_pickle = medicao.mede('pickle_gravacao', lambda: pickle.dumps(resultados), itens=len(auditados))
+    # O objeto lido é descartado, para que a memória retida da etapa não inclua uma segunda cópia dos resultados
+    medicao.mede('pickle_leitura', lambda: len(pickle.loads(dados_pickle)), itens=len(auditados))
+    medicao.mede('exportacao_excel', lambda: _gera_excel(resultados), itens=len(auditados))
+
+    amostra = dict(list(auditados.items())[:max_docx])
+    resultados_amostra = dict(resultados, auditados=amostra)
+    for tabela in ("tabela_achados", "tabela_encaminhamentos", "tabela_situacoes"):
+        resultados_amostra[tabela] = resultados[tabela].head(0)
+    # O python-docx é importado só na geração dos relatórios; a importação (medida nas etapas 'importacao_*')
+    # é feita antes, para que a etapa meça apenas a geração
+    import docx.enum.text  # noqa: F401
+    medicao.mede('relatorios_docx_zip', lambda: gerar_arquivos_download(resultados_amostra), itens=len(amostra))
+
+    medicao.tamanhos = {'pickle_bytes': len(dados_pickle)}
+    return medicao
+
+
+def compara(atual, base):
+    """Imprime, etapa a etapa, o tempo da execução atual em relação ao de um JSON de execução anterior."""
+    tempos_base = {etapa['etapa']: etapa['segundos'] for etapa in base['etapas']}
+    print(f"\nComparação com {base.get('commit') or 'base'} ({base.get('data')}):")
+    print(f"  {'etapa':<28} {'base (s)':>10} {'atual (s)':>10} {'razão':>8}")
+    for etapa in atual['etapas']:
+        anterior = tempos_base.get(etapa['etapa'])
+        razao = f"{etapa['segundos'] / anterior:.2f}x" if anterior else '-'
+        print(f"  {etapa['etapa']:<28} {anterior if anterior is not None else '-':>10} {etapa['segundos']:>10} {razao:>8}")
+    if base.get('parametros') != atual['parametros']:
+        print("  Atenção: os parâmetros da massa sintética diferem entre as execuções.")
+
+
+def _argumentos(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks',
+                                     description="Benchmark das etapas do Argos com dados sintéticos.")
+    parser.add_argument('--perfil', choices=sorted(PERFIS), default='pequeno',
+                        help="Tamanhos de referência; os parâmetros abaixo sobrepõem os do perfil.")
+    parser.add_argument('--auditados', type=int)
+    parser.add_argument('--acoes', type=int)
+    parser.add_argument('--fontes', type=int)
+    parser.add_argument('--campos-por-fonte', type=int)
+    parser.add_argument('--acoes-por-procedimento', type=int)
+    parser.add_argument('--semente', type=int)
+    parser.add_argument('--max-docx', type=int, default=50, help="Auditados da amostra de relatórios DOCX.")
+    parser.add_argument('--dados', help="Diretório da massa sintética (reaproveitada se os parâmetros forem os mesmos).")
+    parser.add_argument('--saida', help="Arquivo JSON com os resultados (padrão: benchmark-<commit>-<perfil>.json).")
+    parser.add_argument('--compara', help="JSON de uma execução anterior para comparação.")
+    parser.add_argument('--sem-importacao', action='store_true',
+                        help="Não mede o tempo de importação a frio dos pontos de entrada (motor, linha de comando, app).")
+    parser.add_argument('--memoria', action='store_true',
+                        help="Mede também a memória de cada etapa (tracemalloc e RSS); deixa a execução mais lenta.")
+    parser.add_argument('--memoria-por-tipo', action='store_true',
+                        help="Com --memoria, lista os tipos de objeto que mais cresceram em cada etapa.")
+    parser.add_argument('--orcamento-memoria',
+                        help="JSON com os limites de memória por etapa; a execução falha (código 1) se algum for excedido.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _argumentos(argv)
+    parametros = ParametrosSinteticos(**vars(PERFIS[args.perfil]))
+    for chave in ('auditados', 'acoes', 'fontes', 'campos_por_fonte', 'acoes_por_procedimento', 'semente'):
+        if getattr(args, chave) is not None:
+            setattr(parametros, chave, getattr(args, chave))
+
+    diretorio = args.dados or os.path.join(tempfile.gettempdir(), f"argos-benchmark-{args.perfil}")
+    medir_memoria = args.memoria or args.memoria_por_tipo or bool(args.orcamento_memoria)
+    medicao = MedicaoMemoria(por_tipo=args.memoria_por_tipo) if medir_memoria else MedicaoEtapas()
+    if not args.sem_importacao:
+        mede_importacoes(medicao)
+    executa_benchmark(parametros, diretorio, max_docx=args.max_docx, medicao=medicao)
+
+    commit = _commit_atual()
+    resultado = {
+        'commit': commit,
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'plataforma': platform.platform(),
+        'perfil': args.perfil,
+        'parametros': parametros.como_dict(),
+        'max_docx': args.max_docx,
+        'tamanhos': medicao.tamanhos,
+        'etapas': medicao.etapas,
+    }
+    if medir_memoria:
+        resultado['memoria'] = {'rss_pico_processo_mb': round(rss_pico_processo() / MB, 1)}
+    saida = args.saida or f"benchmark-{commit or 'local'}-{args.perfil}.json"
+    with open(saida, 'w', encoding='utf-8') as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados gravados em '{saida}'.")
+
+    if args.compara:
+        with open(args.compara, encoding='utf-8') as f:
+            compara(resultado, json.load(f))
+
+    if args.orcamento_memoria:
+        violacoes = verifica_orcamento(resultado, carrega_orcamento(args.orcamento_memoria))
+        if violacoes:
+            print("\nOrçamento de memória excedido:")
+            for violacao in violacoes:
+                print(f"  - {violacao}")
+            sys.exit(1)
+        print("\nOrçamento de memória respeitado.")
+    return resultado
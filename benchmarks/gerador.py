@@ -0,0 +1,172 @@
+import os
+import random
+
+import numpy as np
+import pandas as pd
+
+
+# Respostas textuais das fontes sintéticas e os critérios de inconformidade aplicados a elas
+RESPOSTAS = ['Adota integralmente', 'Adota parcialmente', 'Não adota', 'Sim', 'Não']
+CRITERIOS_TEXTO = ['Não', 'Não adota', '(Não adota | Adota parcialmente)', '~Sim']
+CRITERIOS_NUMERICOS = ['< 50', '>= 90', '== 0']
+
+# Colunas das abas do mapa, na ordem do exemplo em docs/mapa-verificacao-achados.xlsx
+COLUNAS_FONTES = ['id', 'descricao', 'filepath', 'chave_jurisdicionado']
+COLUNAS_PROCEDIMENTOS = ['id', 'descricao', 'logica_achado', 'numero_achado', 'nome_achado']
+COLUNAS_ACOES = ['id', 'id_fonte_informacao', 'acao_exclusiva_auditados', 'auditado_inexistente_e_achado',
+                 'descricao_auditado_inexistente', 'informacao_requerida', 'criterio', 'descricao_evidencia',
+                 'complemento_evidencia', 'descricao_situacao_inconforme', 'situacao_inconforme',
+                 'situacao_encontrada_nan_e_achado', 'decodifica_sit_encontrada', 'tipo_encaminhamento',
+                 'pre_encaminhamento', 'encaminhamento']
+
+
+class ParametrosSinteticos:
+    """
+    Tamanhos da massa de dados sintética.
+
+    `fracao_ausentes` é a fração de auditados que não constam de cada fonte (caminho de auditado
+    inexistente) e `fracao_vazios`, a fração de respostas em branco.
+    """
+    def __init__(self, auditados=1000, acoes=100, fontes=5, campos_por_fonte=50, acoes_por_procedimento=5,
+                 fracao_ausentes=0.05, fracao_vazios=0.05, semente=42):
+        self.auditados = auditados
+        self.acoes = acoes
+        self.fontes = fontes
+        self.campos_por_fonte = campos_por_fonte
+        self.acoes_por_procedimento = acoes_por_procedimento
+        self.fracao_ausentes = fracao_ausentes
+        self.fracao_vazios = fracao_vazios
+        self.semente = semente
+
+    def __repr__(self):
+        return (f"ParametrosSinteticos(auditados={self.auditados}, acoes={self.acoes}, fontes={self.fontes}, "
+                f"campos_por_fonte={self.campos_por_fonte}, acoes_por_procedimento={self.acoes_por_procedimento})")
+
+    @property
+    def procedimentos(self):
+        return max(1, -(-self.acoes // self.acoes_por_procedimento))
+
+    def como_dict(self):
+        return dict(vars(self), procedimentos=self.procedimentos)
+
+
+# Tamanhos de referência (o 'grande' é o cenário de 10 mil auditados x 500 ações x 20 fontes)
+PERFIS = {
+    'pequeno': ParametrosSinteticos(auditados=200, acoes=50, fontes=3, campos_por_fonte=30),
+    'medio': ParametrosSinteticos(auditados=2_000, acoes=200, fontes=10, campos_por_fonte=50),
+    'grande': ParametrosSinteticos(auditados=10_000, acoes=500, fontes=20, campos_por_fonte=50),
+}
+
+
+def _nome_campo(indice, numerico):
+    return f"n{indice:03d}" if numerico else f"q{indice:03d}"
+
+
+def _campos(parametros):
+    # Um em cada cinco campos é numérico, para exercitar também as expressões avaliadas com eval
+    return [_nome_campo(i, i % 5 == 0) for i in range(1, parametros.campos_por_fonte + 1)]
+
+
+def gera_fonte(parametros, siglas, rng):
+    """Gera o DataFrame de uma fonte de informação: uma linha por auditado presente, indexada pela coluna 'sigla'."""
+    presentes = [sigla for sigla in siglas if rng.random() >= parametros.fracao_ausentes]
+    dados = {'sigla': presentes}
+    for campo in _campos(parametros):
+        if campo.startswith('n'):
+            valores = rng.integers(0, 101, len(presentes)).astype(float)
+        else:
+            valores = rng.choice(RESPOSTAS, len(presentes)).astype(object)
+        valores[rng.random(len(presentes)) < parametros.fracao_vazios] = np.nan
+        dados[campo] = valores
+    return pd.DataFrame(dados)
+
+
+def gera_mapa(parametros, rng):
+    """Gera os DataFrames das abas 'Fontes de Informação', 'Ações de Verificação' e 'Procedimentos de Auditoria'."""
+    df_fontes = pd.DataFrame([
+        {'id': f"FI{i:02d}", 'descricao': f"Fonte sintética {i}", 'filepath': f"fonte_{i:02d}.xlsx", 'chave_jurisdicionado': 'sigla'}
+        for i in range(1, parametros.fontes + 1)
+    ], columns=COLUNAS_FONTES)
+
+    campos = _campos(parametros)
+    acoes = []
+    for i in range(1, parametros.acoes + 1):
+        campo = campos[rng.integers(len(campos))]
+        numerico = campo.startswith('n')
+        # Parte das ações textuais verifica dois campos de uma vez (sintaxe 'campo1|campo2')
+        if not numerico and rng.random() < 0.1:
+            outro = campos[rng.integers(len(campos))]
+            if not outro.startswith('n') and outro != campo:
+                campo = f"{campo}|{outro}"
+        acoes.append({
+            'id': f"AV{i:04d}",
+            'id_fonte_informacao': df_fontes['id'].iloc[rng.integers(parametros.fontes)],
+            'acao_exclusiva_auditados': np.nan,
+            'auditado_inexistente_e_achado': bool(rng.random() < 0.5),
+            'descricao_auditado_inexistente': "O auditado não respondeu ao levantamento.",
+            'informacao_requerida': campo,
+            'criterio': f"Critério sintético {i}",
+            'descricao_evidencia': f'Resposta "@" ao item {campo}.',
+            'complemento_evidencia': np.nan,
+            'descricao_situacao_inconforme': f"Situação inconforme sintética {i}.",
+            'situacao_inconforme': str(rng.choice(CRITERIOS_NUMERICOS if numerico else CRITERIOS_TEXTO)),
+            'situacao_encontrada_nan_e_achado': True if rng.random() < 0.2 else np.nan,
+            'decodifica_sit_encontrada': np.nan,
+            'tipo_encaminhamento': str(rng.choice(['Recomendação', 'Determinação', 'Ciência'])),
+            'pre_encaminhamento': np.nan,
+            'encaminhamento': f"adote as providências da ação {i}",
+        })
+    df_acoes = pd.DataFrame(acoes, columns=COLUNAS_ACOES)
+
+    procedimentos = []
+    ids_acoes = list(df_acoes['id'])
+    for i in range(parametros.procedimentos):
+        grupo = ids_acoes[i * parametros.acoes_por_procedimento:(i + 1) * parametros.acoes_por_procedimento]
+        # Lógica no formato do exemplo, com um termo negado ou em conjunção quando o grupo permite
+        logica = ' | '.join(grupo)
+        if len(grupo) >= 3:
+            logica = f"({' | '.join(grupo[:-2])}) | ({grupo[-2]} & ~{grupo[-1]})"
+        procedimentos.append({
+            'id': f"PA{i + 1:03d}",
+            'descricao': f"Procedimento sintético {i + 1}",
+            'logica_achado': logica,
+            'numero_achado': i + 1,
+            'nome_achado': f"Achado sintético {i + 1}",
+        })
+    df_procedimentos = pd.DataFrame(procedimentos, columns=COLUNAS_PROCEDIMENTOS)
+    return df_fontes, df_acoes, df_procedimentos
+
+
+def _grava_aba(writer, df, nome_aba):
+    # As abas do mapa têm duas linhas de orientação antes do cabeçalho (ver `classes.le_planilha`)
+    df.to_excel(writer, sheet_name=nome_aba, index=False, startrow=2)
+
+
+def gera_arquivos(parametros, diretorio):
+    """
+    Grava a massa sintética em `diretorio`, nos mesmos formatos aceitos pela página 'Aplicar Procedimentos':
+    'bd_auditados.xlsx', 'mapa-verificacao-achados.xlsx' e uma planilha 'fonte_NN.xlsx' por fonte.
+    Retorna o dicionário com os caminhos gerados ('auditados', 'mapa' e 'fontes', lista).
+    """
+    os.makedirs(diretorio, exist_ok=True)
+    rng = np.random.default_rng(parametros.semente)
+    random.seed(parametros.semente)
+
+    siglas = [f"AUD{i:05d}" for i in range(1, parametros.auditados + 1)]
+    caminho_auditados = os.path.join(diretorio, 'bd_auditados.xlsx')
+    pd.DataFrame({'sigla': siglas, 'orgao': [f"Órgão sintético {sigla}" for sigla in siglas]}).to_excel(caminho_auditados, index=False)
+
+    df_fontes, df_acoes, df_procedimentos = gera_mapa(parametros, rng)
+    caminho_mapa = os.path.join(diretorio, 'mapa-verificacao-achados.xlsx')
+    with pd.ExcelWriter(caminho_mapa, engine='xlsxwriter') as writer:
+        _grava_aba(writer, df_fontes, 'Fontes de Informação')
+        _grava_aba(writer, df_procedimentos, 'Procedimentos de Auditoria')
+        _grava_aba(writer, df_acoes, 'Ações de Verificação')
+
+    caminhos_fontes = []
+    for filepath in df_fontes['filepath']:
+        caminho = os.path.join(diretorio, filepath)
+        gera_fonte(parametros, siglas, rng).to_excel(caminho, index=False, engine='xlsxwriter')
+        caminhos_fontes.append(caminho)
+
+    return {'auditados': caminho_auditados, 'mapa': caminho_mapa, 'fontes': caminhos_fontes}
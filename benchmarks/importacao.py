@@ -0,0 +1,56 @@
+import os
+import sys
+import json
+import subprocess
+
+
+RAIZ_PROJETO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Pontos de entrada medidos: o motor da auditoria, a linha de comando, os utilitários das páginas,
+# a análise com IA e a inicialização do app do Streamlit
+MODULOS = {
+    'motor': 'classes',
+    'linha_comando': 'auditoria_cli',
+    'paginas': 'utils',
+    'analise_ia': 'execucao_gemini',
+    'app': 'app',
+}
+# Dependências pesadas que só devem ser carregadas por quem as usa
+DEPENDENCIAS_PESADAS = ('streamlit', 'google.genai', 'docxtpl', 'pypandoc', 'docx', 'jsonschema')
+
+_SCRIPT = """
+import sys, time, json
+inicio = time.perf_counter()
+import {modulo}
+segundos = time.perf_counter() - inicio
+print(json.dumps({{'segundos': segundos, 'dependencias': [d for d in {dependencias!r} if d in sys.modules]}}))
+"""
+
+
+def mede_importacao(modulo, repeticoes=3):
+    """
+    Tempo de importação a frio de `modulo` em um interpretador novo (o menor de `repeticoes` execuções) e
+    as dependências pesadas que ele carregou.
+    """
+    script = _SCRIPT.format(modulo=modulo, dependencias=DEPENDENCIAS_PESADAS)
+    medicoes = []
+    for _ in range(repeticoes):
+        saida = subprocess.run([sys.executable, '-c', script], cwd=RAIZ_PROJETO, capture_output=True, text=True, check=True).stdout
+        # A última linha é a medição (o app pode imprimir avisos antes)
+        medicoes.append(json.loads(saida.strip().splitlines()[-1]))
+    return min(medicoes, key=lambda medicao: medicao['segundos'])
+
+
+def mede_importacoes(medicao, repeticoes=3):
+    """Registra em `medicao` (uma `MedicaoEtapas`) uma etapa 'importacao_<nome>' por ponto de entrada de `MODULOS`."""
+    print("Medindo importação a frio:", flush=True)
+    for nome, modulo in MODULOS.items():
+        resultado = mede_importacao(modulo, repeticoes)
+        medicao.etapas.append({
+            'etapa': f"importacao_{nome}",
+            'segundos': round(resultado['segundos'], 4),
+            'itens': None,
+            'itens_por_segundo': None,
+            'dependencias': resultado['dependencias'],
+        })
+        print(f"  {'importacao_' + nome:<28} {resultado['segundos']:>9.3f} s  ({', '.join(resultado['dependencias']) or 'sem dependências pesadas'})", flush=True)
@@ -0,0 +1,27 @@
+import time
+
+
+class MedicaoEtapas:
+    """Mede o tempo de cada etapa do benchmark e acumula os resultados na ordem de execução."""
+    def __init__(self):
+        self.etapas = []
+
+    def __repr__(self):
+        return f"MedicaoEtapas(etapas={len(self.etapas)})"
+
+    def mede(self, nome, funcao, itens=None):
+        """
+        Executa `funcao()` e registra o tempo gasto. `itens` é a quantidade processada na etapa, usada
+        para calcular a vazão. Retorna o resultado da função.
+        """
+        inicio = time.perf_counter()
+        resultado = funcao()
+        segundos = time.perf_counter() - inicio
+        self.etapas.append({
+            'etapa': nome,
+            'segundos': round(segundos, 4),
+            'itens': itens,
+            'itens_por_segundo': round(itens / segundos, 1) if itens and segundos > 0 else None,
+        })
+        print(f"  {nome:<28} {segundos:>9.3f} s" + (f"  ({itens} itens)" if itens else ""), flush=True)
+        return resultado
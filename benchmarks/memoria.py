@@ -0,0 +1,167 @@
+import gc
+import json
+import os
+import resource
+import sys
+import threading
+import tracemalloc
+from collections import Counter
+
+from benchmarks.medicao import MedicaoEtapas
+
+
+MB = 1024 * 1024
+INTERVALO_AMOSTRAGEM_RSS = 0.005
+TIPOS_POR_ETAPA = 10
+
+
+def rss_atual():
+    """Memória residente (RSS) atual do processo em bytes, ou None se não for possível obtê-la (fora do Linux)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def rss_pico_processo():
+    """Pico de RSS do processo desde o início, em bytes (`ru_maxrss` é em KB no Linux e em bytes no macOS)."""
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico if sys.platform == 'darwin' else pico * 1024
+
+
+class AmostradorRSS:
+    """Amostra o RSS do processo em uma thread enquanto ativo, guardando o pico observado."""
+    def __init__(self, intervalo=INTERVALO_AMOSTRAGEM_RSS):
+        self.intervalo = intervalo
+        self.pico = None
+        self._parar = threading.Event()
+        self._thread = None
+
+    def __repr__(self):
+        return f"AmostradorRSS(pico={self.pico})"
+
+    def __enter__(self):
+        self.pico = rss_atual()
+        self._parar.clear()
+        self._thread = threading.Thread(target=self._amostra, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._parar.set()
+        self._thread.join()
+        self._atualiza(rss_atual())
+        return False
+
+    def _atualiza(self, rss):
+        if rss is not None:
+            self.pico = max(self.pico or 0, rss)
+
+    def _amostra(self):
+        while not self._parar.wait(self.intervalo):
+            self._atualiza(rss_atual())
+
+
+def _contagem_tipos(ignorar=()):
+    """
+    Quantidade e tamanho raso (`sys.getsizeof`) dos objetos rastreados pelo coletor, por tipo. Os objetos
+    em `ignorar` (contagens anteriores) não entram na contagem.
+    """
+    gc.collect()
+    quantidades, tamanhos = Counter(), Counter()
+    ids_ignorados = {id(objeto) for objeto in ignorar}
+    for objeto in gc.get_objects():
+        if id(objeto) in ids_ignorados:
+            continue
+        tipo = type(objeto)
+        nome = f"{tipo.__module__}.{tipo.__qualname__}" if tipo.__module__ != 'builtins' else tipo.__qualname__
+        quantidades[nome] += 1
+        try:
+            tamanhos[nome] += sys.getsizeof(objeto)
+        except TypeError:
+            pass
+    return quantidades, tamanhos
+
+
+class MedicaoMemoria(MedicaoEtapas):
+    """
+    Medição das etapas com uso de memória: para cada etapa, o pico e a memória retida ao final segundo o
+    tracemalloc (alocações Python, incluindo os buffers de numpy/pandas), o RSS antes, no pico e depois
+    (amostrado em uma thread) e, com `por_tipo=True`, os tipos de objeto que mais cresceram na etapa.
+
+    O tracemalloc deixa a execução várias vezes mais lenta; os tempos de uma execução com memória não
+    devem ser comparados aos de uma execução sem.
+    """
+    def __init__(self, por_tipo=False):
+        super().__init__()
+        self.por_tipo = por_tipo
+
+    def __repr__(self):
+        return f"MedicaoMemoria(etapas={len(self.etapas)}, por_tipo={self.por_tipo})"
+
+    def mede(self, nome, funcao, itens=None):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tipos_antes = _contagem_tipos() if self.por_tipo else None
+        gc.collect()
+        tracemalloc.reset_peak()
+        tracemalloc_antes = tracemalloc.get_traced_memory()[0]
+        rss_antes = rss_atual()
+
+        with AmostradorRSS() as amostrador:
+            resultado = super().mede(nome, funcao, itens)
+
+        tracemalloc_depois, tracemalloc_pico = tracemalloc.get_traced_memory()
+        etapa = self.etapas[-1]
+        etapa.update({
+            'memoria_pico_mb': round((tracemalloc_pico - tracemalloc_antes) / MB, 2),
+            'memoria_retida_mb': round((tracemalloc_depois - tracemalloc_antes) / MB, 2),
+            'rss_antes_mb': round(rss_antes / MB, 1) if rss_antes is not None else None,
+            'rss_pico_mb': round(amostrador.pico / MB, 1) if amostrador.pico is not None else None,
+            'rss_depois_mb': round(rss_atual() / MB, 1) if rss_antes is not None else None,
+        })
+        if tipos_antes:
+            quantidades_antes, tamanhos_antes = tipos_antes
+            quantidades, tamanhos = _contagem_tipos(ignorar=tipos_antes)
+            crescimento = tamanhos.copy()
+            crescimento.subtract(tamanhos_antes)
+            etapa['tipos_retidos'] = [
+                {'tipo': tipo, 'objetos': quantidades[tipo] - quantidades_antes[tipo], 'mb': round(tamanho / MB, 2)}
+                for tipo, tamanho in crescimento.most_common(TIPOS_POR_ETAPA) if tamanho > 0
+            ]
+        print(f"  {'':<28} memória: pico {etapa['memoria_pico_mb']:.1f} MB, retida {etapa['memoria_retida_mb']:.1f} MB"
+              + (f", RSS pico {etapa['rss_pico_mb']:.0f} MB" if etapa['rss_pico_mb'] is not None else ""), flush=True)
+        return resultado
+
+
+def carrega_orcamento(caminho):
+    """
+    Lê o orçamento de memória de um JSON no formato
+    `{"rss_pico_mb": 1500, "etapas": {"aplicacao_procedimentos": {"memoria_pico_mb": 300, "memoria_retida_mb": 150}}}`.
+    Nas etapas, qualquer medida numérica registrada (ex: "rss_pico_mb") pode ter limite.
+    """
+    with open(caminho, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def verifica_orcamento(resultado, orcamento):
+    """Retorna a lista de violações do orçamento (mensagens) para o resultado de uma execução do benchmark."""
+    violacoes = []
+    medidas = {etapa['etapa']: etapa for etapa in resultado['etapas']}
+    for nome, limites in orcamento.get('etapas', {}).items():
+        etapa = medidas.get(nome)
+        if etapa is None:
+            violacoes.append(f"Etapa '{nome}' do orçamento não foi executada.")
+            continue
+        for medida, limite in limites.items():
+            valor = etapa.get(medida)
+            if valor is None:
+                violacoes.append(f"Etapa '{nome}': medida '{medida}' não registrada (execute com --memoria).")
+            elif valor > limite:
+                violacoes.append(f"Etapa '{nome}': {medida} = {valor} MB excede o limite de {limite} MB.")
+    limite_rss = orcamento.get('rss_pico_mb')
+    rss_pico = resultado.get('memoria', {}).get('rss_pico_processo_mb')
+    if limite_rss is not None and rss_pico is not None and rss_pico > limite_rss:
+        violacoes.append(f"Pico de RSS do processo = {rss_pico} MB excede o limite de {limite_rss} MB.")
+    return violacoes
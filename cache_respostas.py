@@ -0,0 +1,139 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+
+class RespostaCache:
+    """Resposta recuperada do cache em disco, com a mesma interface usada das respostas do Gemini (atributo `text`)."""
+    def __init__(self, text, metadados=None):
+        self.text = text
+        self.metadados = metadados or {}
+        self.do_cache = True
+
+    def __repr__(self):
+        return f"RespostaCache(tamanho_texto={len(self.text or '')})"
+
+
+def hash_conteudo(conteudo):
+    """Retorna o hash SHA-256 (hexadecimal) de um conteúdo em bytes ou texto."""
+    if isinstance(conteudo, str):
+        conteudo = conteudo.encode('utf-8')
+    return hashlib.sha256(conteudo).hexdigest()
+
+
+def chave_requisicao(modelo, temperature, response_format_choice, prompt_text, hashes_arquivos=(), esquema=None):
+    """
+    Gera a chave de cache de uma chamada ao modelo.
+
+    A chave considera tudo que influencia a resposta: modelo, temperatura, formato da resposta,
+    prompt renderizado, o hash do conteúdo de cada arquivo de contexto (na ordem em que são enviados)
+    e o esquema JSON imposto à resposta, se houver.
+    """
+    dados = {
+        'modelo': modelo,
+        'temperature': float(temperature),
+        'formato': response_format_choice,
+        'prompt': hash_conteudo(prompt_text),
+        'arquivos': list(hashes_arquivos),
+    }
+    if esquema:
+        # Só entra na chave quando usado, preservando as chaves das respostas já em cache
+        dados['esquema'] = hash_conteudo(json.dumps(esquema, sort_keys=True))
+    return hash_conteudo(json.dumps(dados, sort_keys=True))
+
+
+class CacheRespostas:
+    """
+    Cache em disco das respostas do modelo, indexado por `chave_requisicao`.
+
+    Cada resposta é gravada em um arquivo JSON próprio. Quando o tamanho total ultrapassa
+    `tamanho_maximo_mb`, as entradas usadas há mais tempo (pela data de modificação, atualizada
+    a cada acerto) são removidas.
+    """
+    def __init__(self, diretorio=os.path.join('tmp', 'cache_gemini'), tamanho_maximo_mb=512):
+        self.diretorio = diretorio
+        self.tamanho_maximo = int(tamanho_maximo_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        os.makedirs(self.diretorio, exist_ok=True)
+        self._tamanho_atual = self._calcula_tamanho()
+
+    def __repr__(self):
+        return f"CacheRespostas(diretorio='{self.diretorio}', tamanho_atual={self._tamanho_atual}, tamanho_maximo={self.tamanho_maximo})"
+
+    def _caminho(self, chave):
+        return os.path.join(self.diretorio, chave[:2], f"{chave}.json")
+
+    def _entradas(self):
+        """Lista (caminho, tamanho, data de modificação) de todas as entradas do cache."""
+        entradas = []
+        for root, _, files in os.walk(self.diretorio):
+            for filename in files:
+                if filename.endswith('.json'):
+                    caminho = os.path.join(root, filename)
+                    try:
+                        stat = os.stat(caminho)
+                    except OSError:
+                        continue
+                    entradas.append((caminho, stat.st_size, stat.st_mtime))
+        return entradas
+
+    def _calcula_tamanho(self):
+        return sum(tamanho for _, tamanho, _ in self._entradas())
+
+    def get(self, chave):
+        """Retorna a resposta armazenada para a chave, ou None se não houver."""
+        caminho = self._caminho(chave)
+        try:
+            with open(caminho, 'r', encoding='utf-8') as f:
+                dados = json.load(f)
+            os.utime(caminho)  # Marca a entrada como usada recentemente
+        except (OSError, json.JSONDecodeError):
+            return None
+        return RespostaCache(dados.get('text'), dados.get('metadados'))
+
+    def set(self, chave, texto, metadados=None):
+        """
+        Armazena o texto da resposta e aplica a política de remoção por tamanho. O texto vazio também é
+        armazenado (ex: decisão de não extrair um arquivo); respostas vazias do modelo já chegam aqui como erro.
+        """
+        caminho = self._caminho(chave)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        conteudo = json.dumps({'text': texto, 'metadados': metadados or {}, 'criado_em': time.time()}, ensure_ascii=False)
+
+        with self._lock:
+            tamanho_anterior = os.path.getsize(caminho) if os.path.exists(caminho) else 0
+            # Grava em arquivo temporário e renomeia, para nunca deixar uma entrada pela metade
+            caminho_tmp = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(caminho_tmp, 'w', encoding='utf-8') as f:
+                f.write(conteudo)
+            os.replace(caminho_tmp, caminho)
+            self._tamanho_atual += os.path.getsize(caminho) - tamanho_anterior
+
+            if self._tamanho_atual > self.tamanho_maximo:
+                self._remove_antigos()
+
+    def _remove_antigos(self):
+        """Remove as entradas menos usadas até o cache voltar ao tamanho máximo."""
+        entradas = sorted(self._entradas(), key=lambda e: e[2])
+        tamanho = sum(e[1] for e in entradas)
+        for caminho, tamanho_entrada, _ in entradas:
+            if tamanho <= self.tamanho_maximo:
+                break
+            try:
+                os.remove(caminho)
+                tamanho -= tamanho_entrada
+            except OSError:
+                pass
+        self._tamanho_atual = tamanho
+
+    def limpar(self):
+        """Remove todas as entradas do cache."""
+        with self._lock:
+            for caminho, _, _ in self._entradas():
+                try:
+                    os.remove(caminho)
+                except OSError:
+                    pass
+            self._tamanho_atual = 0
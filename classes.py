@@ -1,12 +1,21 @@
+import io
 import os
 import re
 import copy
+import time
 import pickle
+import zipfile
+import numpy as np
 import pandas as pd
-from docx import Document
-from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
 
-from utils import avalia_expressao
+from expressoes import avalia_expressao
+from perfilamento import mede
+from plano_avaliacao import PlanoAvaliacao, avalia_logica
+
+# Template dos relatórios de procedimentos, relativo ao módulo para funcionar fora da raiz do projeto (ex: linha de comando)
+TEMPLATE_RELATORIO = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'docs', 'template_report.docx')
+# Quantidade de itens das listas 'mais frequentes' do painel de resultados (ver `gerar_indicadores`)
+TOP_INDICADORES = 10
 
 class FonteInformacao:
     contador = 1  # Contador de instâncias para automatizar o identificador
@@ -25,14 +34,21 @@ class FonteInformacao:
     def __repr__(self):
         return f"FonteInformacao(id='{self.id}', descricao='{self.descricao}', filepath='{self.filepath}', chave_jurisdicionado='{self.chave_jurisdicionado}')"
 
-    def read(self):
+    def sem_dados(self):
+        """Cópia rasa da fonte sem o conteúdo lido (`info`), referenciada pelos procedimentos copiados para cada auditado."""
+        copia = copy.copy(self)
+        copia.info = None
+        return copia
+
+    def read(self, perfil=None):
         """Lê o conteúdo da fonte de informação, assumindo que seja uma planilha Excel."""
         try:
-            # Tenta ler uma amostra do arquivo para verificar se é uma planilha
-            pd.read_excel(self.filepath, nrows=1)
-            self.info = pd.read_excel(self.filepath)
-            if self.chave_jurisdicionado:
-                self.info = self.info.set_index(self.chave_jurisdicionado)
+            with mede(perfil, 'fonte', self.id, self.descricao):
+                # Tenta ler uma amostra do arquivo para verificar se é uma planilha
+                pd.read_excel(self.filepath, nrows=1)
+                self.info = pd.read_excel(self.filepath)
+                if self.chave_jurisdicionado:
+                    self.info = self.info.set_index(self.chave_jurisdicionado)
         except Exception as e:
             if isinstance(self.filepath, str):
                 msg = f"Arquivo '{self.filepath}' não pôde ser lido como planilha Excel: {e}"
@@ -51,8 +67,14 @@ class Achado:
     def __repr__(self):
         return  f"Achado(numero='{self.numero}', nome='{self.nome}')"
 
+# Estados da avaliação de uma ação em um auditado (`AcaoVerificacao.estado`); antes da execução, e nas ações
+# exclusivas de outros auditados, o estado é None
+ESTADO_AVALIADA = 'avaliada'
+ESTADO_NAO_AVALIADA = 'não avaliada'  # Dispensada pelo plano de avaliação: seu resultado não alteraria o do procedimento
+
 class AcaoVerificacao:
     contador = 1  # Contador de instâncias para automatizar o identificador
+    estado = None  # Padrão da classe, para objetos gravados (.pkl) antes da existência do atributo
 
     def __init__(self, fonte_informacao, informacao_requerida, descricao_evidencia, situacao_inconforme,
                  tipo_encaminhamento, encaminhamento, pre_encaminhamento, criterio, descricao_situacao_inconforme,
@@ -84,6 +106,7 @@ class AcaoVerificacao:
         self.encaminhamento = encaminhamento
 
         self.resultado = None    # Inicialmente falso, até ser verificado
+        self.estado = None
 
 
     def __repr__(self):
@@ -96,17 +119,30 @@ class AcaoVerificacao:
                 f"descricao_auditado_inexistente='{self.descricao_auditado_inexistente}', situacao_encontrada='{self.situacao_encontrada}')\n"
                 f"resultado='{self.resultado}'")
 
-    def executar(self, auditado, debug=False):
+    def executar(self, auditado, perfil=None, resultados_acoes=None):
+        # Com a tabela de resultados da execução, a ação é calculada uma única vez por auditado (ver `ResultadosAcoes`)
+        if resultados_acoes is not None:
+            resultados_acoes.aplica(self, auditado, perfil)
+            return self
+
         # Verifica se a ação é exclusiva para um determinado grupo de auditados.
         # Se for, e o auditado atual não estiver nesse grupo, a ação não é executada.
         # Isso permite que certas verificações sejam feitas apenas em alguns órgãos.
         if not pd.isna(self.acao_exclusiva_auditados) and (auditado not in self.acao_exclusiva_auditados):
             return self
 
-        if debug:
-            print(f'\tExecutando ação {self.id}')
-            print(f'\tBuscar em "{self.fonte_informacao.descricao}" no campo "{self.informacao_requerida}" se ocorre "{self.situacao_inconforme}".')
+        with mede(perfil, 'acao', self.id, f"{self.fonte_informacao.descricao}: {self.informacao_requerida}"):
+            self._verificar(auditado, perfil)
+        self.estado = ESTADO_AVALIADA
+
+        if perfil:
+            perfil.evento('acao', id=self.id, auditado=auditado, fonte=self.fonte_informacao.descricao,
+                          informacao_requerida=self.informacao_requerida, situacao_inconforme=self.situacao_inconforme,
+                          situacao_encontrada=self.situacao_encontrada, resultado=self.resultado)
+
+        return self
 
+    def _verificar(self, auditado, perfil=None):
         # Verifica se a busca será feita em mais de um campo específico na fonte de informação
         for info_requerida in self.informacao_requerida.split('|'):
             if info_requerida not in self.fonte_informacao.info.columns:
@@ -125,7 +161,7 @@ class AcaoVerificacao:
                 if self.situacao_encontrada_nan_e_achado and pd.isna(self.situacao_encontrada):
                     resultado_acoes.append(True)
                 else:
-                    resultado_acoes.append(avalia_expressao(self.situacao_inconforme, self.situacao_encontrada, debug=debug))
+                    resultado_acoes.append(avalia_expressao(self.situacao_inconforme, self.situacao_encontrada, perfil=perfil))
                     self.descricao_evidencia = self.descricao_evidencia.replace('@', str(self.situacao_encontrada))
 
             self.resultado = all(resultado_acoes)
@@ -134,15 +170,20 @@ class AcaoVerificacao:
             self.resultado = True if self.auditado_inexistente_e_achado else False
             self.descricao_evidencia = self.descricao_auditado_inexistente
 
-        if debug:
-            print(f'\tSituação Encontrada: {self.situacao_encontrada}')
-            print(f'\tResultado da verificação: {self.resultado}')
-            print(f'')
+    def descricao_resultado(self):
+        """Resultado da ação para os relatórios: 'Sim', 'Não' ou, se dispensada pelo plano de avaliação, 'Não avaliada'."""
+        if self.estado == ESTADO_NAO_AVALIADA:
+            return "Não avaliada (não alteraria o resultado do procedimento)"
+        return 'Sim' if self.resultado else 'Não'
 
-        return self
+    def descricao_situacao_encontrada(self):
+        if self.estado == ESTADO_NAO_AVALIADA:
+            return "Não avaliada"
+        return self.situacao_encontrada or 'Não encontrada'
 
 class ProcedimentoAuditoria:
     contador = 1  # Contador de instâncias para automatizar o identificador
+    plano = None  # Padrão da classe, para objetos gravados (.pkl) antes da existência do atributo
 
     def __init__(self, descricao, logica_achado, numero_achado, nome_achado, id=None):
         if id is None:
@@ -161,6 +202,8 @@ class ProcedimentoAuditoria:
         self.acoes_verificacao = []
         self.achado = None
         self.achado_ocorreu = None
+        # Plano de avaliação em curto-circuito da lógica do achado (ver `planeja`)
+        self.plano = None
 
     def __repr__(self):
         return  f"ProcedimentoAuditoria(id='{self.id}', \n" + \
@@ -175,24 +218,44 @@ class ProcedimentoAuditoria:
     def adicionar_acao(self, acao):
         """Adiciona uma ação de verificação ao procedimento."""
         self.acoes_verificacao.append(acao)
+        self.plano = None
+
+    def planeja(self):
+        """
+        Cria o plano de avaliação da lógica do achado (`plano_avaliacao.PlanoAvaliacao`), com o qual só são
+        executadas as ações necessárias para decidir se o achado ocorreu. Sem plano (lógica que não pôde ser
+        planejada), todas as ações são executadas e a lógica é avaliada com `plano_avaliacao.avalia_logica`.
+        """
+        self.plano = PlanoAvaliacao.cria(self.logica_achado, self.acoes_verificacao)
+        return self.plano
 
-    def executar(self, auditado, debug=False):
-        """Executa todas as ações, avalia a lógica do achado e retorna o achado, caso encontrado."""
+    def executar(self, auditado, perfil=None, resultados_acoes=None):
+        """
+        Executa as ações, avalia a lógica do achado e retorna o achado, caso encontrado. Com `resultados_acoes`
+        (`ResultadosAcoes`), os resultados das ações são lidos da tabela compartilhada pelos procedimentos.
+        """
         # Não é mais necessário fazer deepcopy aqui. A cópia será feita no nível do Auditado.
+        with mede(perfil, 'procedimento', self.id, f"{self.numero_achado}. {self.nome_achado}"):
+            self._executar(auditado, perfil, resultados_acoes)
+        return self
 
-        [acao.executar(auditado, debug) for acao in self.acoes_verificacao]
-        resultados = {acao.id: acao.resultado for acao in self.acoes_verificacao}
+    def _executar(self, auditado, perfil=None, resultados_acoes=None):
+        if self.plano is None:
+            [acao.executar(auditado, perfil, resultados_acoes) for acao in self.acoes_verificacao]
+            resultados = {acao.id: acao.resultado for acao in self.acoes_verificacao}
 
-        # Avalia a lógica do achado com os resultados das ações
-        achado_ocorreu = eval(self.logica_achado, {}, resultados)
+            # Avalia a lógica do achado com os resultados das ações (mesma semântica do plano)
+            achado_ocorreu = avalia_logica(self.logica_achado, resultados)
+        else:
+            achado_ocorreu = self._avaliar_plano(auditado, perfil, resultados_acoes)
+            resultados = {acao.id: acao.resultado for acao in self.acoes_verificacao}
 
         self.executado = True
 
-        if debug:
-            # [print(acao) for acao in acoes_verificadas.values()]
-            [print(f'{av}: {resultado}') for av, resultado in resultados.items()]
-            print(f"Procedimento resultou em achado: {'Sim' if achado_ocorreu else 'Não'}")
-            print()
+        if perfil:
+            perfil.evento('procedimento', id=self.id, auditado=auditado, logica_achado=self.logica_achado,
+                          resultados=resultados, achado=bool(achado_ocorreu),
+                          nao_avaliadas=[acao.id for acao in self.acoes_verificacao if acao.estado == ESTADO_NAO_AVALIADA])
 
         if achado_ocorreu:
             achado = Achado(numero=self.numero_achado, nome=self.nome_achado)
@@ -243,7 +306,63 @@ class ProcedimentoAuditoria:
             if hasattr(acao.fonte_informacao, 'info') and acao.fonte_informacao.info is not None:
                 acao.fonte_informacao.info = None
 
-        return self
+    def _avaliar_plano(self, auditado, perfil=None, resultados_acoes=None):
+        """
+        Avalia a lógica do achado pelo plano, executando só as ações necessárias. Se o achado ocorreu, as
+        demais ações são executadas também, pois todas as verdadeiras compõem as evidências, situações e
+        encaminhamentos do achado; se não ocorreu, as dispensadas ficam no estado 'não avaliada'.
+        """
+        acoes = {acao.id: acao for acao in self.acoes_verificacao}
+        executadas = set()
+
+        def avalia_acao(id_acao):
+            acao = acoes[id_acao]
+            if id_acao not in executadas:
+                executadas.add(id_acao)
+                inicio = time.perf_counter()
+                acao.executar(auditado, perfil, resultados_acoes)
+                if acao.estado == ESTADO_AVALIADA:
+                    self.plano.registra(id_acao, acao.resultado, time.perf_counter() - inicio)
+            return acao.resultado
+
+        achado_ocorreu = self.plano.avalia(avalia_acao)
+        for id_acao, acao in acoes.items():
+            if id_acao not in executadas:
+                if achado_ocorreu:
+                    acao.executar(auditado, perfil, resultados_acoes)
+                else:
+                    acao.estado = ESTADO_NAO_AVALIADA
+        return achado_ocorreu
+
+class ResultadosAcoes:
+    """
+    Tabela dos resultados das ações de verificação de uma execução, por (id da ação, auditado). Uma ação
+    citada por vários procedimentos é calculada uma única vez por auditado, a partir da ação original (que
+    tem a fonte com os dados), e o resultado é copiado para as ações dos procedimentos copiados.
+    """
+    def __init__(self, procedimentos):
+        self.acoes = {acao.id: acao for procedimento in procedimentos for acao in procedimento.acoes_verificacao}
+        self._resultados = {}
+        self.calculadas = 0
+        self.reaproveitadas = 0
+
+    def __repr__(self):
+        return f"ResultadosAcoes(acoes={len(self.acoes)}, calculadas={self.calculadas}, reaproveitadas={self.reaproveitadas})"
+
+    def aplica(self, acao, auditado, perfil=None):
+        """Preenche `acao` com o resultado da ação para o auditado, calculando-o se ainda não estiver na tabela."""
+        chave = (acao.id, auditado)
+        resultado = self._resultados.get(chave)
+        if resultado is None:
+            # Calcula em uma cópia rasa da original, que não é alterada
+            calculo = copy.copy(self.acoes.get(acao.id, acao))
+            calculo.executar(auditado, perfil)
+            resultado = (calculo.resultado, calculo.situacao_encontrada, calculo.descricao_evidencia, calculo.estado)
+            self._resultados[chave] = resultado
+            self.calculadas += 1
+        else:
+            self.reaproveitadas += 1
+        acao.resultado, acao.situacao_encontrada, acao.descricao_evidencia, acao.estado = resultado
 
 class Auditado:
     contador = 1  # Contador de instâncias para automatizar o identificador
@@ -268,28 +387,38 @@ class Auditado:
                 f"foi_auditado='{self.foi_auditado}'\n" + \
                 f"tem_achados='{self.tem_achados}'\n"
 
-    def __aplicar_procedimento(self, procedimento, debug=False):
-        if debug:
-            print(f'Aplicando procedimento {procedimento.id} em {self.sigla}')
-            print(f'Em busca do achado {procedimento.nome_achado}')
-            print(f'Lógica {procedimento.logica_achado}')
-            print()
-
+    def __aplicar_procedimento(self, procedimento, perfil=None, resultados_acoes=None, fontes_sem_dados=None):
         if procedimento.id in [p.id for p in self.procedimentos_executados]:
             # print(f'Procedimento {procedimento.id} já foi executado')
             return
 
         # Cria uma cópia do procedimento AQUI, uma vez por auditado.
-        p = copy.deepcopy(procedimento)
-        p.executar(self.sigla, debug)
+        with mede(perfil, 'copia', procedimento.id, f"{procedimento.numero_achado}. {procedimento.nome_achado}"):
+            # O plano de avaliação não é copiado: as cópias compartilham as observações do original.
+            # As fontes também não: a cópia referencia a fonte sem os dados, lidos só pelo cálculo das ações.
+            memo = {id(procedimento.plano): procedimento.plano}
+            memo.update(fontes_sem_dados or {})
+            p = copy.deepcopy(procedimento, memo)
+        p.executar(self.sigla, perfil, resultados_acoes)
         self.procedimentos_executados.append(p)
 
         if p.achado:
             self.tem_achados = True
 
-    def aplicar_procedimentos(self, procedimentos, debug=False):
+    def aplicar_procedimentos(self, procedimentos, perfil=None, resultados_acoes=None):
+        """
+        Aplica os procedimentos no auditado. Cada ação é calculada uma única vez, mesmo que citada por vários
+        procedimentos; os resultados ficam em `resultados_acoes` (uma `ResultadosAcoes` da execução, criada
+        aqui se não for informada).
+        """
+        procedimentos = list(procedimentos)
+        if resultados_acoes is None:
+            resultados_acoes = ResultadosAcoes(procedimentos)
+        fontes_sem_dados = {id(acao.fonte_informacao): acao.fonte_informacao.sem_dados()
+                            for procedimento in procedimentos for acao in procedimento.acoes_verificacao}
+
         for procedimento in procedimentos: # procedimentos é uma lista de objetos originais
-            self.__aplicar_procedimento(procedimento, debug)
+            self.__aplicar_procedimento(procedimento, perfil, resultados_acoes, fontes_sem_dados)
 
         self.foi_auditado = True
 
@@ -419,9 +548,9 @@ class Auditado:
                 conteudo_md += f" - **Ação {a.id}**\n"
                 conteudo_md += f"  - Fonte de Informação: {a.fonte_informacao.descricao}\n"
                 conteudo_md += f"  - Campo de Dados Buscado: {a.informacao_requerida}\n"
-                conteudo_md += f"  - Situação Encontrada: {a.situacao_encontrada or 'Não encontrada'}\n"
+                conteudo_md += f"  - Situação Encontrada: {a.descricao_situacao_encontrada()}\n"
                 conteudo_md += f"  - Situação considerada como inconforme: {a.situacao_inconforme or 'Não encontrada'}\n"
-                conteudo_md += f"  - Achado na Verificação: {'Sim' if a.resultado else 'Não'}\n"
+                conteudo_md += f"  - Achado na Verificação: {a.descricao_resultado()}\n"
                 conteudo_md += "\n"
 
         return conteudo_md
@@ -430,8 +559,12 @@ class Auditado:
         """
             Cria um documento .docx em memória com os dados do objeto Auditado, usando um template.
         """
+        # python-docx é carregado só na geração de relatórios (a auditoria em si não precisa dele)
+        from docx import Document
+        from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
+
         # Carregar o documento template
-        doc = Document('docs/template_report.docx')
+        doc = Document(TEMPLATE_RELATORIO)
 
         # Pegar a coleção de estilos do documento
         styles = doc.styles
@@ -496,14 +629,44 @@ class Auditado:
 
                 doc.add_paragraph(f"Fonte de Informação: {a.fonte_informacao.descricao}", style="List Bullet")
                 doc.add_paragraph(f"Campo de Dados Buscado: {a.informacao_requerida}", style="List Bullet")
-                doc.add_paragraph(f"Situação Encontrada: {a.situacao_encontrada or 'Não encontrada'}", style="List Bullet")
+                doc.add_paragraph(f"Situação Encontrada: {a.descricao_situacao_encontrada()}", style="List Bullet")
                 doc.add_paragraph(f"Situação considerada como inconforme: {a.situacao_inconforme or 'Não encontrada'}", style="List Bullet")
-                doc.add_paragraph(f"Achado na Verificação: {'Sim' if a.resultado else 'Não'}", style="List Bullet")
+                doc.add_paragraph(f"Achado na Verificação: {a.descricao_resultado()}", style="List Bullet")
                 doc.add_paragraph(" ")
             #doc.add_paragraph(" ")  # Adiciona uma linha em branco entre procedimentos
 
         return doc
 
+# Marca das células das tabelas consolidadas nas exportações (nas tabelas em memória, as células são booleanas)
+MARCA_TABELA = 'X'
+LINHAS_POR_BLOCO_EXCEL = 1000  # Linhas convertidas para o formato denso por vez na exportação
+
+def _tabela_marcacoes(siglas, colunas, marcacoes):
+    """
+    Monta uma tabela consolidada auditado x coluna com colunas booleanas esparsas (só as células marcadas
+    ocupam memória). `marcacoes` traz, para cada auditado, as posições das colunas marcadas.
+    """
+    linhas_por_coluna = [[] for _ in colunas]
+    for linha, posicoes in enumerate(marcacoes):
+        for posicao in posicoes:
+            linhas_por_coluna[posicao].append(linha)
+
+    dados = {}
+    for coluna, linhas in zip(colunas, linhas_por_coluna):
+        densa = np.zeros(len(siglas), dtype=bool)
+        densa[linhas] = True
+        dados[coluna] = pd.arrays.SparseArray(densa, fill_value=False)
+    return pd.DataFrame(dados, index=pd.Index(siglas, name="Auditado"), columns=colunas)
+
+def _auditados_executados(auditados):
+    executados = []
+    for auditado in auditados.values():
+        if auditado.foi_auditado:
+            executados.append(auditado)
+        else:
+            print(f'{auditado.sigla} ainda não foi auditado')
+    return executados
+
 def gerar_tabela_achados(auditados):
     # Reconstrói o dicionário de procedimentos a partir dos achados em cada auditado
     procedimentos = {}
@@ -513,25 +676,13 @@ def gerar_tabela_achados(auditados):
 
     # Coleta todos os nomes de achados únicos
     nomes_todos_achados = sorted({f"{p.numero_achado}. {p.nome_achado}" for p in procedimentos.values()})
-
-    # Inicializa uma lista para armazenar os dados da tabela
-    dados_tabela = []
+    posicoes = {nome: i for i, nome in enumerate(nomes_todos_achados)}
 
     # verifica quais achados foram encontrados
-    for auditado in auditados.values():
-        if auditado.foi_auditado:
-            achados_auditado = auditado.get_nomes_achados()
-            linha = {achado: ('X' if achado in achados_auditado else '') for achado in nomes_todos_achados}
-            linha["Auditado"] = auditado.sigla  # Adiciona o identificador do auditado
-            dados_tabela.append(linha)
-        else:
-            print(f'{auditado.sigla} ainda não foi auditado')
-
-    # Cria o DataFrame com os dados coletados
-    df_achados = pd.DataFrame(dados_tabela)
-    df_achados = df_achados.set_index("Auditado")
+    executados = _auditados_executados(auditados)
+    marcacoes = [{posicoes[achado] for achado in auditado.get_nomes_achados() if achado in posicoes} for auditado in executados]
 
-    return df_achados
+    return _tabela_marcacoes([auditado.sigla for auditado in executados], nomes_todos_achados, marcacoes)
 
 def gerar_tabela_encaminhamentos(auditados):
     # Reconstrói o dicionário de procedimentos a partir dos achados em cada auditado
@@ -545,26 +696,17 @@ def gerar_tabela_encaminhamentos(auditados):
     todos_encaminhamentos = sorted({(acao.tipo_encaminhamento, acao.encaminhamento) for p in procedimentos.values()
                                     for acao in p.acoes_verificacao if acao.encaminhamento}, key=lambda x: (x[0], x[1]))
 
-    # Inicializa uma lista para armazenar os dados da tabela
-    dados_tabela = []
+    # Um encaminhamento é marcado pelo texto, em todas as colunas (tipos) em que aparece
+    posicoes = {}
+    for i, (_, encaminhamento) in enumerate(todos_encaminhamentos):
+        posicoes.setdefault(encaminhamento, []).append(i)
 
-    # Aplica os procedimentos a cada auditado e verifica quais encaminhamentos foram encontrados
-    for auditado in auditados.values():
-        if auditado.foi_auditado:
-            encaminhamentos_auditado = auditado.get_encaminhamentos()
+    executados = _auditados_executados(auditados)
+    marcacoes = [[i for encaminhamento in auditado.get_encaminhamentos() for i in posicoes.get(encaminhamento, [])]
+                 for auditado in executados]
 
-            linha = {f"[{tipo}] {encaminhamento}": ('X' if encaminhamento in encaminhamentos_auditado else '') for (tipo, encaminhamento) in todos_encaminhamentos}
-
-            linha["Auditado"] = auditado.sigla  # Adiciona o identificador do auditado
-            dados_tabela.append(linha)
-        else:
-            print(f'{auditado.sigla} ainda não foi auditado')
-
-    # Cria o DataFrame com os dados coletados
-    df_encaminhamentos = pd.DataFrame(dados_tabela)
-    df_encaminhamentos = df_encaminhamentos.set_index("Auditado")
-
-    return df_encaminhamentos
+    colunas = [f"[{tipo}] {encaminhamento}" for (tipo, encaminhamento) in todos_encaminhamentos]
+    return _tabela_marcacoes([auditado.sigla for auditado in executados], colunas, marcacoes)
 
 def gerar_tabela_situacoes_inconformes(auditados):
     # Reconstrói o dicionário de procedimentos a partir dos achados em cada auditado
@@ -581,25 +723,240 @@ def gerar_tabela_situacoes_inconformes(auditados):
             if texto not in todas_situacoes_inconformes:
                 todas_situacoes_inconformes.append(texto)
 
-    # todas_situacoes_inconformes = sorted({f"[ACHADO {p.numero_achado}] {acao.descricao_situacao_inconforme}" for p in procedimentos.values()
-    #                                 for acao in p.acoes_verificacao})
-
-    # Inicializa uma lista para armazenar os dados da tabela
-    dados_tabela = []
-
-    for auditado in auditados.values():
-        if auditado.foi_auditado:
-            situacoes_auditado = auditado.get_situacoes_inconformes()
-
-            linha = {f"{situacao}": ('X' if any([s in situacao for s in situacoes_auditado]) else '') for situacao in todas_situacoes_inconformes}
-
-            linha["Auditado"] = auditado.sigla  # Adiciona o identificador do auditado
-            dados_tabela.append(linha)
-        else:
-            print(f'{auditado.sigla} ainda não foi auditado')
-
-    # Cria o DataFrame com os dados coletados
-    df_situacoes = pd.DataFrame(dados_tabela)
-    df_situacoes = df_situacoes.set_index("Auditado")
-
-    return df_situacoes
+    executados = _auditados_executados(auditados)
+    marcacoes = []
+    for auditado in executados:
+        situacoes_auditado = auditado.get_situacoes_inconformes()
+        marcacoes.append([i for i, situacao in enumerate(todas_situacoes_inconformes)
+                          if any(s in situacao for s in situacoes_auditado)])
+
+    return _tabela_marcacoes([auditado.sigla for auditado in executados], todas_situacoes_inconformes, marcacoes)
+
+def pagina_tabela(tabela, inicio, quantidade):
+    """Retorna as linhas [inicio, inicio + quantidade) de uma tabela consolidada no formato de exibição ('X'/'')."""
+    bloco = tabela.iloc[inicio:inicio + quantidade].sparse.to_dense()
+    return pd.DataFrame(np.where(bloco.to_numpy(dtype=bool), MARCA_TABELA, ''), index=bloco.index, columns=bloco.columns)
+
+def grava_tabelas_excel(resultados, destino):
+    """
+    Grava as tabelas consolidadas em Excel (caminho ou arquivo binário), uma aba por tabela. As linhas são
+    escritas em sequência no modo de memória constante do xlsxwriter, convertidas para 'X'/'' em blocos
+    de LINHAS_POR_BLOCO_EXCEL, sem montar a tabela densa inteira.
+    """
+    import xlsxwriter
+
+    abas = (('tabela_achados', 'Achados por Auditado'), ('tabela_encaminhamentos', 'Encaminhamentos por Auditado'),
+            ('tabela_situacoes', 'Situações Inconformes'))
+    workbook = xlsxwriter.Workbook(destino, {'constant_memory': True})
+    try:
+        cabecalho = workbook.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+        for chave, nome_aba in abas:
+            tabela = resultados[chave]
+            worksheet = workbook.add_worksheet(nome_aba)
+            worksheet.write_row(0, 0, [tabela.index.name or ''] + [str(coluna) for coluna in tabela.columns], cabecalho)
+            for inicio in range(0, len(tabela), LINHAS_POR_BLOCO_EXCEL):
+                bloco = tabela.iloc[inicio:inicio + LINHAS_POR_BLOCO_EXCEL].sparse.to_dense().to_numpy(dtype=bool)
+                for deslocamento, (sigla, linha) in enumerate(zip(tabela.index[inicio:inicio + LINHAS_POR_BLOCO_EXCEL], bloco)):
+                    worksheet.write(inicio + deslocamento + 1, 0, sigla, cabecalho)
+                    for coluna in np.flatnonzero(linha):
+                        worksheet.write_string(inicio + deslocamento + 1, coluna + 1, MARCA_TABELA)
+    finally:
+        workbook.close()
+
+def le_planilha(filepath, sheet_name=0, skiprows=2):
+    """
+    Lê uma aba de planilha Excel do mapa ou da base de auditados, removendo espaços nas bordas dos textos.
+    As abas do mapa têm duas linhas de orientação antes do cabeçalho (`skiprows=2`).
+    """
+    return pd.read_excel(filepath, sheet_name=sheet_name, skiprows=skiprows).map(lambda x: x.strip() if isinstance(x, str) else x)
+
+def cria_fontes_informacao(df_fontes, arquivos_fontes, perfil=None):
+    """
+    Cria e lê as fontes de informação da aba 'Fontes de Informação' do mapa. `arquivos_fontes` mapeia o
+    nome de cada arquivo ao arquivo (caminho ou arquivo carregado). Retorna o dicionário id -> fonte das
+    fontes lidas e a lista de mensagens de erro das que não puderam ser lidas. O tempo de leitura de
+    cada fonte é registrado em `perfil`, se informado.
+    """
+    fontes, erros = {}, []
+    for _, row in df_fontes.iterrows():
+        nome_arquivo_fonte = os.path.basename(row['filepath'])
+        fonte = FonteInformacao(
+            descricao=row['descricao'],
+            filepath=arquivos_fontes.get(nome_arquivo_fonte),
+            chave_jurisdicionado=row['chave_jurisdicionado'],
+            id=row['id']
+        )
+        try:
+            fonte.read(perfil)
+            fontes[fonte.id] = fonte
+        except IOError as e:
+            erros.append(f"Erro ao carregar a fonte de informação '{fonte.descricao}': {e}")
+        except AttributeError:
+            erros.append(f"Arquivo da fonte de informação '{fonte.descricao}' ('{nome_arquivo_fonte}') não foi encontrado nos arquivos carregados. Verifique o nome.")
+    return fontes, erros
+
+def cria_acoes_verificacao(df_acoes_verificacao, fontes):
+    """
+    Cria as ações de verificação da aba 'Ações de Verificação' do mapa. Retorna o dicionário id -> ação
+    e a lista de mensagens de erro das ações cuja fonte de informação não foi encontrada.
+    """
+    acoes, erros = {}, []
+    for _, row in df_acoes_verificacao.iterrows():
+        fonte_informacao = fontes.get(row['id_fonte_informacao'])
+        if not fonte_informacao:
+            erros.append(f"Ação de verificação '{row['id']}' refere-se a uma fonte de informação ('{row['id_fonte_informacao']}') que não foi encontrada.")
+            continue
+
+        acao = AcaoVerificacao(
+            fonte_informacao=fonte_informacao, informacao_requerida=row['informacao_requerida'],
+            acao_exclusiva_auditados=row['acao_exclusiva_auditados'], criterio=row['criterio'],
+            descricao_situacao_inconforme=row['descricao_situacao_inconforme'], descricao_evidencia=row['descricao_evidencia'],
+            situacao_inconforme=row['situacao_inconforme'], situacao_encontrada_nan_e_achado=row['situacao_encontrada_nan_e_achado'],
+            tipo_encaminhamento=row['tipo_encaminhamento'], encaminhamento=row['encaminhamento'],
+            pre_encaminhamento=row['pre_encaminhamento'], auditado_inexistente_e_achado=row['auditado_inexistente_e_achado'],
+            descricao_auditado_inexistente=row['descricao_auditado_inexistente'], id=row['id']
+        )
+        acoes[acao.id] = acao
+    return acoes, erros
+
+def cria_procedimentos(df_procedimentos, acoes):
+    """Cria os procedimentos da aba 'Procedimentos de Auditoria' do mapa, com as ações citadas na lógica do achado."""
+    procedimentos = {}
+    for _, row in df_procedimentos.iterrows():
+        procedimento = ProcedimentoAuditoria(
+            descricao=row['descricao'], logica_achado=row['logica_achado'],
+            numero_achado=row['numero_achado'], nome_achado=row['nome_achado'], id=row['id']
+        )
+        acao_ids = [acao_id for acao_id in re.split(r'[\&\|\~\(\)\s]+', procedimento.logica_achado.replace("(", "").replace(")", "")) if acao_id]
+        for acao_id in acao_ids:
+            acao = acoes.get(acao_id.strip())
+            if acao:
+                procedimento.adicionar_acao(acao)
+        procedimento.planeja()
+        procedimentos[procedimento.id] = procedimento
+    return procedimentos
+
+def cria_auditados(df_jurisdicionados):
+    """Cria os auditados da base de auditados (colunas 'orgao' e 'sigla'), indexados pela sigla."""
+    auditados = {}
+    for _, row in df_jurisdicionados.iterrows():
+        auditado = Auditado(nome=row['orgao'], sigla=row['sigla'])
+        auditados[auditado.sigla] = auditado
+    return auditados
+
+
+def executar_auditoria(auditados, procedimentos, progresso=None, perfil=None):
+    """
+    Aplica os procedimentos em todos os auditados e gera as tabelas de resultado.
+
+    Pode ser executada diretamente ou como job em segundo plano (ver `jobs.GerenciadorJobs`), caso em
+    que `progresso` recebe o andamento da execução. Com um `perfil` (`perfilamento.PerfilDesempenho`),
+    mede procedimentos, ações e critérios e o retorna na chave "desempenho" do resultado (no job, o
+    perfil passado é uma cópia, por isso é devolvido no resultado).
+    """
+    procedimentos = list(procedimentos)
+    total = len(auditados)
+    passo = max(1, total // 100)  # Limita as atualizações de progresso a ~100 por execução
+
+    for i, auditado in enumerate(auditados.values(), start=1):
+        auditado.aplicar_procedimentos(procedimentos, perfil=perfil)
+        if progresso and (i % passo == 0 or i == total):
+            progresso.atualiza(0.9 * i / total, f"Procedimentos aplicados em {i}/{total} auditados.")
+
+    if progresso:
+        progresso.atualiza(0.9, "Gerando tabelas de resultado...")
+
+    resultados = gerar_resultados(auditados)
+    if perfil is not None:
+        resultados["desempenho"] = perfil
+    return resultados
+
+def _marcados_por_coluna(tabela):
+    """Quantidade de células marcadas em cada coluna de uma tabela consolidada, lida direto das colunas esparsas."""
+    return pd.Series([tabela[coluna].array.npoints for coluna in tabela.columns], index=tabela.columns, dtype='int64')
+
+def _marcados_por_linha(tabela):
+    """Quantidade de células marcadas em cada linha (auditado) de uma tabela consolidada."""
+    linhas = [tabela[coluna].array.sp_index.indices for coluna in tabela.columns]
+    contagem = np.bincount(np.concatenate(linhas), minlength=len(tabela)) if linhas else np.zeros(len(tabela), dtype='int64')
+    return pd.Series(contagem, index=tabela.index)
+
+def gerar_indicadores(tabela_achados, tabela_encaminhamentos, tabela_situacoes, top=TOP_INDICADORES):
+    """
+    Calcula os agregados do painel da página 'Visualizar Resultado' a partir das tabelas consolidadas,
+    com operações vetorizadas sobre as colunas esparsas das matrizes auditado x achado/encaminhamento/situação. As contagens
+    são de auditados (ex: quantos auditados receberam cada encaminhamento).
+    """
+    encaminhamentos = _marcados_por_coluna(tabela_encaminhamentos)
+    situacoes = _marcados_por_coluna(tabela_situacoes)
+
+    # As colunas de encaminhamentos são '[tipo] encaminhamento'
+    tipos = encaminhamentos.index.str.extract(r'^\[(.*?)\]', expand=False)
+    por_tipo = encaminhamentos.groupby(tipos).sum()
+
+    ranking = pd.DataFrame({
+        'Qtd. Achados Distintos': _marcados_por_linha(tabela_achados),
+        'Qtd. Situações Inconformes': _marcados_por_linha(tabela_situacoes),
+    }).sort_values(by=['Qtd. Achados Distintos', 'Qtd. Situações Inconformes'], ascending=False)
+
+    return {
+        "auditados_por_achado": _marcados_por_coluna(tabela_achados).sort_values(ascending=True),
+        "auditados_por_tipo_encaminhamento": por_tipo[por_tipo > 0],
+        "encaminhamentos_mais_propostos": encaminhamentos[encaminhamentos > 0].nlargest(top),
+        "situacoes_mais_recorrentes": situacoes[situacoes > 0].nlargest(top),
+        "ranking_auditados": ranking,
+    }
+
+def gerar_resultados(auditados):
+    """
+    Monta o resultado de uma auditoria (auditados, tabelas consolidadas e indicadores do painel) a partir
+    dos auditados já auditados.
+    """
+    resultados = {
+        "auditados": auditados,
+        "tabela_encaminhamentos": gerar_tabela_encaminhamentos(auditados),
+        "tabela_achados": gerar_tabela_achados(auditados),
+        "tabela_situacoes": gerar_tabela_situacoes_inconformes(auditados),
+    }
+    resultados["indicadores"] = gerar_indicadores(resultados["tabela_achados"], resultados["tabela_encaminhamentos"],
+                                                  resultados["tabela_situacoes"])
+    return resultados
+
+def gerar_arquivos_download(results, progresso=None):
+    """
+    Gera os arquivos de download de uma auditoria: objeto auditados (.pkl), tabelas consolidadas (.xlsx)
+    e relatórios de procedimentos por auditado (.docx individuais e .zip com todos).
+    """
+    download_files = {}
+
+    # 1. Arquivo Pickle
+    pkl_buffer = io.BytesIO()
+    pickle.dump(results["auditados"], pkl_buffer)
+    download_files['pkl'] = pkl_buffer.getvalue()
+
+    # 2. Arquivo Excel
+    excel_buffer = io.BytesIO()
+    grava_tabelas_excel(results, excel_buffer)
+    download_files['excel'] = excel_buffer.getvalue()
+
+    if progresso:
+        progresso.atualiza(0.1, "Gerando relatórios de procedimentos...")
+
+    # 3. Arquivos DOCX individuais e ZIP
+    zip_buffer = io.BytesIO()
+    total = len(results["auditados"])
+    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_f:
+        download_files['docx'] = {}
+        for i, (sigla, auditado) in enumerate(results["auditados"].items(), start=1):
+            if auditado.foi_auditado:
+                doc = auditado.documenta_procedimentos()
+                bio = io.BytesIO()
+                doc.save(bio)
+                docx_bytes = bio.getvalue()
+                download_files['docx'][sigla] = docx_bytes
+                zip_f.writestr(f"{auditado.sigla} - Relatorio.docx", docx_bytes)
+            if progresso:
+                progresso.atualiza(0.1 + 0.9 * i / total, f"Relatório de {sigla} gerado ({i}/{total}).")
+    download_files['zip'] = zip_buffer.getvalue()
+
+    return download_files
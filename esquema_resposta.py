@@ -0,0 +1,136 @@
+import json
+
+import pandas as pd
+from jsonschema import Draft202012Validator, SchemaError
+from jsonschema.exceptions import best_match
+
+
+# Coluna usada quando o esquema não descreve objetos (ex: a resposta é uma lista de strings)
+COLUNA_VALOR = 'resposta'
+
+# Números do exemplo viram 'number': o modelo pode responder 1000 onde o exemplo tinha 1000.0, e vice-versa
+_TIPOS = ((bool, 'boolean'), (int, 'number'), (float, 'number'), (str, 'string'))
+
+
+def carrega_esquema(texto):
+    """
+    Lê um esquema JSON (JSON Schema) informado pelo usuário. Lança ValueError com a descrição
+    do problema se o texto não for JSON ou não for um esquema válido.
+    """
+    try:
+        esquema = json.loads(texto)
+        Draft202012Validator.check_schema(esquema)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"o esquema não é um JSON válido ({e})")
+    except SchemaError as e:
+        raise ValueError(f"o esquema é inválido ({e.message})")
+    if not isinstance(esquema, dict):
+        raise ValueError("o esquema deve ser um objeto JSON")
+    return esquema
+
+
+def esquema_de_exemplo(exemplo):
+    """
+    Deriva um esquema JSON de um exemplo de resposta (ex: uma linha da planilha esperada, como objeto).
+
+    Todos os campos do exemplo passam a ser obrigatórios; campos com valor null aceitam texto ou null.
+    Em listas de objetos, vale a união dos campos, só os presentes em todos os itens são obrigatórios
+    e os que forem null em algum item aceitam null.
+    """
+    if exemplo is None:
+        return {'type': ['string', 'null']}
+    for tipo_python, tipo_json in _TIPOS:
+        if isinstance(exemplo, tipo_python):
+            return {'type': tipo_json}
+    if isinstance(exemplo, dict):
+        return {
+            'type': 'object',
+            'properties': {campo: esquema_de_exemplo(valor) for campo, valor in exemplo.items()},
+            'required': list(exemplo),
+        }
+    if isinstance(exemplo, list):
+        if not exemplo:
+            return {'type': 'array', 'items': {'type': 'string'}}
+        if all(isinstance(item, dict) for item in exemplo):
+            uniao = {}
+            for item in exemplo:
+                for campo, valor in item.items():
+                    if uniao.get(campo) is None:
+                        uniao[campo] = valor
+            itens = esquema_de_exemplo(uniao)
+            itens['required'] = [campo for campo in uniao if all(campo in item for item in exemplo)]
+            for campo, subesquema in itens['properties'].items():
+                if isinstance(subesquema['type'], str) and any(campo in item and item[campo] is None for item in exemplo):
+                    subesquema['type'] = [subesquema['type'], 'null']
+            return {'type': 'array', 'items': itens}
+        return {'type': 'array', 'items': esquema_de_exemplo(exemplo[0])}
+    raise ValueError(f"tipo não suportado no exemplo: {type(exemplo).__name__}")
+
+
+def esquema_lote(esquema):
+    """Esquema da resposta de uma requisição agrupada: um array com a resposta de cada auditado no `esquema` informado."""
+    return {
+        'type': 'array',
+        'items': {
+            'type': 'object',
+            'properties': {'auditado_sigla': {'type': 'string'}, 'resposta': esquema},
+            'required': ['auditado_sigla', 'resposta'],
+        },
+    }
+
+
+def _tipo(esquema):
+    tipo = esquema.get('type')
+    if isinstance(tipo, list):
+        tipo = next((t for t in tipo if t != 'null'), None)
+    return tipo
+
+
+def _colunas_objeto(esquema, prefixo=''):
+    colunas = []
+    for campo, subesquema in esquema.get('properties', {}).items():
+        if _tipo(subesquema) == 'object' and subesquema.get('properties'):
+            colunas.extend(_colunas_objeto(subesquema, f"{prefixo}{campo}."))
+        else:
+            colunas.append(f"{prefixo}{campo}")
+    return colunas
+
+
+def colunas_esquema(esquema):
+    """
+    Colunas da tabela de resultados definidas pelo esquema, na ordem das propriedades e com objetos
+    aninhados achatados como em `pd.json_normalize` (ex: 'endereco.cidade'). Para uma resposta em
+    array, as colunas são as dos itens.
+    """
+    if _tipo(esquema) == 'array':
+        esquema = esquema.get('items', {})
+    return _colunas_objeto(esquema) or [COLUNA_VALOR]
+
+
+def valida_json(texto, esquema=None):
+    """
+    Interpreta o texto da resposta como JSON e, se houver `esquema`, verifica se ele o segue.
+    Retorna (dados, None) ou (None, mensagem de erro).
+    """
+    try:
+        dados = json.loads(texto)
+    except (json.JSONDecodeError, TypeError) as e:
+        return None, f"A resposta do modelo não é um JSON válido (Erro: {e})"
+    if esquema:
+        erro = best_match(Draft202012Validator(esquema).iter_errors(dados))
+        if erro is not None:
+            caminho = '/'.join(str(parte) for parte in erro.absolute_path) or 'raiz'
+            return None, f"A resposta do modelo não segue o esquema ({caminho}: {erro.message})"
+    return dados, None
+
+
+def tabela_resposta(dados, esquema):
+    """
+    Converte uma resposta válida para o esquema em DataFrame com exatamente as colunas de `colunas_esquema`,
+    de modo que os resultados de todos os auditados tenham a mesma forma. Arrays viram uma linha por item.
+    """
+    colunas = colunas_esquema(esquema)
+    if colunas == [COLUNA_VALOR]:
+        return pd.DataFrame({COLUNA_VALOR: dados if isinstance(dados, list) else [dados]})
+    registros = dados if isinstance(dados, list) else [dados]
+    return pd.json_normalize(registros).reindex(columns=colunas)
@@ -0,0 +1,838 @@
+import os
+import re
+import copy
+import json
+import time
+import tempfile
+import mimetypes
+from datetime import datetime
+
+import pandas as pd
+from jinja2 import Environment, BaseLoader, StrictUndefined
+
+from expressoes import avalia_expressao
+from cache_respostas import CacheRespostas, chave_requisicao
+from journal_analise import JournalAnalise
+from telemetria import Telemetria
+from arquivos_contexto import ArquivoPreparado, hash_arquivo, tamanho_arquivo, abre_arquivo
+from extracao_texto import ExtratorTexto, inclui_documentos
+from esquema_resposta import esquema_lote, valida_json, tabela_resposta
+from pipeline_envio import PipelineEnvio
+from mapreduce_gemini import divide_documentos, executa_mapreduce, chave_modo_trechos
+from gemini import (ContextoCompartilhado, cria_contexto_compartilhado, estima_tokens, estima_tokens_arquivo, conta_tokens,
+                    avalia_gemini, avalia_gemini_stream, LIMITE_TOKENS_ENTRADA, PRECO_POR_MILHAO_TOKENS, DESEMPENHO_ESTIMADO, TAMANHO_MAXIMO_ARQUIVO)
+
+
+# Taxa de upload presumida para os arquivos de contexto, em bytes por segundo (projeção de tempo)
+TAXA_UPLOAD_ESTIMADA = 5 * 1024 ** 2
+
+# Fração do limite de entrada do modelo a partir da qual o auditado é sinalizado
+FRACAO_ALERTA_LIMITE = 0.8
+
+# Tokens repetidos entre trechos consecutivos de um documento dividido
+SOBREPOSICAO_TRECHOS = 200
+
+# Valores do campo de confiança que podem ser avaliados pela regra de aprovação da cascata
+VALOR_SIMPLES = re.compile(r'^[\w\s.,%+-]*$')
+
+
+class ConfiguracaoAnalise:
+    """Parâmetros de uma execução da análise de auditados com o Gemini."""
+    def __init__(self, modelo, temperature, response_format, max_tentativas=5, ignorar_cache=False,
+                 usar_contexto_compartilhado=True, usar_streaming=False, extrair_texto=False, dividir_documentos=False,
+                 tokens_por_trecho=100_000, trechos_em_paralelo=4, modelo_cascata=None, campo_confianca=None, regra_aprovacao=None,
+                 auditados_por_requisicao=1, esquema_resposta=None, novas_solicitacoes_invalidas=2, uploads_antecipados=2):
+        self.modelo = modelo
+        self.temperature = temperature
+        self.response_format = response_format
+        self.max_tentativas = max_tentativas
+        self.ignorar_cache = ignorar_cache
+        self.usar_contexto_compartilhado = usar_contexto_compartilhado
+        self.usar_streaming = usar_streaming
+        self.extrair_texto = extrair_texto
+        self.dividir_documentos = dividir_documentos  # Análise por trechos (map-reduce) de documentos grandes
+        self.tokens_por_trecho = tokens_por_trecho
+        self.trechos_em_paralelo = trechos_em_paralelo
+        # Cascata: `modelo_cascata` (mais rápido e barato) analisa todos os auditados primeiro; só os reprovados
+        # vão para `modelo`. Uma resposta é aprovada se `campo_confianca` satisfizer `regra_aprovacao` (ex: '>= 0.8')
+        self.modelo_cascata = modelo_cascata
+        self.campo_confianca = campo_confianca
+        self.regra_aprovacao = regra_aprovacao
+        # Agrupamento de vários auditados em uma única requisição (apenas no formato 'Estruturada')
+        self.auditados_por_requisicao = auditados_por_requisicao
+        # Esquema JSON imposto à resposta no formato 'Estruturada' (ver `esquema_resposta`); respostas que não
+        # forem JSON válido ou não seguirem o esquema são solicitadas de novo até `novas_solicitacoes_invalidas` vezes
+        self.esquema_resposta = esquema_resposta
+        self.novas_solicitacoes_invalidas = novas_solicitacoes_invalidas
+        # Quantos auditados à frente podem ter os arquivos preparados e enviados durante a geração (0 desativa)
+        self.uploads_antecipados = uploads_antecipados
+
+    @property
+    def modelos_journal(self):
+        """Modelos cujas respostas registradas no journal podem ser retomadas nesta configuração."""
+        return {self.modelo, self.modelo_cascata} if self.modelo_cascata else {self.modelo}
+
+    def __repr__(self):
+        return (f"ConfiguracaoAnalise(modelo='{self.modelo}', temperature={self.temperature}, "
+                f"response_format='{self.response_format}', max_tentativas={self.max_tentativas})")
+
+
+def prepara_planejamento(auditados, prompt_template, df_contexto_extra, colunas_arquivos, arquivos, config, pular=()):
+    """
+    Prepara, para cada auditado a analisar, os arquivos requeridos, o prompt renderizado e a chave de cache.
+
+    `colunas_arquivos` são as colunas da planilha de contexto que listam arquivos (as terminadas em '*',
+    já sem o asterisco) e `arquivos` é o mapa nome -> arquivo de todos os arquivos de contexto carregados.
+    Auditados em `pular` são ignorados.
+
+    Com `config.extrair_texto`, o texto dos arquivos que o permitem é extraído localmente e incluído
+    no prompt a enviar (ver `prompt_envio`); só os demais ('arquivos_upload') são enviados como arquivo.
+    Com `config.dividir_documentos` (que implica a extração de texto), os auditados cujo prompt passaria
+    de `config.tokens_por_trecho` recebem em 'trechos' a divisão dos documentos para a análise por trechos.
+    """
+    jinja_env = Environment(loader=BaseLoader(), undefined=StrictUndefined)
+    template = jinja_env.from_string(prompt_template)
+
+    # Cada arquivo é lido uma única vez para o hash, mesmo que seja usado por vários auditados
+    hashes = {}
+    def hash_de(filename):
+        if filename not in hashes:
+            hashes[filename] = hash_arquivo(arquivos[filename])
+        return hashes[filename]
+
+    extrator = ExtratorTexto() if config.extrair_texto or config.dividir_documentos else None
+    textos = {}
+    def texto_de(filename):
+        if filename not in textos:
+            textos[filename] = extrator.extrai(arquivos[filename], hash_de(filename)) if extrator else None
+        return textos[filename]
+
+    planejamento = {}
+    for sigla, auditado_obj in auditados.items():
+        if sigla in pular:
+            continue
+
+        # Separa os arquivos específicos para o auditado
+        required_filenames = []
+        if df_contexto_extra is not None and sigla in df_contexto_extra.index:
+            auditado_context_row = df_contexto_extra.loc[sigla]
+            for col_name in colunas_arquivos:
+                if col_name in auditado_context_row and isinstance(auditado_context_row[col_name], list):
+                    required_filenames.extend(auditado_context_row[col_name])
+        available_filenames = [filename for filename in required_filenames if filename in arquivos]
+
+        # Monta o contexto específico do auditado para o Jinja2
+        contexto_render = {'auditado': auditado_obj}
+        if df_contexto_extra is not None and sigla in df_contexto_extra.index:
+            contexto_render.update(df_contexto_extra.loc[sigla].to_dict())
+
+        # Renderiza o prompt com o contexto do auditado atual
+        rendered_prompt = template.render(contexto_render)
+
+        arquivos_texto = [filename for filename in available_filenames if texto_de(filename) is not None]
+        arquivos_upload = [filename for filename in available_filenames if filename not in arquivos_texto]
+
+        hashes_arquivos = [hash_de(filename) for filename in arquivos_upload]
+        planejamento[sigla] = {
+            'nome': auditado_obj.nome,
+            'required_filenames': required_filenames,
+            'available_filenames': available_filenames,
+            'arquivos_texto': arquivos_texto,
+            'arquivos_upload': arquivos_upload,
+            'rendered_prompt': rendered_prompt,
+            # Os textos são compartilhados entre os auditados; o prompt completo só é montado no envio
+            'documentos': [(filename, texto_de(filename)) for filename in arquivos_texto],
+        }
+        if config.dividir_documentos and estima_tokens(prompt_envio(planejamento[sigla])) > config.tokens_por_trecho:
+            # Desconta do tamanho de cada trecho o prompt e as instruções da etapa map, repetidos em todos os trechos
+            tokens_documentos = max(config.tokens_por_trecho - estima_tokens(rendered_prompt) - 200, 1000)
+            planejamento[sigla]['trechos'] = divide_documentos(planejamento[sigla]['documentos'], tokens_documentos, SOBREPOSICAO_TRECHOS)
+            hashes_arquivos = hashes_arquivos + [chave_modo_trechos(config)]
+        planejamento[sigla]['hashes_arquivos'] = hashes_arquivos
+        planejamento[sigla]['chave_cache'] = chave_requisicao(config.modelo, config.temperature, config.response_format,
+                                                              prompt_envio(planejamento[sigla]), hashes_arquivos, config.esquema_resposta)
+
+    return planejamento
+
+
+def planejamento_para_modelo(planejamento, modelo, config):
+    """Cópia do planejamento com as chaves de cache recalculadas para outro modelo."""
+    return {sigla: dict(plano, chave_cache=chave_requisicao(modelo, config.temperature, config.response_format,
+                                                            prompt_envio(plano), plano['hashes_arquivos'], config.esquema_resposta))
+            for sigla, plano in planejamento.items()}
+
+
+def prompt_envio(plano):
+    """Prompt efetivamente enviado ao modelo: o prompt renderizado precedido dos documentos extraídos."""
+    return inclui_documentos(plano['rendered_prompt'], plano['documentos'])
+
+
+class EstimativaExecucao:
+    """
+    Projeção de tokens, custo e tempo de uma execução, calculada antes de qualquer envio ao modelo.
+
+    `tabela` tem uma linha por auditado do planejamento; `situacao` indica se ele será retomado do
+    journal, reaproveitado do cache, se está próximo do limite de entrada ou se o excede.
+    """
+    def __init__(self, tabela, modelo, concorrencia, origem_contagem):
+        self.tabela = tabela
+        self.modelo = modelo
+        self.concorrencia = concorrencia
+        self.origem_contagem = origem_contagem  # 'api' (calibrada pelo endpoint de contagem) ou 'estimativa'
+
+    def __repr__(self):
+        return (f"EstimativaExecucao(modelo='{self.modelo}', auditados={len(self.tabela)}, "
+                f"tokens_entrada={self.tokens_entrada}, custo={self.custo:.2f}, tempo={self.tempo_total:.0f}s)")
+
+    @property
+    def a_enviar(self):
+        """Linhas dos auditados que efetivamente serão enviados ao modelo."""
+        return self.tabela[self.tabela['situacao'].isin(['ok', 'próximo do limite'])]
+
+    @property
+    def excedentes(self):
+        """Linhas dos auditados que não cabem em uma requisição ao modelo."""
+        return self.tabela[self.tabela['situacao'].isin(['excede limite', 'arquivo muito grande'])]
+
+    @property
+    def tokens_entrada(self):
+        return int(self.a_enviar['tokens_entrada'].sum())
+
+    @property
+    def tokens_saida(self):
+        return int(self.a_enviar['tokens_saida'].sum())
+
+    @property
+    def bytes_arquivos(self):
+        return int(self.a_enviar['bytes_arquivos'].sum())
+
+    @property
+    def custo(self):
+        return float(self.a_enviar['custo_estimado'].sum())
+
+    @property
+    def tempo_total(self):
+        """Tempo de parede projetado, em segundos, com as chamadas distribuídas pela concorrência."""
+        return float(self.a_enviar['tempo_estimado'].sum()) / max(self.concorrencia, 1)
+
+
+def estima_execucao(client, planejamento, arquivos, config, journal=None, cache_respostas=None, tokens_saida=1000,
+                    concorrencia=1, usar_api=True):
+    """
+    Projeta os tokens, o custo e o tempo de execução do planejamento sem enviar nada para análise.
+
+    Os prompts são contados localmente; se `usar_api` for True, o maior prompt a enviar é contado
+    no endpoint de contagem de tokens e a proporção caracteres/token obtida calibra os demais
+    (uma única chamada, em vez de uma por auditado). Os arquivos de contexto são medidos localmente.
+    `tokens_saida` é o tamanho esperado de cada resposta. A projeção é conservadora: não considera
+    o desconto do cache de contexto compartilhado.
+    """
+    cache_respostas = cache_respostas or CacheRespostas()
+    registros_journal = journal.carrega() if journal else {}
+    limite = LIMITE_TOKENS_ENTRADA.get(config.modelo, min(LIMITE_TOKENS_ENTRADA.values()))
+    preco_entrada, preco_saida = PRECO_POR_MILHAO_TOKENS.get(config.modelo, max(PRECO_POR_MILHAO_TOKENS.values()))
+    latencia, entrada_por_segundo, saida_por_segundo = DESEMPENHO_ESTIMADO.get(config.modelo, DESEMPENHO_ESTIMADO['gemini-2.5-pro'])
+
+    situacoes = {}
+    for sigla, plano in planejamento.items():
+        registro = registros_journal.get(sigla)
+        if registro is not None and JournalAnalise.valido_para(registro, prompt_envio(plano), config.modelos_journal):
+            situacoes[sigla] = 'journal'
+        elif not config.ignorar_cache and cache_respostas.get(plano['chave_cache']) is not None:
+            situacoes[sigla] = 'cache'
+
+    # Calibra a estimativa local com uma única contagem na API
+    caracteres_por_token, origem = 4.0, 'estimativa'
+    pendentes = [plano for sigla, plano in planejamento.items() if sigla not in situacoes]
+    if usar_api and pendentes:
+        amostra = max((prompt_envio(plano) for plano in pendentes), key=len)
+        tokens_amostra, origem = conta_tokens(client, config.modelo, amostra)
+        if origem == 'api' and tokens_amostra > 0:
+            caracteres_por_token = len(amostra) / tokens_amostra
+
+    # Cada arquivo é medido uma única vez, mesmo que seja usado por vários auditados
+    medidas_arquivos = {}
+    def mede(filename):
+        if filename not in medidas_arquivos:
+            arquivo = arquivos[filename]
+            # Só os PDFs precisam ser lidos (contagem de páginas); os demais são medidos pelo tamanho
+            conteudo = arquivo.getvalue() if filename.lower().endswith('.pdf') else None
+            medidas_arquivos[filename] = (tamanho_arquivo(arquivo), estima_tokens_arquivo(filename, tamanho_arquivo(arquivo), conteudo))
+        return medidas_arquivos[filename]
+
+    linhas = []
+    for sigla, plano in planejamento.items():
+        tokens_prompt = round(len(prompt_envio(plano)) / caracteres_por_token)
+        medidas = [mede(filename) for filename in plano['arquivos_upload']]
+        bytes_arquivos = sum(tamanho for tamanho, _ in medidas)
+        tokens_arquivos = sum(tokens for _, tokens in medidas)
+        tokens_entrada = tokens_prompt + tokens_arquivos
+        chamadas, tokens_saida_auditado = 1, tokens_saida
+        maior_requisicao = tokens_entrada
+        tempo = (latencia + tokens_entrada / entrada_por_segundo + tokens_saida / saida_por_segundo
+                 + bytes_arquivos / TAXA_UPLOAD_ESTIMADA)
+
+        if plano.get('trechos'):
+            # Análise por trechos: as instruções se repetem em cada chamada map, e a consolidação recebe as respostas parciais
+            tokens_instrucoes = round(len(plano['rendered_prompt']) / caracteres_por_token)
+            tokens_trechos = [tokens_instrucoes + round(sum(len(texto) for _, texto in trecho) / caracteres_por_token)
+                              for trecho in plano['trechos']]
+            if plano['arquivos_upload']:
+                tokens_trechos.append(tokens_instrucoes + tokens_arquivos)
+            tokens_consolidacao = tokens_instrucoes + len(tokens_trechos) * tokens_saida if len(tokens_trechos) > 1 else 0
+            chamadas = len(tokens_trechos) + (1 if tokens_consolidacao else 0)
+            tokens_entrada = sum(tokens_trechos) + tokens_consolidacao
+            tokens_saida_auditado = tokens_saida * chamadas
+            maior_requisicao = max(tokens_trechos + [tokens_consolidacao])
+            # As chamadas map rodam em paralelo; a consolidação, depois delas
+            rodadas = -(-len(tokens_trechos) // max(config.trechos_em_paralelo, 1))
+            tempo = (rodadas * (latencia + max(tokens_trechos) / entrada_por_segundo + tokens_saida / saida_por_segundo)
+                     + bytes_arquivos / TAXA_UPLOAD_ESTIMADA
+                     + (latencia + tokens_consolidacao / entrada_por_segundo + tokens_saida / saida_por_segundo if tokens_consolidacao else 0))
+
+        situacao = situacoes.get(sigla)
+        if situacao is None:
+            if any(tamanho > TAMANHO_MAXIMO_ARQUIVO for tamanho, _ in medidas):
+                situacao = 'arquivo muito grande'
+            elif maior_requisicao > limite:
+                situacao = 'excede limite'
+            elif maior_requisicao > FRACAO_ALERTA_LIMITE * limite:
+                situacao = 'próximo do limite'
+            else:
+                situacao = 'ok'
+
+        linhas.append({
+            'auditado_sigla': sigla,
+            'auditado_nome': plano['nome'],
+            'situacao': situacao,
+            'chamadas': chamadas,
+            'arquivos': len(plano['arquivos_upload']),
+            'arquivos_texto': len(plano['arquivos_texto']),
+            'arquivos_ausentes': len(plano['required_filenames']) - len(plano['available_filenames']),
+            'bytes_arquivos': bytes_arquivos,
+            'tokens_prompt': tokens_prompt,
+            'tokens_arquivos': tokens_arquivos,
+            'tokens_entrada': tokens_entrada,
+            'tokens_saida': tokens_saida_auditado,
+            'percentual_limite': 100 * maior_requisicao / limite,
+            'custo_estimado': (tokens_entrada * preco_entrada + tokens_saida_auditado * preco_saida) / 1_000_000,
+            'tempo_estimado': tempo,
+        })
+
+    return EstimativaExecucao(pd.DataFrame(linhas, columns=[
+        'auditado_sigla', 'auditado_nome', 'situacao', 'chamadas', 'arquivos', 'arquivos_texto', 'arquivos_ausentes', 'bytes_arquivos', 'tokens_prompt',
+        'tokens_arquivos', 'tokens_entrada', 'tokens_saida', 'percentual_limite', 'custo_estimado', 'tempo_estimado'
+    ]), config.modelo, concorrencia, origem)
+
+
+PROMPT_AGRUPADO = """Esta requisição reúne {total} auditados. Responda às instruções de cada auditado, abaixo, separadamente.
+Retorne um array JSON com exatamente um objeto por auditado, no formato {{"auditado_sigla": "<sigla>", "resposta": <resposta>}},
+em que <resposta> é o JSON pedido nas instruções daquele auditado. Não misture informações de auditados diferentes.
+
+{auditados}"""
+
+
+class RespostaAgrupada:
+    """Resposta de um auditado extraída da resposta de uma requisição agrupada."""
+    def __init__(self, text, lote):
+        self.text = text
+        self.lote = lote  # Siglas dos auditados da requisição
+
+    def __repr__(self):
+        return f"RespostaAgrupada(tamanho_texto={len(self.text or '')}, lote={self.lote})"
+
+
+def monta_prompt_agrupado(planos):
+    """Monta o prompt de uma requisição agrupada a partir dos planos (dicionário sigla -> plano) dos auditados."""
+    blocos = '\n\n'.join(f'<auditado sigla="{sigla}">\n{prompt_envio(plano)}\n</auditado>' for sigla, plano in planos.items())
+    return PROMPT_AGRUPADO.format(total=len(planos), auditados=blocos)
+
+
+def separa_resposta_agrupada(texto, siglas):
+    """
+    Separa a resposta de uma requisição agrupada em um dicionário sigla -> texto JSON da resposta do auditado.
+    Auditados ausentes, repetidos ou fora do lote não entram no resultado.
+    """
+    try:
+        itens = json.loads(texto)
+    except (json.JSONDecodeError, TypeError):
+        return {}
+    if isinstance(itens, dict):
+        # Alguns modelos envolvem o array em um objeto
+        itens = next((valor for valor in itens.values() if isinstance(valor, list)), [itens])
+    if not isinstance(itens, list):
+        return {}
+
+    respostas = {}
+    repetidas = set()
+    for item in itens:
+        if not isinstance(item, dict) or 'resposta' not in item:
+            continue
+        sigla = str(item.get('auditado_sigla', ''))
+        if sigla not in siglas:
+            continue
+        if sigla in respostas:
+            repetidas.add(sigla)
+        respostas[sigla] = json.dumps(item['resposta'], ensure_ascii=False)
+    return {sigla: resposta for sigla, resposta in respostas.items() if sigla not in repetidas}
+
+
+def executa_lotes(client, planos, config, cache_respostas, notifica, progresso=None, telemetria=None):
+    """
+    Analisa os auditados em requisições agrupadas de `config.auditados_por_requisicao` auditados.
+
+    Retorna o dicionário sigla -> `RespostaAgrupada` dos auditados presentes nas respostas; os que
+    faltarem (ou cujo lote falhou) devem ser analisados individualmente. A resposta de cada auditado
+    vai para o `cache_respostas` na chave do próprio auditado, de modo que uma nova execução não
+    depende de os lotes se repetirem.
+    """
+    siglas = list(planos)
+    tamanho = max(config.auditados_por_requisicao, 1)
+    # Um lote com um único auditado não traz ganho; ele segue para a análise individual
+    lotes = [lote for lote in (siglas[i:i + tamanho] for i in range(0, len(siglas), tamanho)) if len(lote) > 1]
+
+    respostas = {}
+    for n, lote in enumerate(lotes, start=1):
+        if progresso:
+            progresso.atualiza(mensagem=f"Requisição agrupada {n}/{len(lotes)}")
+        prompt_text = monta_prompt_agrupado({sigla: planos[sigla] for sigla in lote})
+        notifica(None, 'info', f"📦 Requisição agrupada {n}/{len(lotes)}: {', '.join(lote)}")
+
+        def avisa_falha(tentativa, max_tentativas, mensagem, espera):
+            notifica(None, 'warning', f"Requisição agrupada {n}/{len(lotes)}: tentativa {tentativa}/{max_tentativas} falhou. "
+                                      f"Erro: {mensagem}. Nova tentativa em {espera:.1f} segundos...")
+
+        response, error_message = avalia_gemini(client, prompt_text, config.modelo, config.temperature, config.response_format,
+                                                max_tentativas=config.max_tentativas, ao_falhar=avisa_falha,
+                                                telemetria=telemetria, rotulo=f"Lote {n}/{len(lotes)}: {', '.join(lote)}",
+                                                esquema=esquema_lote(config.esquema_resposta) if config.esquema_resposta else None)
+        if error_message:
+            notifica(None, 'warning', f"Requisição agrupada {n}/{len(lotes)} falhou ({error_message}). "
+                                      "Os auditados do lote serão analisados individualmente.")
+            continue
+
+        separadas = separa_resposta_agrupada(response.text, lote)
+        for sigla in lote:
+            erro_validacao = valida_resposta(separadas[sigla], config) if sigla in separadas else None
+            if erro_validacao:
+                notifica(sigla, 'warning', f"Resposta de {sigla} na requisição agrupada inválida ({erro_validacao}). "
+                                           "O auditado será analisado individualmente.")
+            elif sigla in separadas:
+                respostas[sigla] = RespostaAgrupada(separadas[sigla], lote)
+                cache_respostas.set(planos[sigla]['chave_cache'], separadas[sigla],
+                                    {'auditado_sigla': sigla, 'modelo': config.modelo, 'lote': lote})
+            else:
+                notifica(sigla, 'warning', f"{sigla} não veio na resposta da requisição agrupada e será analisado individualmente.")
+    return respostas
+
+
+def valida_resposta(texto, config):
+    """
+    Retorna a mensagem de erro se a resposta não puder ser interpretada no formato pedido (no formato
+    'Estruturada', JSON válido e, se houver, conforme `config.esquema_resposta`), ou None se for válida.
+    """
+    if config.response_format != 'Estruturada':
+        return None
+    return valida_json(texto, config.esquema_resposta)[1]
+
+
+def interpreta_resposta(texto, sigla, nome, config):
+    """
+    Converte o texto da resposta no resultado do auditado: um DataFrame no formato 'Estruturada'
+    ou o próprio texto no formato 'Texto'. Retorna o resultado e a mensagem de erro, se houver.
+
+    Com `config.esquema_resposta`, o DataFrame tem sempre as colunas definidas pelo esquema (ver
+    `esquema_resposta.tabela_resposta`), seguidas das colunas de identificação do auditado.
+    """
+    if config.response_format != 'Estruturada':
+        return texto, None
+
+    response_json, erro = valida_json(texto, config.esquema_resposta)
+    if erro:
+        return texto, f"{erro}. Exibindo como texto."
+    try:
+        if config.esquema_resposta:
+            df = tabela_resposta(response_json, config.esquema_resposta)
+        else:
+            df = pd.json_normalize(response_json)
+    except (TypeError, AttributeError, NotImplementedError) as e:
+        return texto, f"A resposta do modelo não pôde ser convertida em planilha. Exibindo como texto. Erro: {e}"
+    df['auditado_sigla'] = sigla
+    df['auditado_nome'] = nome
+    df['data_avaliacao'] = datetime.now()
+    df['modelo'] = config.modelo
+    return df, None
+
+
+def prepara_arquivo(file_to_upload):
+    """
+    Prepara um arquivo de contexto para o upload e retorna um `ArquivoPreparado`.
+
+    Quando o tipo do arquivo é reconhecido pela extensão, o conteúdo será enviado em fluxo (membros de ZIP
+    são descomprimidos durante o envio); caso contrário, é gravado em um arquivo temporário para que o
+    cliente deduza o tipo.
+    """
+    mime_type, _ = mimetypes.guess_type(file_to_upload.name)
+    if mime_type:
+        return ArquivoPreparado(file_to_upload, abre_arquivo(file_to_upload),
+                                {'mime_type': mime_type, 'display_name': os.path.basename(file_to_upload.name)})
+
+    # Extrai a extensão do arquivo original para usar como sufixo no arquivo temporário
+    # Isso garante que NamedTemporaryFile crie um arquivo plano no diretório /tmp
+    file_extension = os.path.splitext(os.path.basename(file_to_upload.name))[1]
+
+    with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension) as tmp_file:
+        tmp_file.write(file_to_upload.getvalue())
+        return ArquivoPreparado(file_to_upload, tmp_file.name, temporario=True)
+
+
+def envia_preparado(client, preparado, telemetria=None):
+    """
+    Faz o upload de um arquivo preparado por `prepara_arquivo`, descarta a preparação e retorna o objeto
+    de arquivo. Se `telemetria` for informada, registra a duração e os bytes enviados.
+    """
+    inicio = time.time()
+    erro = None
+    try:
+        if preparado.config_upload:
+            return client.files.upload(file=preparado.fonte, config=preparado.config_upload)
+        return client.files.upload(file=preparado.fonte)
+    except Exception as e:
+        erro = str(e)
+        raise
+    finally:
+        preparado.descarta()
+        if telemetria is not None:
+            telemetria.registra_upload(preparado.arquivo.name, inicio, tamanho_arquivo(preparado.arquivo), erro=erro)
+
+
+def envia_arquivo(client, file_to_upload, telemetria=None):
+    """Faz o upload de um arquivo de contexto para a API e retorna o objeto de arquivo (ver `prepara_arquivo`)."""
+    return envia_preparado(client, prepara_arquivo(file_to_upload), telemetria)
+
+
+def executa_analise(client, planejamento, arquivos, config, journal=None, cache_respostas=None, notifica=None, progresso=None, resultados=None,
+                    telemetria=None):
+    """
+    Executa a análise de cada auditado do planejamento e retorna a lista de resultados
+    (dicionários com 'auditado_sigla', 'auditado_nome', 'resposta_gemini' e 'erro', a mensagem de erro
+    quando a chamada falhou ou a resposta não pôde ser interpretada).
+
+    Auditados já presentes no `journal` com o mesmo prompt são retomados sem chamada ao modelo;
+    respostas idênticas são reaproveitadas do `cache_respostas`; a parte comum a todos os prompts
+    vai para um cache de contexto compartilhado. Os uploads dos próximos `config.uploads_antecipados`
+    auditados correm em paralelo com a geração do atual (ver `pipeline_envio.PipelineEnvio`).
+
+    `notifica(sigla, tipo, conteudo)` recebe os eventos da execução para exibição. `tipo` é um de
+    'info', 'success', 'warning', 'error' (conteúdo é a mensagem), 'prompt' (prompt renderizado),
+    'parcial' (texto recebido até o momento, no modo streaming) ou 'resultado' (DataFrame ou texto).
+    `sigla` é None para eventos da execução como um todo. Se `resultados` for informado, os resultados
+    são acrescentados a essa lista à medida que ficam prontos. `telemetria` (um `telemetria.Telemetria`)
+    recebe o registro de cada chamada ao modelo e de cada upload.
+    """
+    notifica = notifica or (lambda sigla, tipo, conteudo: None)
+    cache_respostas = cache_respostas or CacheRespostas()
+    registros_journal = journal.carrega() if journal else {}
+
+    def retomavel(sigla, plano):
+        registro = registros_journal.get(sigla)
+        return registro is not None and JournalAnalise.valido_para(registro, prompt_envio(plano), config.modelos_journal)
+
+    def envia(file_to_upload, sigla=None):
+        notifica(sigla, 'info', f"📄 Fazendo upload de '{file_to_upload.name}' para a API...")
+        return envia_arquivo(client, file_to_upload, telemetria)
+
+    def pendente(sigla, plano):
+        return (not retomavel(sigla, plano) and not plano.get('trechos')
+                and (config.ignorar_cache or cache_respostas.get(plano['chave_cache']) is None))
+
+    # Auditados sem arquivos a enviar são agrupados em requisições com vários auditados, se configurado
+    respostas_lotes = {}
+    if config.auditados_por_requisicao > 1 and config.response_format == 'Estruturada':
+        agrupaveis = {sigla: plano for sigla, plano in planejamento.items() if pendente(sigla, plano) and not plano['arquivos_upload']}
+        if len(agrupaveis) > 1:
+            respostas_lotes = executa_lotes(client, agrupaveis, config, cache_respostas, notifica, progresso, telemetria)
+
+    # Cria o cache de contexto com a parte comum aos auditados que ainda precisam de chamada ao modelo
+    contexto_compartilhado = ContextoCompartilhado()
+    if config.usar_contexto_compartilhado:
+        pendentes = {sigla: plano for sigla, plano in planejamento.items() if pendente(sigla, plano) and sigla not in respostas_lotes}
+        contexto_compartilhado = cria_contexto_compartilhado(
+            client, config.modelo,
+            {sigla: prompt_envio(plano) for sigla, plano in pendentes.items()},
+            {sigla: plano['arquivos_upload'] for sigla, plano in pendentes.items()},
+            lambda filename: envia(arquivos[filename])
+        )
+        if contexto_compartilhado.ativo:
+            notifica(None, 'info', f"🗂️ Cache de contexto compartilhado criado: ~{len(contexto_compartilhado.prefixo)} caracteres do prompt "
+                                   f"e {len(contexto_compartilhado.arquivos)} arquivo(s) comuns serão reaproveitados em cada requisição.")
+        else:
+            notifica(None, 'info', f"Cache de contexto compartilhado não utilizado: {contexto_compartilhado.motivo}.")
+
+    # Os arquivos dos próximos auditados são preparados e enviados enquanto o modelo gera a resposta do atual
+    pipeline = PipelineEnvio(
+        [(sigla, [arquivos[filename] for filename in contexto_compartilhado.arquivos_especificos(plano['arquivos_upload'])])
+         for sigla, plano in planejamento.items() if pendente(sigla, plano) and sigla not in respostas_lotes],
+        prepara_arquivo, lambda preparado: envia_preparado(client, preparado, telemetria), notifica, config.uploads_antecipados
+    )
+
+    all_results = resultados if resultados is not None else []
+    total = len(planejamento)
+    try:
+        pipeline.inicia()
+        for i, (sigla, plano) in enumerate(planejamento.items(), start=1):
+            if progresso:
+                progresso.atualiza(i / (total + 1), f"Analisando {plano['nome']} ({sigla}) - {i}/{total}")
+
+            rendered_prompt = plano['rendered_prompt']
+            prompt_completo = prompt_envio(plano)
+
+            if retomavel(sigla, plano):
+                notifica(sigla, 'info', f"Auditado {plano['nome']} ({sigla}) já analisado nesta configuração. Resultado retomado do journal.")
+                all_results.append({
+                    "auditado_sigla": sigla,
+                    "auditado_nome": plano['nome'],
+                    "resposta_gemini": JournalAnalise.resposta(registros_journal[sigla]),
+                    "erro": None
+                })
+                continue
+
+            if not plano['required_filenames']:
+                notifica(sigla, 'warning', f"Nenhum arquivo de contexto especificado para '{sigla}'. A análise prosseguirá sem arquivos.")
+            else:
+                for filename in plano['required_filenames']:
+                    if filename not in arquivos:
+                        notifica(sigla, 'error', f"Arquivo '{filename}' especificado para '{sigla}' não encontrado nos arquivos carregados.")
+
+            notifica(sigla, 'prompt', rendered_prompt)
+            if plano['arquivos_texto']:
+                notifica(sigla, 'info', f"📝 Texto extraído localmente e incluído no prompt: {', '.join(plano['arquivos_texto'])}.")
+
+            # As respostas das requisições agrupadas desta execução (também gravadas no cache) vêm primeiro,
+            # para que a origem informada seja a correta; as demais são consultadas no cache antes de
+            # qualquer upload ou chamada ao modelo
+            response = respostas_lotes.get(sigla)
+            if response is None and not config.ignorar_cache:
+                response = cache_respostas.get(plano['chave_cache'])
+            error_message = None
+
+            if sigla in respostas_lotes:
+                notifica(sigla, 'success', f"Análise para {sigla} obtida na requisição agrupada com {', '.join(response.lote)}.")
+            elif response is not None:
+                notifica(sigla, 'success', f"Análise para {sigla} recuperada do cache.")
+            elif plano.get('trechos'):
+                response, error_message = executa_mapreduce(client, plano, arquivos, config, cache_respostas, envia, notifica, sigla, telemetria)
+                if not error_message and not valida_resposta(response.text, config):
+                    notifica(sigla, 'success', f"Análise por trechos para {sigla} bem-sucedida.")
+                    cache_respostas.set(plano['chave_cache'], response.text, {'auditado_sigla': sigla, 'modelo': config.modelo})
+            else:
+                # Arquivos comuns já estão no cache de contexto (ou já foram enviados, se o cache não foi criado);
+                # envia só os específicos do auditado
+                uploaded_file_objects = contexto_compartilhado.arquivos_enviados(plano['arquivos_upload'])
+                if sigla in pipeline:
+                    uploaded_file_objects += pipeline.obtem(sigla)
+                else:
+                    uploaded_file_objects += [envia(arquivos[filename], sigla)
+                                              for filename in contexto_compartilhado.arquivos_especificos(plano['arquivos_upload'])]
+
+                # Erros transitórios são repetidos com backoff; erros permanentes falham na hora.
+                def avisa_falha(tentativa, max_tentativas, mensagem, espera, sigla=sigla):
+                    notifica(sigla, 'warning', f"Tentativa {tentativa}/{max_tentativas} para {sigla} falhou. Erro: {mensagem}. "
+                                               f"Nova tentativa em {espera:.1f} segundos...")
+
+                argumentos = dict(max_tentativas=config.max_tentativas, ao_falhar=avisa_falha, cached_content=contexto_compartilhado.nome_cache,
+                                  telemetria=telemetria, rotulo=sigla, esquema=config.esquema_resposta)
+                # Respostas que não seguem o formato pedido são solicitadas de novo, sem ir para o cache
+                for solicitacao in range(config.novas_solicitacoes_invalidas + 1):
+                    if config.usar_streaming:
+                        response, error_message = avalia_gemini_stream(
+                            client, contexto_compartilhado.sufixo(prompt_completo), config.modelo, config.temperature, config.response_format,
+                            uploaded_file_objects, ao_receber=lambda texto, sigla=sigla: notifica(sigla, 'parcial', texto), **argumentos)
+                    else:
+                        response, error_message = avalia_gemini(
+                            client, contexto_compartilhado.sufixo(prompt_completo), config.modelo, config.temperature, config.response_format,
+                            uploaded_file_objects, **argumentos)
+                    erro_validacao = None if error_message else valida_resposta(response.text, config)
+                    if not erro_validacao:
+                        break
+                    if solicitacao < config.novas_solicitacoes_invalidas:
+                        notifica(sigla, 'warning', f"Resposta inválida para {sigla} ({erro_validacao}). Solicitando novamente "
+                                                   f"({solicitacao + 1}/{config.novas_solicitacoes_invalidas})...")
+
+                if not error_message and not erro_validacao:
+                    notifica(sigla, 'success', f"Análise para {sigla} bem-sucedida.")
+                    cache_respostas.set(plano['chave_cache'], response.text, {'auditado_sigla': sigla, 'modelo': config.modelo})
+
+            if error_message:
+                notifica(sigla, 'error', f"Falha ao analisar {sigla}. Erro final: {error_message}")
+                all_results.append({
+                    "auditado_sigla": sigla,
+                    "auditado_nome": plano['nome'],
+                    "resposta_gemini": error_message,
+                    "erro": error_message
+                })
+                continue # Pula para o próximo auditado em caso de erro
+
+            response_modelo, erro_interpretacao = interpreta_resposta(response.text, sigla, plano['nome'], config)
+            if erro_interpretacao:
+                notifica(sigla, 'error', erro_interpretacao)
+            notifica(sigla, 'resultado', response_modelo)
+
+            # Só resultados válidos vão para o journal; os demais serão reanalisados na retomada
+            if journal and not erro_interpretacao:
+                journal.registra(sigla, plano['nome'], prompt_completo, response_modelo, modelo=config.modelo)
+
+            all_results.append({
+                "auditado_sigla": sigla,
+                "auditado_nome": plano['nome'],
+                "resposta_gemini": response_modelo,
+                "erro": erro_interpretacao
+            })
+    finally:
+        pipeline.encerra()
+        # O cache de contexto é cobrado por tempo de armazenamento; remove assim que a execução termina
+        contexto_compartilhado.remove(client)
+
+    return all_results
+
+
+def resposta_aprovada(resultado, config):
+    """
+    Verifica se o resultado de um auditado pode ser aceito sem passar ao modelo seguinte da cascata.
+    Retorna (aprovado, motivo da reprovação).
+
+    Reprova chamadas que falharam e respostas que não puderam ser interpretadas. No formato
+    'Estruturada', se `config.campo_confianca` estiver definido, todas as linhas precisam ter o campo
+    satisfazendo `config.regra_aprovacao`, na mesma sintaxe das expressões de achado (ex: '>= 0.8'
+    ou 'Alta | Média').
+    """
+    if resultado.get('erro'):
+        return False, resultado['erro']
+
+    resposta = resultado['resposta_gemini']
+    if not config.campo_confianca or not config.regra_aprovacao or not isinstance(resposta, pd.DataFrame):
+        return True, None
+    if config.campo_confianca not in resposta.columns:
+        return False, f"a resposta não tem o campo '{config.campo_confianca}'"
+    for valor in resposta[config.campo_confianca]:
+        # O valor vem do modelo e avalia_expressao pode usar eval: só valores simples (sem parênteses,
+        # aspas ou colchetes) são avaliados, de modo que não há chamada de função possível
+        try:
+            aprovado = bool(VALOR_SIMPLES.match(str(valor))) and avalia_expressao(config.regra_aprovacao, valor)
+        except Exception:
+            aprovado = False
+        if not aprovado:
+            return False, f"'{config.campo_confianca}' = {valor} não satisfaz '{config.regra_aprovacao}'"
+    return True, None
+
+
+def executa_analise_cascata(client, planejamento, arquivos, config, journal=None, cache_respostas=None, notifica=None, progresso=None,
+                            resultados=None, telemetria=None):
+    """
+    Executa a análise em cascata: todos os auditados passam primeiro pelo `config.modelo_cascata`, e só
+    os reprovados por `resposta_aprovada` são reanalisados com `config.modelo`. Mesmos parâmetros e
+    retorno de `executa_analise`.
+
+    Ao final, as estatísticas de cada nível são enviadas a `notifica` como evento 'estatisticas'
+    (um DataFrame). Só resultados finais vão para o journal: os aprovados no primeiro nível e os do
+    segundo nível.
+    """
+    notifica = notifica or (lambda sigla, tipo, conteudo: None)
+    cache_respostas = cache_respostas or CacheRespostas()
+    all_results = resultados if resultados is not None else []
+    estatisticas = []
+
+    # Auditados já concluídos no journal (em qualquer nível) não passam de novo pela cascata
+    registros_journal = journal.carrega() if journal else {}
+    retomados = {sigla for sigla, plano in planejamento.items()
+                 if sigla in registros_journal
+                 and JournalAnalise.valido_para(registros_journal[sigla], prompt_envio(plano), config.modelos_journal)}
+    for sigla in retomados:
+        notifica(sigla, 'info', f"Auditado {planejamento[sigla]['nome']} ({sigla}) já analisado nesta configuração. Resultado retomado do journal.")
+        all_results.append({
+            "auditado_sigla": sigla,
+            "auditado_nome": planejamento[sigla]['nome'],
+            "resposta_gemini": JournalAnalise.resposta(registros_journal[sigla]),
+            "erro": None
+        })
+
+    # Nível 1: modelo rápido, sem journal (o resultado só é definitivo depois da validação)
+    config_rapido = copy.copy(config)
+    config_rapido.modelo = config.modelo_cascata
+    pendentes = planejamento_para_modelo({sigla: plano for sigla, plano in planejamento.items() if sigla not in retomados},
+                                         config.modelo_cascata, config)
+    notifica(None, 'info', f"🪜 Nível 1 da cascata: {len(pendentes)} auditado(s) com {config.modelo_cascata}.")
+    inicio = time.monotonic()
+    resultados_rapido = executa_analise(client, pendentes, arquivos, config_rapido, None, cache_respostas, notifica, progresso,
+                                        telemetria=telemetria)
+    duracao = time.monotonic() - inicio
+
+    reprovados = {}
+    for resultado in resultados_rapido:
+        sigla = resultado['auditado_sigla']
+        aprovado, motivo = resposta_aprovada(resultado, config)
+        if aprovado:
+            if journal:
+                journal.registra(sigla, resultado['auditado_nome'], prompt_envio(planejamento[sigla]), resultado['resposta_gemini'],
+                                 modelo=config.modelo_cascata)
+            all_results.append(resultado)
+        else:
+            notifica(sigla, 'warning', f"Resultado de {config.modelo_cascata} reprovado ({motivo}). O auditado será reanalisado com {config.modelo}.")
+            reprovados[sigla] = planejamento[sigla]
+    estatisticas.append(_estatisticas_nivel(1, config.modelo_cascata, resultados_rapido, len(resultados_rapido) - len(reprovados), duracao))
+
+    # Nível 2: modelo principal, só para os reprovados
+    if reprovados:
+        notifica(None, 'info', f"🪜 Nível 2 da cascata: {len(reprovados)} auditado(s) com {config.modelo}.")
+        inicio = time.monotonic()
+        resultados_principal = executa_analise(client, reprovados, arquivos, config, journal, cache_respostas, notifica, progresso,
+                                               telemetria=telemetria)
+        duracao = time.monotonic() - inicio
+        aprovados = sum(1 for resultado in resultados_principal if resposta_aprovada(resultado, config)[0])
+        estatisticas.append(_estatisticas_nivel(2, config.modelo, resultados_principal, aprovados, duracao))
+        all_results.extend(resultados_principal)
+
+    notifica(None, 'estatisticas', pd.DataFrame(estatisticas))
+    return all_results
+
+
+def _estatisticas_nivel(nivel, modelo, resultados, aprovados, duracao):
+    falhas = sum(1 for resultado in resultados if resultado.get('erro'))
+    return {
+        'nivel': nivel,
+        'modelo': modelo,
+        'auditados': len(resultados),
+        'aprovados': aprovados,
+        'reprovados': len(resultados) - aprovados - falhas,
+        'falhas': falhas,
+        'tempo_total_s': round(duracao, 1),
+        'tempo_medio_s': round(duracao / len(resultados), 1) if resultados else 0.0,
+    }
+
+
+def executa_analise_job(api_key, planejamento, arquivos, config, id_journal, resultados_iniciais=None, progresso=None):
+    """
+    Versão de `executa_analise` para execução em segundo plano (ver `jobs.GerenciadorJobs`).
+    `resultados_iniciais` (ex: auditados retomados de uma planilha de resumo) precedem os resultados da análise.
+    Retorna um dicionário com os 'resultados' e a 'telemetria' da execução.
+    """
+    from google import genai
+
+    client = genai.Client(api_key=api_key)
+    config.usar_streaming = False  # Não há página acompanhando o texto parcial
+
+    def notifica(sigla, tipo, conteudo):
+        if progresso and tipo in ('info', 'success', 'warning', 'error'):
+            progresso.atualiza(mensagem=conteudo)
+        elif progresso and tipo == 'estatisticas':
+            progresso.atualiza(mensagem=f"Estatísticas da cascata:\n{conteudo.to_string(index=False)}")
+
+    telemetria = Telemetria()
+    executa = executa_analise_cascata if config.modelo_cascata else executa_analise
+    resultados = executa(client, planejamento, arquivos, config, JournalAnalise(id_journal), CacheRespostas(), notifica, progresso,
+                         resultados=list(resultados_iniciais or []), telemetria=telemetria)
+    if progresso:
+        resumo = telemetria.resumo()
+        progresso.atualiza(mensagem=f"Telemetria: {resumo['requisicoes']} requisição(ões), {resumo['erros']} erro(s), "
+                                    f"{resumo['novas_tentativas']} nova(s) tentativa(s), {resumo['uploads']} upload(s).")
+    return {'resultados': resultados, 'telemetria': telemetria}
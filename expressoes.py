@@ -0,0 +1,98 @@
+import re
+
+from perfilamento import mede
+
+
+def parse_expression(expression):
+    tokens = []
+    current_token = ''
+
+    for char in expression:
+        if char in {'|', '&', '~', '(', ')'}:
+            if current_token:
+                tokens.append(current_token.strip())
+                current_token = ''
+            tokens.append(char)
+        else:
+            current_token += char
+
+    if current_token:
+        tokens.append(current_token.strip())
+
+    return tokens
+
+def infix_to_rpn(tokens):
+    precedence = {'~': 3, '&': 2, '|': 1}
+    output = []
+    stack = []
+
+    for token in tokens:
+        if token == '(':
+            # Abre parêntese
+            stack.append(token)
+        elif token == ')':
+            # Fecha parêntese
+            while stack and stack[-1] != '(':
+                output.append(stack.pop())
+            stack.pop()  # Remove o '('
+        elif token in precedence:
+            # Operador
+            while stack and stack[-1] in precedence and precedence[stack[-1]] >= precedence[token]:
+                output.append(stack.pop())
+            stack.append(token)
+        else:
+            output.append(token)
+
+    while stack:
+        output.append(stack.pop())
+
+    return list(filter(lambda x: x != '', output))
+
+def avalia_expressao(expressao_achado, situacao_encontrada, perfil=None):
+    """
+    Verifica se a situação encontrada atende à expressão de situação inconforme. Tenta primeiro avaliar
+    `situacao_encontrada expressao_achado` como expressão Python (ex: "12 > 10"); se não for possível,
+    compara a situação com os termos da expressão lógica (ex: "(Não adota | Adota parcialmente)").
+    Com um `perfil` (`perfilamento.PerfilDesempenho`), registra o tempo e o caminho seguido por critério.
+    """
+    expressao_achado = str(expressao_achado)
+    situacao_encontrada = str(situacao_encontrada)
+
+    with mede(perfil, 'criterio', expressao_achado) as medicao:
+        # Primeiro tenta se é o caso de um eval
+        try:
+            resultado = eval(f'{situacao_encontrada} {expressao_achado}')
+            medicao.caminho = 'eval'
+            return resultado
+        except Exception as e:
+            medicao.caminho = 'rpn'
+            parsed_tokens = parse_expression(expressao_achado)
+            tokens = infix_to_rpn(parsed_tokens)
+
+            pilha = []
+
+            for token in tokens:
+                if token == '|':
+                    # Operador OR
+                    y = pilha.pop()
+                    x = pilha.pop()
+                    pilha.append(x or y)
+                elif token == '&':
+                    # Operador AND
+                    y = pilha.pop()
+                    x = pilha.pop()
+                    pilha.append(x and y)
+                elif token == '~':
+                    x = pilha.pop()
+                    pilha.append(not x)
+                else:
+                    # Aqui se remove o '.' no final da string pois não está padronizada as respostas.
+                    # Assim, encontra-se resposta terminando em '.' como 'Não adota' ou 'Não adota.'
+                    a = re.sub(r'\.$', '', token)
+                    b = re.sub(r'\.$', '', situacao_encontrada)
+                    pilha.append(a == b)
+
+            if len(pilha) == 1:
+                return pilha[0]
+            else:
+                raise ValueError("Expressão lógica inválida")
@@ -0,0 +1,154 @@
+import io
+import os
+import re
+import unicodedata
+
+import pandas as pd
+
+from cache_respostas import CacheRespostas, hash_conteudo
+from arquivos_contexto import hash_arquivo
+
+
+# Alterar quando a extração ou a normalização mudarem, para invalidar os textos já em cache
+VERSAO_EXTRACAO = 1
+
+EXTENSOES_EXTRAIVEIS = ('.pdf', '.docx', '.xlsx', '.csv', '.txt', '.md')
+
+# Páginas de PDF com menos caracteres que isso são consideradas imagem (digitalizadas, gráficos...)
+MINIMO_CARACTERES_POR_PAGINA = 100
+# Fração máxima de páginas sem texto para que o PDF ainda seja enviado como texto
+FRACAO_MAXIMA_PAGINAS_IMAGEM = 0.3
+# DOCX com imagens e menos que isso de texto por imagem continuam sendo enviados como arquivo
+MINIMO_CARACTERES_POR_IMAGEM_DOCX = 500
+
+
+def normaliza_texto(texto):
+    """
+    Normaliza o texto extraído: Unicode em NFC, sem caracteres de controle, espaços repetidos
+    ou hifenização de fim de linha, e com no máximo uma linha em branco entre parágrafos.
+    """
+    texto = unicodedata.normalize('NFC', texto).replace('\r\n', '\n').replace('\r', '\n')
+    texto = ''.join(c for c in texto if c in '\n\t' or unicodedata.category(c)[0] != 'C')
+    texto = re.sub(r'(\w)-\n(\w)', r'\1\2', texto)
+    texto = re.sub(r'[ \t\u00a0]+', ' ', texto)
+    texto = re.sub(r' *\n *', '\n', texto)
+    texto = re.sub(r'\n{3,}', '\n\n', texto)
+    return texto.strip()
+
+
+def _decodifica(conteudo):
+    try:
+        return conteudo.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        return conteudo.decode('latin-1')
+
+
+def _extrai_pdf(conteudo):
+    from pypdf import PdfReader
+
+    paginas = [pagina.extract_text() or '' for pagina in PdfReader(io.BytesIO(conteudo)).pages]
+    if not paginas:
+        return None
+    paginas_imagem = sum(1 for texto in paginas if len(texto.strip()) < MINIMO_CARACTERES_POR_PAGINA)
+    if paginas_imagem / len(paginas) > FRACAO_MAXIMA_PAGINAS_IMAGEM:
+        return None
+    return '\n\n'.join(f"[Página {i}]\n{texto}" for i, texto in enumerate(paginas, start=1))
+
+
+def _extrai_docx(conteudo):
+    from docx import Document
+    from docx.table import Table
+
+    documento = Document(io.BytesIO(conteudo))
+    partes = []
+    # Percorre parágrafos e tabelas na ordem em que aparecem no documento
+    for bloco in documento.iter_inner_content():
+        if isinstance(bloco, Table):
+            for linha in bloco.rows:
+                partes.append(' | '.join(celula.text.strip() for celula in linha.cells))
+        else:
+            partes.append(bloco.text)
+    texto = '\n'.join(partes)
+
+    imagens = len(documento.inline_shapes)
+    if imagens and len(texto.strip()) < MINIMO_CARACTERES_POR_IMAGEM_DOCX * imagens:
+        return None
+    return texto
+
+
+def _extrai_xlsx(conteudo):
+    planilhas = pd.read_excel(io.BytesIO(conteudo), sheet_name=None, dtype=str)
+    return '\n\n'.join(f"[Planilha: {nome}]\n{df.to_csv(index=False)}" for nome, df in planilhas.items())
+
+
+def extrai_texto(nome, conteudo):
+    """
+    Extrai localmente o texto de um arquivo de contexto (PDF, DOCX, XLSX, CSV, TXT ou MD).
+
+    Retorna None quando o arquivo deve continuar sendo enviado como arquivo: formato não suportado,
+    PDF digitalizado ou com muitas páginas sem texto, DOCX com predominância de imagens ou falha na leitura.
+    """
+    extensao = os.path.splitext(nome.lower())[1]
+    try:
+        if extensao == '.pdf':
+            texto = _extrai_pdf(conteudo)
+        elif extensao == '.docx':
+            texto = _extrai_docx(conteudo)
+        elif extensao == '.xlsx':
+            texto = _extrai_xlsx(conteudo)
+        elif extensao in ('.csv', '.txt', '.md'):
+            texto = _decodifica(conteudo)
+        else:
+            return None
+    except Exception:
+        return None
+    if texto is None:
+        return None
+    texto = normaliza_texto(texto)
+    return texto or None
+
+
+class ExtratorTexto:
+    """
+    Extrai o texto dos arquivos de contexto para ser incluído diretamente no prompt, no lugar
+    do upload do arquivo.
+
+    Os textos ficam em cache em disco, indexados pelo hash do conteúdo do arquivo, inclusive a
+    decisão de não extrair (arquivos digitalizados ou com muitas imagens), de modo que cada
+    arquivo é processado uma única vez entre execuções e entre páginas.
+    """
+    def __init__(self, cache=None):
+        self.cache = cache or CacheRespostas(diretorio=os.path.join('tmp', 'cache_extracao'))
+
+    def __repr__(self):
+        return f"ExtratorTexto(cache={self.cache!r})"
+
+    def extrai(self, arquivo, hash_do_arquivo=None):
+        """
+        Retorna o texto normalizado do arquivo, ou None se ele deve ser enviado como arquivo.
+        `hash_do_arquivo` evita recalcular o hash quando ele já é conhecido.
+        """
+        if not arquivo.name.lower().endswith(EXTENSOES_EXTRAIVEIS):
+            return None
+
+        chave = hash_conteudo(f"extracao-v{VERSAO_EXTRACAO}:{hash_do_arquivo or hash_arquivo(arquivo)}")
+        em_cache = self.cache.get(chave)
+        if em_cache is not None:
+            return em_cache.text if em_cache.metadados.get('extraivel') else None
+
+        texto = extrai_texto(arquivo.name, arquivo.getvalue())
+        self.cache.set(chave, texto or '', {'arquivo': arquivo.name, 'extraivel': texto is not None})
+        return texto
+
+
+def inclui_documentos(prompt_text, documentos):
+    """
+    Inclui no prompt o texto dos documentos (lista de pares nome, texto), antes das instruções.
+
+    Os documentos vêm primeiro para que os comuns a todos os auditados façam parte do prefixo
+    invariante aproveitado pelo cache de contexto compartilhado.
+    """
+    if not documentos:
+        return prompt_text
+    blocos = [f'<documento nome="{nome}">\n{texto}\n</documento>' for nome, texto in documentos]
+    return '\n\n'.join(blocos) + '\n\n' + prompt_text
@@ -0,0 +1,581 @@
+import io
+import os
+import re
+import json
+import time
+import random
+import threading
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+# O SDK do Gemini (`google.genai`) leva cerca de um segundo para carregar: é importado nas funções que o
+# usam, para que as páginas e a linha de comando que não chamam o modelo não paguem esse custo.
+
+
+# Códigos HTTP que indicam falha transitória (cota, sobrecarga ou indisponibilidade momentânea).
+# Demais erros da API (ex: 400, 401, 403, 404) são permanentes e não adianta repetir a chamada.
+CODIGOS_TRANSITORIOS = {408, 429, 500, 502, 503, 504}
+
+
+def erro_transitorio(erro):
+    """Indica se vale a pena repetir uma chamada que falhou com o erro informado."""
+    from google.genai import errors
+
+    if isinstance(erro, errors.APIError):
+        return erro.code in CODIGOS_TRANSITORIOS
+    # Falhas de rede/timeout do cliente HTTP não são erros da API e costumam ser transitórias
+    nome = type(erro).__name__
+    return isinstance(erro, (TimeoutError, ConnectionError)) or nome.endswith(('Timeout', 'TimeoutException', 'ConnectError', 'NetworkError', 'RemoteProtocolError'))
+
+
+def _segundos(valor):
+    """Converte um tempo de espera da API (ex: '37s', '1.5s', 12) em segundos."""
+    if isinstance(valor, (int, float)):
+        return float(valor)
+    match = re.match(r'^\s*([\d.]+)\s*s?\s*$', str(valor))
+    return float(match.group(1)) if match else None
+
+
+def _busca_retry_delay(dados):
+    """Procura recursivamente o campo 'retryDelay' (google.rpc.RetryInfo) nos detalhes do erro."""
+    if isinstance(dados, dict):
+        if 'retryDelay' in dados:
+            return _segundos(dados['retryDelay'])
+        dados = list(dados.values())
+    if isinstance(dados, list):
+        for item in dados:
+            espera = _busca_retry_delay(item)
+            if espera is not None:
+                return espera
+    return None
+
+
+def extrai_retry_after(erro):
+    """
+    Extrai o tempo de espera sugerido pelo servidor, em segundos, ou None se não houver.
+
+    Considera, nesta ordem, o RetryInfo dos detalhes do erro, o cabeçalho HTTP 'Retry-After'
+    e a sugestão textual da mensagem (ex: 'Please retry in 37.5s').
+    """
+    espera = _busca_retry_delay(getattr(erro, 'details', None))
+    if espera is not None:
+        return espera
+
+    headers = getattr(getattr(erro, 'response', None), 'headers', None)
+    if headers is not None:
+        valor = headers.get('retry-after')
+        if valor:
+            espera = _segundos(valor)
+            if espera is None:
+                try:
+                    espera = max(0.0, parsedate_to_datetime(valor).timestamp() - time.time())
+                except (TypeError, ValueError):
+                    espera = None
+            if espera is not None:
+                return espera
+
+    match = re.search(r'retry in ([\d.]+)\s*s', str(erro), re.IGNORECASE)
+    return float(match.group(1)) if match else None
+
+
+def calcula_espera(tentativa, retry_after=None, espera_base=2.0, espera_maxima=60.0):
+    """
+    Calcula a espera antes da próxima tentativa: backoff exponencial com jitter.
+
+    O teto dobra a cada tentativa (2s, 4s, 8s, ...) até `espera_maxima`, e a espera é sorteada
+    entre metade do teto e o teto, para que workers concorrentes não voltem todos ao mesmo tempo.
+    Se o servidor sugeriu um tempo de espera, ele é respeitado como mínimo.
+    """
+    teto = min(espera_maxima, espera_base * 2 ** (tentativa - 1))
+    espera = random.uniform(teto / 2, teto)
+    if retry_after is not None:
+        espera = max(espera, retry_after + random.uniform(0, 1))
+    return espera
+
+
+class CircuitBreaker:
+    """
+    Disjuntor compartilhado entre as chamadas ao Gemini.
+
+    Acompanha o resultado das últimas `janela` chamadas. Quando a proporção de falhas transitórias
+    atinge `taxa_erro_maxima`, o disjuntor abre e todas as chamadas (de qualquer thread) aguardam
+    `tempo_abertura` segundos, ou o tempo sugerido pelo servidor, antes de prosseguir.
+    """
+    def __init__(self, janela=20, taxa_erro_maxima=0.5, minimo_chamadas=5, tempo_abertura=30.0):
+        self.janela = janela
+        self.taxa_erro_maxima = taxa_erro_maxima
+        self.minimo_chamadas = minimo_chamadas
+        self.tempo_abertura = tempo_abertura
+        self.aberturas = 0
+
+        self._resultados = deque(maxlen=janela)
+        self._aberto_ate = 0.0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"CircuitBreaker(aberto={self.aberto}, taxa_erro={self.taxa_erro:.2f}, aberturas={self.aberturas})"
+
+    @property
+    def taxa_erro(self):
+        with self._lock:
+            if not self._resultados:
+                return 0.0
+            return self._resultados.count(False) / len(self._resultados)
+
+    @property
+    def aberto(self):
+        return self.tempo_restante() > 0
+
+    def tempo_restante(self):
+        with self._lock:
+            return max(0.0, self._aberto_ate - time.monotonic())
+
+    def registra_sucesso(self):
+        with self._lock:
+            self._resultados.append(True)
+
+    def registra_falha(self, retry_after=None):
+        with self._lock:
+            self._resultados.append(False)
+            falhas = self._resultados.count(False)
+            if len(self._resultados) >= self.minimo_chamadas and falhas / len(self._resultados) >= self.taxa_erro_maxima:
+                pausa = max(self.tempo_abertura, retry_after or 0)
+                self._aberto_ate = max(self._aberto_ate, time.monotonic() + pausa)
+                self._resultados.clear()
+                self.aberturas += 1
+
+    def aguarda(self):
+        """Bloqueia enquanto o disjuntor estiver aberto. Retorna o tempo aguardado, em segundos."""
+        espera = self.tempo_restante()
+        if espera > 0:
+            time.sleep(espera)
+        return espera
+
+
+# Instância única, compartilhada por todas as chamadas do processo
+circuit_breaker = CircuitBreaker()
+
+
+# Quantidade mínima de tokens aceita pela API para criar um cache de contexto explícito
+MINIMO_TOKENS_CACHE_CONTEXTO = {
+    'gemini-2.5-flash': 1024,
+    'gemini-2.5-pro': 4096,
+}
+
+
+def estima_tokens(texto):
+    """Estimativa local e conservadora da quantidade de tokens de um texto (~4 caracteres por token)."""
+    return len(texto or '') // 4
+
+
+# Limite de tokens de entrada por requisição (janela de contexto) de cada modelo
+LIMITE_TOKENS_ENTRADA = {
+    'gemini-2.5-flash': 1_048_576,
+    'gemini-2.5-flash-latest': 1_048_576,
+    'gemini-2.5-pro': 1_048_576,
+}
+
+# Preço de tabela em US$ por milhão de tokens (entrada, saída), usado apenas nas projeções de custo
+PRECO_POR_MILHAO_TOKENS = {
+    'gemini-2.5-flash': (0.30, 2.50),
+    'gemini-2.5-flash-latest': (0.30, 2.50),
+    'gemini-2.5-pro': (1.25, 10.00),
+}
+
+# Desempenho típico observado de cada modelo, usado apenas nas projeções de tempo:
+# latência até o primeiro token (s), tokens de entrada processados por segundo e tokens de saída gerados por segundo
+DESEMPENHO_ESTIMADO = {
+    'gemini-2.5-flash': (2.0, 50_000, 200),
+    'gemini-2.5-flash-latest': (2.0, 50_000, 200),
+    'gemini-2.5-pro': (6.0, 20_000, 80),
+}
+
+# Intervalo mínimo (segundos) entre as exibições do texto parcial de uma geração em streaming
+INTERVALO_TEXTO_PARCIAL = 0.5
+
+# Tamanho máximo de um arquivo de contexto aceito pela Files API
+TAMANHO_MAXIMO_ARQUIVO = 2 * 1024 ** 3
+
+# Tokens cobrados por página de PDF e por imagem, independentemente do tamanho em bytes
+TOKENS_POR_PAGINA_PDF = 258
+TOKENS_POR_IMAGEM = 258
+BYTES_POR_PAGINA_PDF = 50 * 1024  # Tamanho médio de página, quando o conteúdo do PDF não é lido
+
+EXTENSOES_IMAGEM = ('.png', '.jpg', '.jpeg', '.webp', '.heic', '.heif', '.gif', '.bmp')
+
+
+def estima_tokens_arquivo(nome, tamanho, conteudo=None):
+    """
+    Estimativa local dos tokens consumidos por um arquivo de contexto, sem enviá-lo à API.
+
+    PDFs são contados por página (lidas do `conteudo` com o pypdf, se informado e legível; senão,
+    pelo tamanho) e imagens por unidade; os demais arquivos são tratados como texto.
+    """
+    extensao = os.path.splitext(nome.lower())[1]
+    if extensao == '.pdf':
+        paginas = None
+        if conteudo is not None:
+            from pypdf import PdfReader
+            try:
+                # As páginas podem estar em object streams comprimidos (PDF 1.5+): só o parser as encontra
+                paginas = len(PdfReader(io.BytesIO(conteudo)).pages)
+            except Exception:
+                pass
+        if paginas is None:
+            paginas = tamanho // BYTES_POR_PAGINA_PDF
+        return max(paginas, 1) * TOKENS_POR_PAGINA_PDF
+    if extensao in EXTENSOES_IMAGEM:
+        return TOKENS_POR_IMAGEM
+    return tamanho // 4
+
+
+def conta_tokens(client, modelo, texto):
+    """
+    Conta os tokens de um texto com o endpoint de contagem da API. Se a chamada falhar, usa a
+    estimativa local. Retorna a quantidade e a origem ('api' ou 'estimativa').
+    """
+    try:
+        return client.models.count_tokens(model=modelo, contents=texto).total_tokens, 'api'
+    except Exception:
+        return estima_tokens(texto), 'estimativa'
+
+
+def prefixo_comum(textos):
+    """
+    Retorna o maior prefixo comum a todos os textos, recortado no último fim de linha
+    (ou espaço) para não partir uma palavra ao meio.
+    """
+    textos = list(textos)
+    if len(textos) < 2:
+        return ''
+    # Recorta antes do fim mesmo quando os textos são idênticos, para que cada requisição
+    # ainda tenha um sufixo próprio a enviar
+    prefixo = os.path.commonprefix(textos).rstrip()
+    corte = prefixo.rfind('\n')
+    if corte < 0:
+        corte = prefixo.rfind(' ')
+    return prefixo[:corte + 1] if corte >= 0 else ''
+
+
+def arquivos_comuns(listas_arquivos):
+    """Retorna, na ordem da primeira lista, os arquivos presentes em todas as listas."""
+    listas_arquivos = list(listas_arquivos)
+    if len(listas_arquivos) < 2:
+        return []
+    comuns = set(listas_arquivos[0]).intersection(*listas_arquivos[1:])
+    return [nome for nome in dict.fromkeys(listas_arquivos[0]) if nome in comuns]
+
+
+class ContextoCompartilhado:
+    """
+    Parte invariante das requisições de uma execução: o prefixo do prompt renderizado e os
+    arquivos de contexto comuns a todos os auditados, armazenados uma única vez no cache de
+    contexto do Gemini (`nome_cache`). Cada requisição envia apenas o sufixo do prompt e os
+    arquivos específicos do auditado, referenciando o cache.
+
+    Se os arquivos comuns chegaram a ser enviados mas o cache não foi criado, os objetos de arquivo
+    ficam em `enviados` (nome -> arquivo da API) e são reaproveitados nas requisições, sem novo upload.
+    """
+    def __init__(self, prefixo='', arquivos=None, nome_cache=None, motivo=None, enviados=None):
+        self.prefixo = prefixo
+        self.arquivos = arquivos if arquivos is not None else []
+        self.nome_cache = nome_cache
+        self.motivo = motivo  # Por que o cache não foi criado, quando for o caso
+        self.enviados = enviados if enviados is not None else {}
+
+    def __repr__(self):
+        return (f"ContextoCompartilhado(nome_cache='{self.nome_cache}', tamanho_prefixo={len(self.prefixo)}, "
+                f"arquivos={self.arquivos}, motivo='{self.motivo}')")
+
+    @property
+    def ativo(self):
+        return self.nome_cache is not None
+
+    def sufixo(self, prompt_text):
+        """Parte do prompt que não está no cache."""
+        if self.ativo and prompt_text.startswith(self.prefixo):
+            return prompt_text[len(self.prefixo):]
+        return prompt_text
+
+    def arquivos_especificos(self, nomes_arquivos):
+        """Arquivos do auditado que ainda precisam de upload: os que não estão no cache nem já foram enviados."""
+        if not self.ativo:
+            return [nome for nome in nomes_arquivos if nome not in self.enviados]
+        return [nome for nome in nomes_arquivos if nome not in self.arquivos]
+
+    def arquivos_enviados(self, nomes_arquivos):
+        """Objetos de arquivo já enviados que o auditado usa fora do cache (quando o cache não foi criado)."""
+        if self.ativo:
+            return []
+        return [self.enviados[nome] for nome in nomes_arquivos if nome in self.enviados]
+
+    def remove(self, client):
+        """Apaga o cache de contexto na API, se existir."""
+        if self.ativo:
+            try:
+                client.caches.delete(name=self.nome_cache)
+            except Exception:
+                pass  # O cache expira sozinho pelo TTL
+            self.nome_cache = None
+
+
+def cria_contexto_compartilhado(client, modelo, prompts, arquivos_por_auditado, envia_arquivo, ttl_segundos=3600):
+    """
+    Detecta o prefixo invariante dos prompts e os arquivos comuns a todos os auditados e cria
+    um cache de contexto com eles.
+
+    `prompts` e `arquivos_por_auditado` são dicionários indexados pela sigla do auditado.
+    `envia_arquivo(nome)` faz o upload de um arquivo e retorna o objeto de arquivo da API.
+
+    Retorna um `ContextoCompartilhado`; se não houver conteúdo suficiente para o cache ou a API
+    recusar a criação, o contexto volta inativo com o `motivo` preenchido e as requisições seguem
+    sem cache, reaproveitando os arquivos comuns que já tiverem sido enviados.
+    """
+    siglas = list(prompts)
+    if len(siglas) < 2:
+        return ContextoCompartilhado(motivo="é necessário mais de um auditado a analisar")
+
+    prefixo = prefixo_comum(prompts[s] for s in siglas)
+    arquivos = arquivos_comuns(arquivos_por_auditado.get(s, []) for s in siglas)
+
+    minimo_tokens = MINIMO_TOKENS_CACHE_CONTEXTO.get(modelo, max(MINIMO_TOKENS_CACHE_CONTEXTO.values()))
+    if not arquivos and estima_tokens(prefixo) < minimo_tokens:
+        return ContextoCompartilhado(prefixo, motivo=f"a parte comum dos prompts (~{estima_tokens(prefixo)} tokens) é menor que o mínimo de {minimo_tokens} tokens")
+
+    from google.genai import types
+
+    enviados = {}
+    try:
+        for nome in arquivos:
+            enviados[nome] = envia_arquivo(nome)
+        cache = client.caches.create(
+            model=modelo,
+            config=types.CreateCachedContentConfig(
+                contents=([prefixo] if prefixo else []) + list(enviados.values()),
+                display_name='argos-contexto-compartilhado',
+                ttl=f"{int(ttl_segundos)}s",
+            )
+        )
+    except Exception as e:
+        return ContextoCompartilhado(prefixo, arquivos, motivo=f"a API recusou a criação do cache: {e}", enviados=enviados)
+
+    return ContextoCompartilhado(prefixo, arquivos, nome_cache=cache.name, enviados=enviados)
+
+
+class RespostaStream:
+    """Resposta completa montada a partir dos trechos de uma geração em streaming."""
+    def __init__(self, text, usage_metadata=None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+    def __repr__(self):
+        return f"RespostaStream(tamanho_texto={len(self.text or '')})"
+
+
+def _fecha_json(texto):
+    """Completa um JSON truncado fechando a string e os colchetes/chaves que ficaram abertos."""
+    pilha = []
+    em_string = False
+    escape = False
+    for char in texto:
+        if em_string:
+            if escape:
+                escape = False
+            elif char == '\\':
+                escape = True
+            elif char == '"':
+                em_string = False
+        elif char == '"':
+            em_string = True
+        elif char in '{[':
+            pilha.append('}' if char == '{' else ']')
+        elif char in '}]' and pilha:
+            pilha.pop()
+
+    if em_string:
+        texto += '\\' if escape else ''
+        texto += '"'
+    return texto + ''.join(reversed(pilha))
+
+
+def parse_json_parcial(texto):
+    """
+    Interpreta um JSON ainda incompleto (recebido em streaming), retornando a melhor aproximação
+    possível do objeto, ou None se ainda não houver nada interpretável.
+
+    Remove cercas de código Markdown, fecha strings e estruturas abertas e, se ainda assim não for
+    válido (ex: chave sem valor), recua até a última vírgula ou abertura e tenta de novo.
+    """
+    texto = re.sub(r'^\s*```(?:json)?\s*', '', texto or '')
+    texto = re.sub(r'\s*```\s*$', '', texto)
+    if not texto.strip():
+        return None
+
+    try:
+        return json.loads(texto)
+    except json.JSONDecodeError:
+        pass
+
+    candidato = texto
+    for _ in range(50):
+        try:
+            return json.loads(_fecha_json(candidato.rstrip().rstrip(',:')))
+        except json.JSONDecodeError:
+            corte = max(candidato.rfind(','), candidato.rfind('{'), candidato.rfind('['))
+            if corte <= 0:
+                return None
+            # Mantém a abertura, descarta o elemento incompleto depois dela
+            candidato = candidato[:corte + 1] if candidato[corte] in '{[' else candidato[:corte]
+    return None
+
+
+def _configuracao_geracao(temperature, response_format_choice, cached_content=None, esquema=None):
+    """Monta a configuração de geração usada nas chamadas ao Gemini."""
+    from google.genai import types
+
+    generation_config = types.GenerateContentConfig(
+        max_output_tokens=65536, # Usando o valor sugerido de 65536
+        temperature=temperature,
+    )
+
+    if response_format_choice == 'Estruturada':
+        generation_config.response_mime_type = 'application/json'
+        if esquema:
+            # O modelo passa a gerar somente JSON que segue o esquema
+            generation_config.response_json_schema = esquema
+
+    if cached_content:
+        generation_config.cached_content = cached_content
+
+    return generation_config
+
+
+def _motivo_resposta_vazia(response):
+    """Motivo informado pela API para uma resposta sem texto (bloqueio do prompt ou término da geração), se houver."""
+    bloqueio = getattr(getattr(response, 'prompt_feedback', None), 'block_reason', None)
+    if bloqueio:
+        return f"prompt bloqueado: {bloqueio}"
+    candidatos = getattr(response, 'candidates', None) or []
+    termino = getattr(candidatos[0], 'finish_reason', None) if candidatos else None
+    return f"término da geração: {termino}" if termino else "sem candidatos na resposta"
+
+
+def _executa_com_retentativas(chamada, max_tentativas, ao_falhar, ao_terminar=None):
+    """
+    Executa `chamada()` aplicando a política de novas tentativas e o disjuntor descritos em `avalia_gemini`.
+
+    `ao_terminar(tentativas, latencia, response, error_message)` é chamado ao final, com o número de
+    tentativas feitas e a duração da última delas (usado pela telemetria).
+    """
+    def termina(tentativa, inicio, response, error_message):
+        if ao_terminar:
+            ao_terminar(tentativa, time.time() - inicio, response, error_message)
+        return response, error_message
+
+    for tentativa in range(1, max_tentativas + 1):
+        circuit_breaker.aguarda()
+        inicio = time.time()
+        try:
+            response = chamada()
+            circuit_breaker.registra_sucesso()
+            # Resposta sem texto (ex: bloqueada pelos filtros de segurança) é erro: não pode ir para o cache
+            # nem ser registrada como análise concluída, senão nunca seria refeita
+            if not (response.text or '').strip():
+                return termina(tentativa, inicio, response, f"A API do Gemini retornou uma resposta vazia ({_motivo_resposta_vazia(response)}).")
+            return termina(tentativa, inicio, response, None)
+
+        except Exception as e:
+            error_message = f"Erro ao chamar a API Gemini: {e}"
+
+            if not erro_transitorio(e):
+                return termina(tentativa, inicio, None, f"{error_message} (erro permanente, a chamada não será repetida)")
+
+            retry_after = extrai_retry_after(e)
+            circuit_breaker.registra_falha(retry_after)
+            if tentativa == max_tentativas:
+                return termina(tentativa, inicio, None, error_message)
+
+            espera = calcula_espera(tentativa, retry_after)
+            if ao_falhar:
+                ao_falhar(tentativa, max_tentativas, error_message, espera)
+            time.sleep(espera)
+
+
+def _registro_telemetria(telemetria, modelo, rotulo, primeiro_token=None):
+    """Monta o `ao_terminar` que registra a requisição em `telemetria` (ou None, sem telemetria)."""
+    if telemetria is None:
+        return None
+    inicio = time.time()
+
+    def ao_terminar(tentativas, latencia, response, error_message):
+        telemetria.registra_geracao(modelo, rotulo, inicio, latencia, tentativas, response, error_message,
+                                    primeiro_token() if primeiro_token else None)
+    return ao_terminar
+
+
+def avalia_gemini(client, prompt_text: str, modelo, temperature, response_format_choice, file_objects = [],
+                  max_tentativas=1, ao_falhar=None, cached_content=None, telemetria=None, rotulo=None, esquema=None):
+    """
+    Chama a API do Gemini com a configuração apropriada.
+    Retorna a resposta do modelo e uma mensagem de erro (se houver); resposta sem texto é tratada como erro.
+
+    Erros transitórios (cota, sobrecarga, timeout) são repetidos até `max_tentativas` vezes, com backoff
+    exponencial e jitter, respeitando o tempo de espera sugerido pelo servidor. Erros permanentes
+    (ex: requisição inválida) retornam imediatamente. Antes de cada tentativa, aguarda o disjuntor
+    compartilhado (`gemini.circuit_breaker`) caso a taxa de erros esteja alta.
+
+    `ao_falhar(tentativa, max_tentativas, mensagem_erro, espera)` é chamado antes de cada nova tentativa.
+    `cached_content` é o nome de um cache de contexto (ver `gemini.cria_contexto_compartilhado`) que
+    antecede o prompt e os arquivos informados.
+    `telemetria` (um `telemetria.Telemetria`) recebe o registro da requisição, identificada por `rotulo`.
+    `esquema` é o esquema JSON imposto à resposta no formato 'Estruturada'.
+    """
+    contents = [prompt_text] + file_objects
+    generation_config = _configuracao_geracao(temperature, response_format_choice, cached_content, esquema)
+
+    # Cria o conteúdo para a API
+    return _executa_com_retentativas(
+        lambda: client.models.generate_content(model=modelo, contents=contents, config=generation_config),
+        max_tentativas, ao_falhar, _registro_telemetria(telemetria, modelo, rotulo)
+    )
+
+
+def avalia_gemini_stream(client, prompt_text: str, modelo, temperature, response_format_choice, file_objects = [],
+                         ao_receber=None, max_tentativas=1, ao_falhar=None, cached_content=None,
+                         telemetria=None, rotulo=None, esquema=None, intervalo_parcial=INTERVALO_TEXTO_PARCIAL):
+    """
+    Variante de `avalia_gemini` que usa a geração em streaming.
+
+    `ao_receber(texto_parcial)` é chamado com todo o texto acumulado até o momento, permitindo exibir a
+    resposta enquanto ela é gerada: no máximo uma vez a cada `intervalo_parcial` segundos e uma última vez
+    ao fim do stream, pois exibir (e, no formato 'Estruturada', interpretar) o texto inteiro a cada trecho
+    atrasaria o consumo do stream nas respostas longas. Se uma tentativa falhar no meio do stream, o texto
+    parcial é descartado e a próxima tentativa recomeça do zero.
+    Retorna um `gemini.RespostaStream` (com os atributos `text` e `usage_metadata`) e a mensagem de erro, se houver.
+    Na telemetria, registra também o tempo até o primeiro trecho da última tentativa.
+    """
+    contents = [prompt_text] + file_objects
+    generation_config = _configuracao_geracao(temperature, response_format_choice, cached_content, esquema)
+    primeiro_token = {}
+
+    def chamada():
+        trechos = []
+        ultimo_trecho = None
+        inicio = time.time()
+        ultima_exibicao, exibidos = 0.0, 0
+        primeiro_token.clear()
+        for trecho in client.models.generate_content_stream(model=modelo, contents=contents, config=generation_config):
+            ultimo_trecho = trecho
+            if trecho.text:
+                primeiro_token.setdefault('segundos', time.time() - inicio)
+                trechos.append(trecho.text)
+                if ao_receber and time.monotonic() - ultima_exibicao >= intervalo_parcial:
+                    ultima_exibicao, exibidos = time.monotonic(), len(trechos)
+                    ao_receber(''.join(trechos))
+        texto = ''.join(trechos)
+        if ao_receber and exibidos < len(trechos):
+            ao_receber(texto)
+        return RespostaStream(texto, getattr(ultimo_trecho, 'usage_metadata', None))
+
+    return _executa_com_retentativas(chamada, max_tentativas, ao_falhar,
+                                     _registro_telemetria(telemetria, modelo, rotulo, lambda: primeiro_token.get('segundos')))
@@ -0,0 +1,195 @@
+import os
+import time
+import uuid
+import pickle
+import sqlite3
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+
+class JobCancelado(Exception):
+    """Lançada dentro do job quando o usuário pede o cancelamento."""
+
+
+STATUS_PENDENTE = 'pendente'
+STATUS_EXECUTANDO = 'executando'
+STATUS_CONCLUIDO = 'concluido'
+STATUS_ERRO = 'erro'
+STATUS_CANCELADO = 'cancelado'
+STATUS_INTERROMPIDO = 'interrompido'
+
+STATUS_FINAIS = {STATUS_CONCLUIDO, STATUS_ERRO, STATUS_CANCELADO, STATUS_INTERROMPIDO}
+
+
+def _conecta(caminho_db):
+    conn = sqlite3.connect(caminho_db, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    return conn
+
+
+def _cria_tabela(caminho_db):
+    with _conecta(caminho_db) as conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                tipo TEXT NOT NULL,
+                descricao TEXT,
+                status TEXT NOT NULL,
+                progresso REAL DEFAULT 0,
+                mensagem TEXT,
+                log TEXT DEFAULT '',
+                erro TEXT,
+                caminho_resultado TEXT,
+                criado_em REAL,
+                iniciado_em REAL,
+                finalizado_em REAL
+            )
+        ''')
+
+
+class Progresso:
+    """
+    Canal usado pela função do job para informar o andamento.
+
+    É passado à função como argumento nomeado `progresso`. Cada chamada a `atualiza` grava na tabela
+    de jobs e verifica se o usuário pediu o cancelamento, caso em que lança `JobCancelado`.
+    """
+    def __init__(self, caminho_db, job_id):
+        self.caminho_db = caminho_db
+        self.job_id = job_id
+
+    def __repr__(self):
+        return f"Progresso(job_id='{self.job_id}')"
+
+    def atualiza(self, fracao=None, mensagem=None):
+        with _conecta(self.caminho_db) as conn:
+            status = conn.execute('SELECT status FROM jobs WHERE id = ?', (self.job_id,)).fetchone()['status']
+            if status == STATUS_CANCELADO:
+                raise JobCancelado(f"Job {self.job_id} cancelado pelo usuário.")
+            if fracao is not None:
+                conn.execute('UPDATE jobs SET progresso = ? WHERE id = ?', (float(fracao), self.job_id))
+            if mensagem is not None:
+                conn.execute("UPDATE jobs SET mensagem = ?, log = log || ? WHERE id = ?",
+                             (mensagem, f"{mensagem}\n", self.job_id))
+
+
+def _executa_job(caminho_db, caminho_resultado, job_id, funcao, args, kwargs):
+    """Ponto de entrada executado no processo worker."""
+    with _conecta(caminho_db) as conn:
+        conn.execute('UPDATE jobs SET status = ?, iniciado_em = ? WHERE id = ? AND status = ?',
+                     (STATUS_EXECUTANDO, time.time(), job_id, STATUS_PENDENTE))
+        status = conn.execute('SELECT status FROM jobs WHERE id = ?', (job_id,)).fetchone()['status']
+    if status != STATUS_EXECUTANDO:
+        return  # Cancelado antes de começar
+
+    try:
+        resultado = funcao(*args, progresso=Progresso(caminho_db, job_id), **kwargs)
+        with open(caminho_resultado, 'wb') as f:
+            pickle.dump(resultado, f)
+        status, erro = STATUS_CONCLUIDO, None
+    except JobCancelado:
+        status, erro = STATUS_CANCELADO, None
+    except Exception as e:
+        status, erro = STATUS_ERRO, f"{e}\n\n{traceback.format_exc()}"
+
+    with _conecta(caminho_db) as conn:
+        conn.execute('UPDATE jobs SET status = ?, erro = ?, progresso = CASE WHEN ? THEN 1 ELSE progresso END, '
+                     'caminho_resultado = ?, finalizado_em = ? WHERE id = ?',
+                     (status, erro, status == STATUS_CONCLUIDO, caminho_resultado if status == STATUS_CONCLUIDO else None,
+                      time.time(), job_id))
+
+
+class GerenciadorJobs:
+    """
+    Executa tarefas demoradas (auditoria, geração de relatórios, análises com IA) em um pool de
+    processos, fora da thread do script do Streamlit, para que não sejam abortadas por reruns ou
+    troca de página.
+
+    Os jobs ficam registrados em uma tabela SQLite (`tmp/jobs/jobs.sqlite`) com status, progresso e log;
+    o resultado de cada job concluído é gravado em disco (pickle). As páginas submetem jobs e
+    consultam o andamento, então vários analistas podem enfileirar trabalho sem bloquear a interface
+    uns dos outros. Deve existir uma única instância por servidor (ver `utils.obtem_gerenciador_jobs`).
+    """
+    def __init__(self, diretorio=os.path.join('tmp', 'jobs'), max_workers=2):
+        self.diretorio = diretorio
+        self.caminho_db = os.path.join(diretorio, 'jobs.sqlite')
+        self.max_workers = max_workers
+        os.makedirs(self.diretorio, exist_ok=True)
+        _cria_tabela(self.caminho_db)
+
+        # Jobs que estavam na fila ou em execução quando o servidor anterior parou não serão retomados
+        with _conecta(self.caminho_db) as conn:
+            conn.execute('UPDATE jobs SET status = ?, finalizado_em = ? WHERE status IN (?, ?)',
+                         (STATUS_INTERROMPIDO, time.time(), STATUS_PENDENTE, STATUS_EXECUTANDO))
+
+        # 'spawn' evita herdar as threads do servidor do Streamlit no processo filho
+        self._pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+
+    def __repr__(self):
+        return f"GerenciadorJobs(diretorio='{self.diretorio}', max_workers={self.max_workers})"
+
+    def submete(self, funcao, *args, tipo, descricao='', **kwargs):
+        """
+        Enfileira `funcao(*args, progresso=..., **kwargs)` e retorna o id do job.
+
+        A função e os argumentos precisam ser serializáveis com pickle (funções definidas no nível de módulo).
+        """
+        job_id = uuid.uuid4().hex
+        caminho_resultado = os.path.join(self.diretorio, f"{job_id}.pkl")
+        with _conecta(self.caminho_db) as conn:
+            conn.execute('INSERT INTO jobs (id, tipo, descricao, status, criado_em) VALUES (?, ?, ?, ?, ?)',
+                         (job_id, tipo, descricao, STATUS_PENDENTE, time.time()))
+
+        future = self._pool.submit(_executa_job, self.caminho_db, caminho_resultado, job_id, funcao, args, kwargs)
+        future.add_done_callback(lambda f: self._verifica_falha_worker(job_id, f))
+        return job_id
+
+    def _verifica_falha_worker(self, job_id, future):
+        """Marca como erro os jobs cujo processo worker morreu sem registrar o resultado."""
+        erro = future.exception()
+        if erro is None:
+            return
+        with _conecta(self.caminho_db) as conn:
+            conn.execute('UPDATE jobs SET status = ?, erro = ?, finalizado_em = ? WHERE id = ? AND status NOT IN (?, ?, ?, ?)',
+                         (STATUS_ERRO, f"Falha no processo worker: {erro}", time.time(), job_id, *STATUS_FINAIS))
+
+    def status(self, job_id):
+        """Retorna o registro do job como dicionário, ou None se não existir."""
+        with _conecta(self.caminho_db) as conn:
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def lista(self, tipo=None, limite=20):
+        """Lista os jobs mais recentes, opcionalmente filtrando pelo tipo."""
+        with _conecta(self.caminho_db) as conn:
+            if tipo:
+                rows = conn.execute('SELECT * FROM jobs WHERE tipo = ? ORDER BY criado_em DESC LIMIT ?', (tipo, limite)).fetchall()
+            else:
+                rows = conn.execute('SELECT * FROM jobs ORDER BY criado_em DESC LIMIT ?', (limite,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def resultado(self, job_id):
+        """Carrega o resultado de um job concluído."""
+        job = self.status(job_id)
+        if not job or job['status'] != STATUS_CONCLUIDO:
+            raise ValueError(f"Job {job_id} não está concluído.")
+        with open(job['caminho_resultado'], 'rb') as f:
+            return pickle.load(f)
+
+    def cancela(self, job_id):
+        """Pede o cancelamento do job. Jobs em execução param na próxima atualização de progresso."""
+        with _conecta(self.caminho_db) as conn:
+            conn.execute('UPDATE jobs SET status = ?, finalizado_em = ? WHERE id = ? AND status IN (?, ?)',
+                         (STATUS_CANCELADO, time.time(), job_id, STATUS_PENDENTE, STATUS_EXECUTANDO))
+
+    def remove(self, job_id):
+        """Remove o job finalizado da tabela e apaga o arquivo de resultado."""
+        job = self.status(job_id)
+        if not job or job['status'] not in STATUS_FINAIS:
+            return
+        if job['caminho_resultado'] and os.path.exists(job['caminho_resultado']):
+            os.remove(job['caminho_resultado'])
+        with _conecta(self.caminho_db) as conn:
+            conn.execute('DELETE FROM jobs WHERE id = ?', (job_id,))
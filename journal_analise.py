@@ -0,0 +1,111 @@
+import io
+import os
+import json
+import time
+import threading
+
+import pandas as pd
+
+from cache_respostas import hash_conteudo
+
+
+def id_execucao(**configuracao):
+    """
+    Gera o identificador de uma execução a partir da sua configuração (modelo, temperatura, formato,
+    template do prompt, hashes da planilha e dos arquivos de contexto...). Execuções com a mesma
+    configuração compartilham o mesmo journal e podem ser retomadas uma pela outra.
+    """
+    return hash_conteudo(json.dumps(configuracao, sort_keys=True, default=str))
+
+
+class JournalAnalise:
+    """
+    Journal em disco (JSONL) dos auditados já analisados em uma execução.
+
+    Cada resultado concluído é acrescentado como uma linha e sincronizado com o disco imediatamente,
+    de modo que sobreviva a reruns do Streamlit, queda da sessão do navegador ou reinício do servidor.
+    Cada registro guarda o hash do prompt renderizado, para que um auditado só seja retomado se o
+    prompt dele não tiver mudado.
+    """
+    def __init__(self, id_execucao, diretorio=os.path.join('tmp', 'journal_gemini')):
+        self.id_execucao = id_execucao
+        self.caminho = os.path.join(diretorio, f"{id_execucao}.jsonl")
+        self._lock = threading.Lock()
+        os.makedirs(diretorio, exist_ok=True)
+
+    def __repr__(self):
+        return f"JournalAnalise(id_execucao='{self.id_execucao}', caminho='{self.caminho}')"
+
+    def carrega(self):
+        """Retorna um dicionário sigla -> registro com os auditados já concluídos."""
+        registros = {}
+        if not os.path.exists(self.caminho):
+            return registros
+
+        with open(self.caminho, 'r', encoding='utf-8') as f:
+            for linha in f:
+                try:
+                    registro = json.loads(linha)
+                except json.JSONDecodeError:
+                    # Linha incompleta de uma gravação interrompida: é ignorada e o auditado será reanalisado
+                    continue
+                registros[registro['auditado_sigla']] = registro
+        return registros
+
+    def registra(self, sigla, nome, prompt_text, resposta, modelo=None):
+        """Acrescenta ao journal o resultado (DataFrame ou texto) de um auditado."""
+        if isinstance(resposta, pd.DataFrame):
+            tipo, conteudo = 'dataframe', resposta.to_json(orient='split', date_format='iso', force_ascii=False)
+        else:
+            tipo, conteudo = 'texto', str(resposta)
+
+        registro = {
+            'auditado_sigla': sigla,
+            'auditado_nome': nome,
+            'prompt_hash': hash_conteudo(prompt_text),
+            'modelo': modelo,
+            'tipo': tipo,
+            'conteudo': conteudo,
+            'registrado_em': time.time(),
+        }
+        linha = json.dumps(registro, ensure_ascii=False, default=str) + '\n'
+
+        with self._lock:
+            # Se a última gravação foi interrompida no meio da linha, começa em uma linha nova
+            # para não corromper também este registro
+            if os.path.exists(self.caminho) and os.path.getsize(self.caminho) > 0:
+                with open(self.caminho, 'rb') as f:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b'\n':
+                        linha = '\n' + linha
+
+            with open(self.caminho, 'a', encoding='utf-8') as f:
+                f.write(linha)
+                f.flush()
+                os.fsync(f.fileno())
+
+    @staticmethod
+    def valido_para(registro, prompt_text, modelos=None):
+        """
+        Indica se o registro foi gerado com o mesmo prompt renderizado e, se `modelos` for informado,
+        por um desses modelos (ex: a resposta do modelo rápido da cascata não vale para o modelo principal).
+        """
+        if modelos is not None and registro.get('modelo') not in modelos:
+            return False
+        return registro.get('prompt_hash') == hash_conteudo(prompt_text)
+
+    @staticmethod
+    def resposta(registro):
+        """Reconstrói a resposta (DataFrame ou texto) gravada no registro."""
+        if registro['tipo'] == 'dataframe':
+            df = pd.read_json(io.StringIO(registro['conteudo']), orient='split')
+            if 'data_avaliacao' in df.columns:
+                df['data_avaliacao'] = pd.to_datetime(df['data_avaliacao'])
+            return df
+        return registro['conteudo']
+
+    def remove(self):
+        """Descarta o journal desta execução."""
+        with self._lock:
+            if os.path.exists(self.caminho):
+                os.remove(self.caminho)
@@ -0,0 +1,196 @@
+import queue
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from cache_respostas import chave_requisicao, hash_conteudo
+from gemini import estima_tokens, avalia_gemini
+from extracao_texto import inclui_documentos
+from arquivos_contexto import hash_arquivo
+
+
+PROMPT_TRECHO = """{prompt}
+
+ATENÇÃO: por causa do tamanho dos documentos, você está recebendo apenas o trecho {indice} de {total} do material deste auditado.
+Responda às instruções acima considerando somente o conteúdo deste trecho, no formato pedido. Não presuma nada sobre os
+trechos que não recebeu: as respostas de todos os trechos serão consolidadas depois."""
+
+PROMPT_CONSOLIDACAO = """As instruções abaixo foram aplicadas separadamente a {total} trechos do material de um mesmo auditado,
+gerando as respostas parciais que seguem. Consolide-as em uma única resposta às instruções, no mesmo formato pedido:
+combine as informações complementares, elimine repetições e, havendo conflito entre trechos, prefira a informação mais
+específica e registre a divergência.
+
+<instrucoes>
+{prompt}
+</instrucoes>
+
+{respostas}"""
+
+
+def divide_texto(texto, max_tokens, sobreposicao_tokens=0):
+    """
+    Divide um texto em partes de até `max_tokens` (estimados), cortando de preferência em fim de
+    parágrafo, de linha ou em espaço. Partes consecutivas repetem os últimos `sobreposicao_tokens`
+    da anterior, para não perder o contexto de frases partidas.
+    """
+    max_caracteres = max_tokens * 4
+    sobreposicao = sobreposicao_tokens * 4
+    if len(texto) <= max_caracteres:
+        return [texto]
+
+    partes = []
+    inicio = 0
+    while inicio < len(texto):
+        fim = min(inicio + max_caracteres, len(texto))
+        if fim < len(texto):
+            for separador in ('\n\n', '\n', ' '):
+                corte = texto.rfind(separador, inicio + max_caracteres // 2, fim)
+                if corte >= 0:
+                    fim = corte + len(separador)
+                    break
+        partes.append(texto[inicio:fim])
+        if fim >= len(texto):
+            break
+        inicio = max(fim - sobreposicao, inicio + 1)
+    return partes
+
+
+def divide_documentos(documentos, max_tokens, sobreposicao_tokens=0):
+    """
+    Distribui os documentos (lista de pares nome, texto) em trechos de até `max_tokens`.
+
+    Documentos pequenos são agrupados no mesmo trecho; documentos grandes são divididos em partes
+    identificadas no nome (ex: 'balanco.pdf (parte 2 de 5)'). Retorna a lista de trechos, cada um
+    uma lista de pares nome, texto.
+    """
+    trechos = []
+    atual, tokens_atual = [], 0
+    for nome, texto in documentos:
+        partes = divide_texto(texto, max_tokens, sobreposicao_tokens)
+        for i, parte in enumerate(partes, start=1):
+            rotulo = nome if len(partes) == 1 else f"{nome} (parte {i} de {len(partes)})"
+            tokens = estima_tokens(parte)
+            if atual and tokens_atual + tokens > max_tokens:
+                trechos.append(atual)
+                atual, tokens_atual = [], 0
+            atual.append((rotulo, parte))
+            tokens_atual += tokens
+    if atual:
+        trechos.append(atual)
+    return trechos
+
+
+def _agrupa_respostas(respostas, max_tokens):
+    """Agrupa respostas parciais consecutivas em lotes de até `max_tokens` (ao menos duas por lote)."""
+    grupos = []
+    atual, tokens_atual = [], 0
+    for resposta in respostas:
+        tokens = estima_tokens(resposta)
+        if len(atual) >= 2 and tokens_atual + tokens > max_tokens:
+            grupos.append(atual)
+            atual, tokens_atual = [], 0
+        atual.append(resposta)
+        tokens_atual += tokens
+    if atual:
+        grupos.append(atual)
+    return grupos
+
+
+def executa_mapreduce(client, plano, arquivos, config, cache_respostas, envia, notifica, sigla, telemetria=None):
+    """
+    Analisa um auditado cujos documentos não cabem em uma única requisição (`plano['trechos']`).
+
+    Etapa map: o prompt é aplicado a cada trecho dos documentos, com até `config.trechos_em_paralelo`
+    chamadas simultâneas; os arquivos que não tiveram o texto extraído vão juntos em uma chamada
+    própria. Etapa reduce: as respostas parciais são consolidadas por um prompt de consolidação,
+    em níveis sucessivos se não couberem em uma única chamada.
+
+    Cada chamada tem sua resposta gravada no `cache_respostas`, então uma falha na consolidação
+    não obriga a refazer a etapa map. Retorna (resposta, mensagem de erro), como `avalia_gemini`.
+    As chamadas são registradas em `telemetria`, se informada, identificadas pela sigla e pela etapa.
+    """
+    trechos = plano['trechos']
+    chamadas = [(trecho, []) for trecho in trechos]
+    if plano['arquivos_upload']:
+        chamadas.append(([], plano['arquivos_upload']))
+    total = len(chamadas)
+
+    # As chamadas rodam em threads, mas os eventos são repassados a `notifica` na thread que chamou
+    # esta função (a exibição no Streamlit só funciona na thread do script)
+    eventos = queue.Queue()
+
+    def repassa_eventos():
+        while not eventos.empty():
+            notifica(*eventos.get())
+
+    def aguarda(futuros):
+        pendentes = set(futuros)
+        while pendentes:
+            _, pendentes = wait(pendentes, timeout=0.5)
+            repassa_eventos()
+        return [futuro.result() for futuro in futuros]
+
+    def chave(prompt_text, nomes_arquivos):
+        return chave_requisicao(config.modelo, config.temperature, config.response_format, prompt_text,
+                                [hash_arquivo(arquivos[filename]) for filename in nomes_arquivos], config.esquema_resposta)
+
+    def avalia_cacheado(prompt_text, nomes_arquivos, descricao, file_objects=()):
+        chave_chamada = chave(prompt_text, nomes_arquivos)
+        response = None if config.ignorar_cache else cache_respostas.get(chave_chamada)
+        if response is not None:
+            eventos.put((sigla, 'info', f"{descricao}: recuperado do cache."))
+            return response, None
+
+        def avisa_falha(tentativa, max_tentativas, mensagem, espera):
+            eventos.put((sigla, 'warning', f"{descricao}: tentativa {tentativa}/{max_tentativas} falhou. Erro: {mensagem}. "
+                                           f"Nova tentativa em {espera:.1f} segundos..."))
+
+        response, error_message = avalia_gemini(client, prompt_text, config.modelo, config.temperature, config.response_format,
+                                                list(file_objects), max_tentativas=config.max_tentativas, ao_falhar=avisa_falha,
+                                                telemetria=telemetria, rotulo=f"{sigla} - {descricao}", esquema=config.esquema_resposta)
+        if not error_message:
+            cache_respostas.set(chave_chamada, response.text, {'auditado_sigla': sigla, 'modelo': config.modelo, 'etapa': descricao})
+            eventos.put((sigla, 'info', f"{descricao}: concluído."))
+        return response, error_message
+
+    def prompt_trecho(indice, documentos):
+        return inclui_documentos(PROMPT_TRECHO.format(prompt=plano['rendered_prompt'], indice=indice, total=total), documentos)
+
+    notifica(sigla, 'info', f"✂️ Documentos divididos em {total} trecho(s) de até ~{config.tokens_por_trecho:,} tokens.")
+    with ThreadPoolExecutor(max_workers=max(1, config.trechos_em_paralelo)) as executor:
+        futuros = []
+        for indice, (documentos, nomes_arquivos) in enumerate(chamadas, start=1):
+            prompt_text = prompt_trecho(indice, documentos)
+            # O upload é feito aqui, e só se a resposta do trecho ainda não estiver em cache
+            file_objects = []
+            if nomes_arquivos and (config.ignorar_cache or cache_respostas.get(chave(prompt_text, nomes_arquivos)) is None):
+                file_objects = [envia(arquivos[filename], sigla) for filename in nomes_arquivos]
+            futuros.append(executor.submit(avalia_cacheado, prompt_text, nomes_arquivos, f"Trecho {indice}/{total}", file_objects))
+        resultados = aguarda(futuros)
+
+        erros = [f"trecho {i}: {erro}" for i, (_, erro) in enumerate(resultados, start=1) if erro]
+        if erros:
+            return None, f"Falha na análise por trechos ({'; '.join(erros)})"
+
+        respostas = [response.text for response, _ in resultados]
+        nivel = 1
+        while len(respostas) > 1:
+            grupos = _agrupa_respostas(respostas, config.tokens_por_trecho)
+            futuros = []
+            for indice, grupo in enumerate(grupos, start=1):
+                blocos = '\n\n'.join(f'<resposta_parcial numero="{i}">\n{texto}\n</resposta_parcial>'
+                                     for i, texto in enumerate(grupo, start=1))
+                prompt_text = PROMPT_CONSOLIDACAO.format(total=len(grupo), prompt=plano['rendered_prompt'], respostas=blocos)
+                futuros.append(executor.submit(avalia_cacheado, prompt_text, [], f"Consolidação {indice}/{len(grupos)} (nível {nivel})"))
+            resultados = aguarda(futuros)
+
+            erros = [erro for _, erro in resultados if erro]
+            if erros:
+                return None, f"Falha na consolidação das respostas parciais ({'; '.join(erros)})"
+            respostas = [response.text for response, _ in resultados]
+            nivel += 1
+
+    return resultados[0][0], None
+
+
+def chave_modo_trechos(config):
+    """Identifica, na chave de cache do auditado, que a resposta foi obtida pela análise por trechos."""
+    return hash_conteudo(f"mapreduce:{config.tokens_por_trecho}:{PROMPT_TRECHO}:{PROMPT_CONSOLIDACAO}")
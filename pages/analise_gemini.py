@@ -2,20 +2,23 @@ import io
 import os
 import json
 import time
-import tempfile
 from itertools import islice
 
-from datetime import datetime
 import zipfile
 import streamlit as st
 
 import pandas as pd
-from jinja2 import Environment, BaseLoader, StrictUndefined
-from google import genai
 import re
-from google.genai import types
 
-from utils import avalia_gemini
+from utils import obtem_gerenciador_jobs, acompanha_job, painel_jobs, obtem_cliente_gemini, le_planilha_carregada
+from cache_respostas import CacheRespostas, hash_conteudo
+from journal_analise import JournalAnalise, id_execucao
+from gemini import parse_json_parcial
+from arquivos_contexto import indexa_arquivos
+from telemetria import Telemetria
+from esquema_resposta import carrega_esquema, esquema_de_exemplo, colunas_esquema
+from execucao_gemini import (ConfiguracaoAnalise, prepara_planejamento, estima_execucao, executa_analise, executa_analise_cascata,
+                             executa_analise_job)
 
 st.set_page_config(page_title="Análise de Auditados com IA", layout="wide")
 
@@ -42,8 +45,8 @@ if not api_key:
     st.stop()
 
 try:
-    # Cria o cliente da API Gemini
-    client = genai.Client(api_key=api_key)
+    # Cliente da API Gemini compartilhado entre reruns; o SDK só é carregado depois de informada a chave
+    client = obtem_cliente_gemini(api_key)
 except Exception as e:
     st.error(f"Erro ao criar o cliente da API do Gemini. Verifique se a chave é válida. Detalhes: {e}")
     st.stop()
@@ -63,6 +66,33 @@ selected_model_display = st.selectbox(
 )
 selected_model_id = model_options[selected_model_display]
 
+usar_cascata = st.checkbox(
+    "Usar cascata de modelos (modelo rápido primeiro)",
+    value=False,
+    help="Todos os auditados são analisados primeiro por um modelo mais rápido e barato. Só os que falharem ou não passarem "
+         "na regra de aprovação são reanalisados com o modelo selecionado acima."
+)
+modelo_cascata, campo_confianca, regra_aprovacao = None, None, None
+if usar_cascata:
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        modelo_cascata_display = st.selectbox("Modelo do primeiro nível:", options=list(model_options.keys()))
+        modelo_cascata = model_options[modelo_cascata_display]
+    with col2:
+        campo_confianca = st.text_input(
+            "Campo de confiança (formato Estruturada):",
+            help="Campo da resposta estruturada usado para aprovar o resultado do primeiro nível (ex: confianca). "
+                 "Em branco, só falhas e respostas inválidas são reanalisadas."
+        ) or None
+    with col3:
+        regra_aprovacao = st.text_input(
+            "Regra de aprovação:",
+            value=">= 0.8",
+            help="Condição que o campo de confiança deve satisfazer, na mesma sintaxe das expressões de achado (ex: >= 0.8 ou Alta | Média)."
+        ) or None
+    if modelo_cascata == selected_model_id:
+        st.warning("O modelo do primeiro nível é o mesmo selecionado para a análise; a cascata não trará ganho.")
+
 # --- 2. Entrada do Usuário ---
 st.subheader("2. Forneça o Prompt e os Arquivos de Contexto")
 with st.expander('Exemplos de Prompts Disponíveis'):
@@ -113,20 +143,108 @@ with col2:
         help="Valores mais baixos geram respostas mais determinísticas. Valores mais altos geram respostas mais criativas."
     )
 
+auditados_por_requisicao = 1
+if response_format == "Estruturada":
+    auditados_por_requisicao = st.number_input(
+        "Auditados por requisição:", min_value=1, max_value=50, value=1,
+        help="Agrupa vários auditados em uma única requisição, que retorna um array com a resposta de cada um. Reduz o número de "
+             "requisições (e o consumo da cota de requisições por minuto) em prompts curtos. Auditados com arquivos a enviar e os que "
+             "faltarem na resposta agrupada são analisados individualmente."
+    )
+
+esquema_resposta = None
+if response_format == "Estruturada":
+    modo_esquema = st.radio(
+        "Esquema da resposta:",
+        ("Nenhum", "Esquema JSON", "Derivar de um exemplo"),
+        horizontal=True,
+        help="Com um esquema, o modelo só gera JSON no formato definido, as respostas são validadas localmente (as inválidas são "
+             "solicitadas de novo automaticamente) e todos os auditados resultam em uma planilha com as mesmas colunas."
+    )
+    if modo_esquema != "Nenhum":
+        texto_esquema = st.text_area(
+            "Esquema JSON (JSON Schema):" if modo_esquema == "Esquema JSON" else "Exemplo de resposta (JSON):",
+            height=150,
+            placeholder='{"type": "array", "items": {"type": "object", "properties": {"achado": {"type": "string"}, '
+                        '"valor": {"type": "number"}}, "required": ["achado", "valor"]}}'
+                        if modo_esquema == "Esquema JSON" else '[{"achado": "Descrição do achado", "valor": 1000.0, "possui_evidencia": true}]'
+        )
+        if texto_esquema.strip():
+            try:
+                if modo_esquema == "Esquema JSON":
+                    esquema_resposta = carrega_esquema(texto_esquema)
+                else:
+                    esquema_resposta = esquema_de_exemplo(json.loads(texto_esquema))
+                st.caption(f"Colunas da planilha de resultados: {', '.join(colunas_esquema(esquema_resposta))}")
+                if modo_esquema == "Derivar de um exemplo":
+                    with st.expander("Esquema derivado do exemplo"):
+                        st.json(esquema_resposta)
+            except (ValueError, json.JSONDecodeError) as e:
+                st.error(f"Não foi possível usar o esquema: {e}")
+
+ignorar_cache = st.checkbox(
+    "Ignorar cache de respostas (reanalisar todos os auditados)",
+    value=False,
+    help="Respostas de chamadas idênticas (mesmo modelo, temperatura, formato, prompt e arquivos) são reaproveitadas do cache local. "
+         "Marque para forçar uma nova chamada ao modelo; o cache será atualizado com as novas respostas."
+)
+
+usar_contexto_compartilhado = st.checkbox(
+    "Usar cache de contexto compartilhado entre auditados",
+    value=True,
+    help="Envia uma única vez ao Gemini o início do prompt que é igual para todos os auditados e os arquivos comuns a todos eles. "
+         "Cada requisição passa a enviar só a parte específica do auditado, reduzindo tokens de entrada e latência."
+)
+
+extrair_texto = st.checkbox(
+    "Extrair o texto dos documentos localmente (PDF, DOCX, XLSX, CSV)",
+    value=False,
+    help="O texto dos documentos é extraído no servidor e incluído no prompt, em vez de enviar os arquivos para a API. "
+         "Reduz o tempo de upload e os tokens de cada requisição. PDFs digitalizados ou com muitas imagens continuam sendo enviados como arquivo."
+)
+
+dividir_documentos = st.checkbox(
+    "Dividir documentos grandes em trechos (análise por trechos)",
+    value=False,
+    help="Quando os documentos de um auditado passam do tamanho definido, o texto é dividido em trechos analisados em paralelo, "
+         "e as respostas parciais são consolidadas em um único resultado. Implica a extração local do texto dos documentos. "
+         "As respostas de cada trecho ficam em cache: uma falha na consolidação não exige refazer os trechos."
+)
+tokens_por_trecho, trechos_em_paralelo = 100_000, 4
+if dividir_documentos:
+    col1, col2 = st.columns(2)
+    with col1:
+        tokens_por_trecho = st.number_input("Tamanho máximo de cada trecho (tokens):", min_value=5_000, max_value=1_000_000,
+                                            value=tokens_por_trecho, step=5_000)
+    with col2:
+        trechos_em_paralelo = st.number_input("Trechos analisados em paralelo:", min_value=1, max_value=16, value=trechos_em_paralelo)
+
+usar_streaming = st.checkbox(
+    "Exibir respostas em tempo real (streaming)",
+    value=True,
+    help="Mostra o texto (ou a prévia do JSON, no formato Estruturada) à medida que o modelo gera a resposta, sem esperar o fim da geração."
+)
+
+uploads_antecipados = st.number_input(
+    "Auditados com upload antecipado:", min_value=0, max_value=10, value=2,
+    help="Enquanto o modelo gera a resposta de um auditado, os arquivos dos próximos são preparados e enviados em paralelo. "
+         "A execução passa a ser limitada pela etapa mais lenta (upload ou geração), e não pela soma das duas. Use 0 para desativar."
+)
+
 st.markdown("---")
 st.subheader("2.1. Forneça dados de contexto adicionais (Opcional)")
 
 arquivo_contexto_excel = st.file_uploader("Carregar Planilha de Contexto (.xlsx)", type=["xlsx"], help="A planilha deve ter uma coluna 'sigla' para identificar o auditado e fornecer variáveis adicionais ao template.")
 df_contexto_extra = None
+cols_to_rename = {}
 if arquivo_contexto_excel:
-    df_contexto_extra = pd.read_excel(arquivo_contexto_excel)
+    df_contexto_extra = le_planilha_carregada(arquivo_contexto_excel)
     if 'sigla' not in df_contexto_extra.columns:
         st.error("A planilha de contexto deve conter uma coluna 'sigla'.")
         st.stop()
     df_contexto_extra = df_contexto_extra.set_index('sigla')
     df_contexto_extra.columns = [col.strip() for col in df_contexto_extra.columns]
 
-    cols_to_rename = {}
     # Trata colunas que terminam com '*' para converter strings separadas por '|' em listas
     for col in df_contexto_extra.columns:
         if col.endswith('*'):
@@ -155,7 +273,7 @@ arquivo_resumo_excel = st.file_uploader(
 df_resumo = None
 siglas_ja_analisadas = set()
 if arquivo_resumo_excel:
-    df_resumo = pd.read_excel(arquivo_resumo_excel)
+    df_resumo = le_planilha_carregada(arquivo_resumo_excel)
     if 'auditado_sigla' in df_resumo.columns:
         siglas_ja_analisadas = set(df_resumo['auditado_sigla'].unique())
         st.success(f"Planilha de resumo carregada. {len(siglas_ja_analisadas)} auditados serão pulados se encontrados.")
@@ -163,15 +281,175 @@ if arquivo_resumo_excel:
         st.error("A planilha de resumo não contém a coluna 'auditado_sigla' e não pode ser usada para retomar a análise.")
         df_resumo = None # Invalida o dataframe se a coluna chave não existir
 
+# --- Journal da execução ---
+# Cada auditado concluído é gravado em disco imediatamente. Uma nova execução com a mesma configuração
+# retoma automaticamente de onde a anterior parou, mesmo após queda da sessão ou reinício do servidor.
+journal = JournalAnalise(id_execucao(
+    modelo=selected_model_id,
+    temperatura=temperature,
+    formato=response_format,
+    prompt=prompt_template,
+    planilha_contexto=hash_conteudo(arquivo_contexto_excel.getvalue()) if arquivo_contexto_excel else None,
+    arquivos_contexto=[hash_conteudo(f.getvalue()) for f in (context_files or [])],
+    # O esquema, a cascata, a análise por trechos e o agrupamento de auditados mudam as respostas; só entram
+    # no identificador quando usados, para não invalidar os journals existentes
+    **({'esquema': esquema_resposta} if esquema_resposta else {}),
+    **({'cascata': [modelo_cascata, campo_confianca, regra_aprovacao]} if modelo_cascata else {}),
+    **({'tokens_por_trecho': tokens_por_trecho} if dividir_documentos else {}),
+    **({'auditados_por_requisicao': auditados_por_requisicao} if auditados_por_requisicao > 1 else {}),
+))
+registros_journal = journal.carrega()
+if registros_journal and prompt_template:
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        st.info(f"💾 Foram encontrados {len(registros_journal)} auditados já analisados com esta mesma configuração. "
+                "Eles serão retomados automaticamente, sem nova chamada ao modelo.")
+    with col2:
+        if st.button("Descartar progresso salvo"):
+            journal.remove()
+            registros_journal = {}
+            st.rerun()
+
+MAX_RETRIES = 5
+config = ConfiguracaoAnalise(
+    selected_model_id, temperature, response_format, max_tentativas=MAX_RETRIES, ignorar_cache=ignorar_cache,
+    usar_contexto_compartilhado=usar_contexto_compartilhado, usar_streaming=usar_streaming, extrair_texto=extrair_texto,
+    dividir_documentos=dividir_documentos, tokens_por_trecho=tokens_por_trecho, trechos_em_paralelo=trechos_em_paralelo,
+    modelo_cascata=modelo_cascata, campo_confianca=campo_confianca, regra_aprovacao=regra_aprovacao,
+    auditados_por_requisicao=auditados_por_requisicao, esquema_resposta=esquema_resposta, uploads_antecipados=uploads_antecipados
+)
+
+def mapeia_arquivos_contexto(context_files):
+    """
+    Mapeia todos os arquivos carregados (incluindo os de ZIPs) pelo nome para fácil acesso.
+    Dos ZIPs só o índice é lido; cada membro é descomprimido apenas quando for usado.
+    """
+    for uploaded_file in context_files or []:
+        if uploaded_file.name.lower().endswith('.zip'):
+            st.info(f"📦 Indexando arquivos de '{uploaded_file.name}'...")
+    return indexa_arquivos(context_files)
+
+st.markdown("---")
+st.subheader("2.3. Estime Tokens, Custo e Tempo (Opcional)")
+st.write("Renderiza o prompt de cada auditado e mede os arquivos de contexto, sem enviar nada para análise.")
+
+col1, col2 = st.columns(2)
+with col1:
+    tokens_saida_esperados = st.number_input(
+        "Tokens de saída esperados por auditado:", min_value=0, value=1000, step=100,
+        help="Tamanho aproximado de cada resposta do modelo. Usado para projetar o custo e o tempo de geração."
+    )
+with col2:
+    contar_tokens_api = st.checkbox(
+        "Calibrar a contagem com a API",
+        value=True,
+        help="Conta os tokens do maior prompt no endpoint de contagem do Gemini (uma única chamada, sem custo) e usa "
+             "o resultado para ajustar a estimativa local dos demais. Desmarque para estimar apenas localmente."
+    )
+
+if st.button("Estimar (sem enviar)"):
+    if not prompt_template:
+        st.error("O campo de prompt não pode estar vazio.")
+    else:
+        try:
+            with st.spinner("Renderizando prompts e medindo arquivos..."):
+                available_files_map = mapeia_arquivos_contexto(context_files)
+                planejamento = prepara_planejamento(st.session_state.audit_results["auditados"], prompt_template, df_contexto_extra,
+                                                    list(cols_to_rename.values()), available_files_map, config, pular=siglas_ja_analisadas)
+                estimativa = estima_execucao(client, planejamento, available_files_map, config, journal, CacheRespostas(),
+                                             tokens_saida=tokens_saida_esperados, usar_api=contar_tokens_api)
+
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("Auditados a enviar", f"{len(estimativa.a_enviar)} de {len(estimativa.tabela)}")
+            col2.metric("Tokens (entrada / saída)", f"{estimativa.tokens_entrada:,} / {estimativa.tokens_saida:,}")
+            col3.metric("Custo estimado", f"US$ {estimativa.custo:,.2f}")
+            col4.metric("Tempo estimado", time.strftime('%H:%M:%S', time.gmtime(estimativa.tempo_total)))
+            st.caption(f"Arquivos a enviar: {estimativa.bytes_arquivos / 1024 ** 2:,.1f} MB. Tokens dos prompts "
+                       f"{'calibrados pelo endpoint de contagem' if estimativa.origem_contagem == 'api' else 'estimados localmente'}. "
+                       "Auditados retomados do journal ou do cache não têm custo. Valores aproximados, com base nos preços de tabela.")
+
+            for _, linha in estimativa.excedentes.iterrows():
+                st.error(f"{linha['auditado_nome']} ({linha['auditado_sigla']}): {linha['situacao']} "
+                         f"(~{linha['tokens_entrada']:,} tokens de entrada, {linha['percentual_limite']:.0f}% do limite do modelo).")
+            st.dataframe(estimativa.tabela.sort_values('tokens_entrada', ascending=False), hide_index=True)
+        except Exception as e:
+            st.error(f"Não foi possível estimar a execução: {e}")
+
 st.markdown("---")
 st.subheader("3. Gere a Análise")
 
-# Inicializa o ambiente Jinja2
-jinja_env = Environment(loader=BaseLoader(), undefined=StrictUndefined)
+executar_em_segundo_plano = st.toggle(
+    "Executar em segundo plano",
+    value=False,
+    help="A análise roda em um processo separado e não é interrompida por interações com a página ou troca de página. "
+         "O progresso é acompanhado abaixo e os resultados são carregados automaticamente ao final."
+)
+
+def carrega_resultados_gemini(resultados):
+    # Jobs antigos retornam só a lista de resultados; os atuais trazem também a telemetria
+    if isinstance(resultados, dict):
+        st.session_state.gemini_telemetria = resultados['telemetria']
+        resultados = resultados['resultados']
+    else:
+        st.session_state.pop('gemini_telemetria', None)
+    st.session_state.gemini_results = resultados
+    st.session_state.pop('job_gemini', None)
+
+def exibe_telemetria(area, telemetria):
+    """Exibe os agregados da telemetria: latência p50/p95, tokens por segundo, taxa de erro, novas tentativas e uploads."""
+    resumo = telemetria.resumo()
+    formata = lambda valor, sufixo: f"{valor:.1f}{sufixo}" if valor is not None else "-"
+    with area.container():
+        colunas = st.columns(6)
+        colunas[0].metric("Requisições", resumo['requisicoes'])
+        colunas[1].metric("Latência p50 / p95", f"{formata(resumo['latencia_p50_s'], 's')} / {formata(resumo['latencia_p95_s'], 's')}")
+        colunas[2].metric("Tokens de saída/s", formata(resumo['tokens_por_segundo'], ''))
+        colunas[3].metric("Taxa de erro", f"{resumo['taxa_erro']:.0%}")
+        colunas[4].metric("Novas tentativas", resumo['novas_tentativas'], help=f"Espera acumulada: {resumo['tempo_espera_s']:.1f}s")
+        colunas[5].metric("Uploads", resumo['uploads'],
+                          help=f"{resumo['bytes_enviados'] / 1024 ** 2:,.1f} MB em {resumo['tempo_upload_s']:.1f}s")
+
+def exibe_evento(areas, sigla, tipo, conteudo):
+    """Exibe na página os eventos de `executa_analise`, agrupados em um expander por auditado."""
+    if sigla is None:
+        if tipo == 'estatisticas':
+            st.markdown("##### Estatísticas da cascata")
+            st.dataframe(conteudo, hide_index=True)
+        else:
+            getattr(st, tipo)(conteudo)
+        return
+
+    if sigla not in areas:
+        with st.expander(f"**{planejamento[sigla]['nome']} ({sigla})**"):
+            areas[sigla] = {'mensagens': st.container(), 'parcial': st.empty(), 'resultado': st.container()}
+    area = areas[sigla]
+
+    if tipo == 'prompt':
+        area['mensagens'].expander(f"Prompt Final para {sigla} (clique para expandir)").code(conteudo)
+    elif tipo == 'parcial':
+        if response_format == 'Estruturada':
+            parcial = parse_json_parcial(conteudo)
+            if parcial is not None:
+                area['parcial'].json(parcial)
+            else:
+                area['parcial'].code(conteudo)
+        else:
+            area['parcial'].markdown(conteudo)
+    elif tipo == 'resultado':
+        area['parcial'].empty()  # O resultado final substitui o texto parcial
+        # Exibe o resultado imediatamente dentro de um expander
+        with area['resultado'].expander(f"Resultado", expanded=True):
+            if isinstance(conteudo, pd.DataFrame):
+                st.markdown("##### Planilha Gerada:")
+                st.dataframe(conteudo.head())
+            elif response_format == 'Estruturada':
+                st.text(conteudo)
+            else: # Caso seja 'Texto'
+                st.markdown(conteudo)
+    else:
+        getattr(area['mensagens'], tipo)(conteudo)
 
 if st.button("Analisar com Gemini"):
-    MAX_RETRIES = 3
-    RETRY_DELAY_SECONDS = 5
 
     if not prompt_template:
         st.error("O campo de prompt não pode estar vazio.")
@@ -179,6 +457,9 @@ if st.button("Analisar com Gemini"):
         with st.spinner("Analisando documentos... Isso pode levar alguns minutos."):
             try:
                 all_results = []
+                # A lista é compartilhada com o estado da sessão para que os resultados parciais fiquem disponíveis
+                # mesmo que a execução seja interrompida por um rerun
+                st.session_state.gemini_results = all_results
 
                 results = st.session_state.audit_results
                 # auditados = dict(islice(results["auditados"].items(), 2))
@@ -190,23 +471,9 @@ if st.button("Analisar com Gemini"):
                 st.session_state.last_response_format = response_format
                 st.session_state.last_temperature = temperature
 
-                # Mapeia todos os arquivos carregados (incluindo os de ZIPs) pelo nome para fácil acesso
-                available_files_map = {}
-                if context_files:
-                    for uploaded_file in context_files:
-                        if uploaded_file.name.lower().endswith('.zip'):
-                            st.info(f"📦 Indexando arquivos de '{uploaded_file.name}'...")
-                            with zipfile.ZipFile(uploaded_file, 'r') as zip_ref:
-                                for file_info in zip_ref.infolist():
-                                    if not file_info.is_dir():
-                                        file_bytes = io.BytesIO(zip_ref.read(file_info.filename))
-                                        file_bytes.name = file_info.filename
-                                        available_files_map[file_info.filename] = file_bytes
-                        else:
-                            available_files_map[uploaded_file.name] = uploaded_file
-
-
-                st.markdown("##### Analisando")
+                available_files_map = mapeia_arquivos_contexto(context_files)
+
+                # Auditados presentes na planilha de resumo carregada são pulados
                 for sigla, auditado_obj in auditados.items():
                     if sigla in siglas_ja_analisadas:
                         st.info(f"Auditado {auditado_obj.nome} ({sigla}) já presente na planilha de resumo. Pulando.")
@@ -217,117 +484,55 @@ if st.button("Analisar com Gemini"):
                             "auditado_nome": auditado_obj.nome,
                             "resposta_gemini": df_auditado_existente
                         })
-                        continue
-
-                    with st.expander(f"**{auditado_obj.nome} ({sigla})**"):
-                        uploaded_file_objects = []
-
-                        # Separa os arquivos específicos para o auditado
-                        required_filenames = []
-                        if df_contexto_extra is not None and sigla in df_contexto_extra.index:
-                            auditado_context_row = df_contexto_extra.loc[sigla]
-                            # 'cols_to_rename' foi definido durante o processamento da planilha
-                            for col_name in cols_to_rename.values(): # Itera sobre os nomes de coluna já limpos (sem '*')
-                                if col_name in auditado_context_row and isinstance(auditado_context_row[col_name], list):
-                                    required_filenames.extend(auditado_context_row[col_name])
-
-                        if not required_filenames:
-                            st.warning(f"Nenhum arquivo de contexto especificado para '{sigla}'. A análise prosseguirá sem arquivos.")
-                        else:
-                            st.write(f"Arquivos de contexto para '{sigla}':")
-                            for filename in required_filenames:
-                                if filename in available_files_map:
-                                    file_to_upload = available_files_map[filename]
-
-                                    # Extrai a extensão do arquivo original para usar como sufixo no arquivo temporário
-                                    # Isso garante que NamedTemporaryFile crie um arquivo plano no diretório /tmp
-                                    file_extension = os.path.splitext(os.path.basename(file_to_upload.name))[1]
-
-                                    with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension) as tmp_file:
-                                            tmp_file.write(file_to_upload.getvalue())
-                                            tmp_file_path = tmp_file.name
-                                    st.info(f"📄 Fazendo upload de '{file_to_upload.name}' para a API...")
-                                    uploaded_file_objects.append(client.files.upload(file=tmp_file_path))
-                                    os.remove(tmp_file_path)
-                                else:
-                                    st.error(f"Arquivo '{filename}' especificado para '{sigla}' não encontrado nos arquivos carregados.")
-
-                        # Monta o contexto específico do auditado para o Jinja2
-                        contexto_render = {'auditado': auditado_obj}
-                        if df_contexto_extra is not None and sigla in df_contexto_extra.index:
-                            contexto_render.update(df_contexto_extra.loc[sigla].to_dict())
-
-                        # Renderiza o prompt com o contexto do auditado atual
-                        template = jinja_env.from_string(prompt_template)
-                        rendered_prompt = template.render(contexto_render)
-
-                        st.expander(f"Prompt Final para {sigla} (clique para expandir)").code(rendered_prompt)
-
-                        # Gera o conteúdo usando o cliente e o modelo selecionado
-                        response = None
-                        error_message = None
-                        for attempt in range(MAX_RETRIES):
-                            response, error_message = avalia_gemini(client, rendered_prompt, selected_model_id, temperature, response_format, uploaded_file_objects)
-
-                            if not error_message:
-                                st.success(f"Análise para {sigla} bem-sucedida.")
-                                break  # Sucesso, sai do loop de tentativas
-
-                            st.warning(f"Tentativa {attempt + 1}/{MAX_RETRIES} para {sigla} falhou. Erro: {error_message}")
-                            if attempt < MAX_RETRIES - 1:
-                                with st.spinner(f"Aguardando {RETRY_DELAY_SECONDS} segundos antes de tentar novamente..."):
-                                    time.sleep(RETRY_DELAY_SECONDS)
-
-
-                        if error_message:
-                            st.error(f"Falha ao analisar {sigla} após {MAX_RETRIES} tentativas. Erro final: {error_message}")
-                            all_results.append({
-                                "auditado_sigla": sigla,
-                                "auditado_nome": auditado_obj.nome,
-                                "resposta_gemini": error_message
-                            })
-                            continue # Pula para o próximo auditado em caso de erro
-
-                        # Exibe o resultado imediatamente dentro de um expander
-                        with st.expander(f"Resultado", expanded=True):
-                            if response_format == 'Estruturada':
-                                try:
-                                    datahora_atual = datetime.now()
-
-                                    # Tenta processar o JSON e mostrar um preview do DataFrame
-                                    response_json = json.loads(response.text)
-                                    df = pd.json_normalize(response_json)
-                                    df['auditado_sigla'] = sigla
-                                    df['auditado_nome'] = auditado_obj.nome
-                                    df['data_avaliacao'] = datahora_atual
-                                    df['modelo'] = selected_model_id
-
-                                    st.markdown("##### Planilha Gerada:")
-                                    st.dataframe(df.head())
-
-                                    response_modelo = df
-                                except (json.JSONDecodeError, TypeError) as e:
-                                    st.error(f"A resposta do modelo não é um JSON válido. Exibindo como texto. Erro: {e}")
-                                    st.text(response.text)
-                                    response_modelo = response.text
-
-                            else: # Caso seja 'Texto'
-                                st.markdown(response.text)
-                                response_modelo = response.text
 
-                        all_results.append({
-                            "auditado_sigla": sigla,
-                            "auditado_nome": auditado_obj.nome,
-                            "resposta_gemini": response_modelo
-                        })
+                planejamento = prepara_planejamento(auditados, prompt_template, df_contexto_extra, list(cols_to_rename.values()),
+                                                    available_files_map, config, pular=siglas_ja_analisadas)
 
-                st.session_state.gemini_results = all_results
-                with st.spinner("Aguardando tempo de espera."):
-                    time.sleep(2)
+                # Sinaliza, sem consultar a API, os auditados que não cabem em uma requisição
+                excedentes = estima_execucao(client, planejamento, available_files_map, config, usar_api=False).excedentes
+                for _, linha in excedentes.iterrows():
+                    st.warning(f"⚠️ {linha['auditado_nome']} ({linha['auditado_sigla']}): {linha['situacao']} "
+                               f"(~{linha['tokens_entrada']:,} tokens de entrada). A chamada para este auditado deve falhar.")
+
+                if executar_em_segundo_plano:
+                    st.session_state.job_gemini = obtem_gerenciador_jobs().submete(
+                        executa_analise_job, api_key, planejamento, available_files_map, config, journal.id_execucao,
+                        resultados_iniciais=all_results,
+                        tipo='analise_gemini', descricao=f"Análise com {selected_model_id} de {len(planejamento)} auditados"
+                    )
+                else:
+                    st.markdown("##### Analisando")
+                    telemetria = Telemetria()
+                    st.session_state.gemini_telemetria = telemetria
+                    area_telemetria = st.empty()
+                    areas_auditados = {}
+                    ultima_atualizacao = [0.0]
+
+                    def notifica(sigla, tipo, conteudo):
+                        exibe_evento(areas_auditados, sigla, tipo, conteudo)
+                        # Os agregados são redesenhados no máximo uma vez por segundo (não a cada trecho do streaming)
+                        if time.monotonic() - ultima_atualizacao[0] >= 1:
+                            ultima_atualizacao[0] = time.monotonic()
+                            exibe_telemetria(area_telemetria, telemetria)
+
+                    executa = executa_analise_cascata if config.modelo_cascata else executa_analise
+                    executa(client, planejamento, available_files_map, config, journal, CacheRespostas(),
+                            notifica=notifica, resultados=all_results, telemetria=telemetria)
+                    exibe_telemetria(area_telemetria, telemetria)
+
+                    st.session_state.gemini_results = all_results
+                    with st.spinner("Aguardando tempo de espera."):
+                        time.sleep(2)
 
             except Exception as e:
                 st.error(f"Ocorreu um erro durante a chamada para a API do Gemini: {e}")
 
+if st.session_state.get('job_gemini'):
+    acompanha_job(st.session_state.job_gemini, carrega_resultados_gemini, chave_sessao='job_gemini')
+
+with st.expander("Análises em segundo plano"):
+    painel_jobs('analise_gemini', carrega_resultados_gemini)
+
 # --- 4. Exibição do Resultado ---
 if 'gemini_results' in st.session_state and st.session_state.gemini_results:
     st.markdown("---")
@@ -422,6 +627,30 @@ if 'gemini_results' in st.session_state and st.session_state.gemini_results:
         except Exception as e:
             st.error(f"Erro ao gerar planilha Excel a partir dos resultados estruturados: {e}")
 
+    telemetria = st.session_state.get('gemini_telemetria')
+    if telemetria is not None and not telemetria.tabela().empty:
+        st.markdown("##### Telemetria da Execução")
+        st.info("Registro de cada requisição ao modelo e de cada upload (tempos, tentativas, erros e tokens), "
+                "para identificar se a execução foi limitada pelos uploads, pela latência do modelo ou pela cota.")
+        exibe_telemetria(st.empty(), telemetria)
+        colunas_telemetria = st.columns(2)
+        with colunas_telemetria[0]:
+            st.download_button(
+                label="Baixar Telemetria (.csv)",
+                data=telemetria.exporta_csv(),
+                file_name="telemetria_gemini.csv",
+                mime="text/csv",
+                key="download_telemetria_csv"
+            )
+        with colunas_telemetria[1]:
+            st.download_button(
+                label="Baixar Telemetria (.json)",
+                data=telemetria.exporta_json(),
+                file_name="telemetria_gemini.json",
+                mime="application/json",
+                key="download_telemetria_json"
+            )
+
     if st.session_state.get('last_response_format') == 'Texto' and all_md_files_for_zip:
         st.info("Gere um arquivo .ZIP contendo todos os relatórios de texto individuais.")
         zip_buffer = io.BytesIO()
@@ -1,12 +1,10 @@
-import os
-import tempfile
-
 import streamlit as st
-from jinja2 import Environment, BaseLoader, StrictUndefined
 
-from google import genai
-from google.genai import types
-from utils import avalia_gemini
+from gemini import avalia_gemini_stream
+from cache_respostas import CacheRespostas, chave_requisicao, hash_conteudo
+from extracao_texto import ExtratorTexto, inclui_documentos
+from execucao_gemini import envia_arquivo
+from utils import obtem_cliente_gemini, compila_template
 
 st.set_page_config(page_title="Análise Geral com IA", layout="wide")
 
@@ -29,8 +27,8 @@ if not api_key:
     st.stop()
 
 try:
-    # Cria o cliente da API Gemini
-    client = genai.Client(api_key=api_key)
+    # Cliente da API Gemini compartilhado entre reruns; o SDK só é carregado depois de informada a chave
+    client = obtem_cliente_gemini(api_key)
 except Exception as e:
     st.error(f"Erro ao criar o cliente da API do Gemini. Verifique se a chave é válida. Detalhes: {e}")
     st.stop()
@@ -77,6 +75,20 @@ with col2:
         help="Valores mais baixos geram respostas mais determinísticas. Valores mais altos geram respostas mais criativas."
     )
 
+ignorar_cache = st.checkbox(
+    "Ignorar cache de respostas (reanalisar)",
+    value=False,
+    help="Chamadas idênticas (mesmo modelo, temperatura, formato, prompt e arquivos) reaproveitam a resposta do cache local. "
+         "Marque para forçar uma nova chamada ao modelo."
+)
+
+extrair_texto = st.checkbox(
+    "Extrair o texto dos documentos localmente (PDF, DOCX, CSV)",
+    value=False,
+    help="O texto dos documentos é extraído no servidor e incluído no prompt, em vez de enviar os arquivos para a API. "
+         "PDFs digitalizados ou com muitas imagens continuam sendo enviados como arquivo."
+)
+
 context_files = st.file_uploader(
     "Carregue seus arquivos de contexto (.txt, .md, .csv, .pdf, etc.)",
     accept_multiple_files=True,
@@ -86,9 +98,6 @@ context_files = st.file_uploader(
 # --- 3. Geração do Resultado ---
 st.subheader("3. Gere a Análise")
 
-# Inicializa o ambiente Jinja2 (mesmo que não use variáveis de auditado, pode ser útil para outras variáveis)
-jinja_env = Environment(loader=BaseLoader(), undefined=StrictUndefined)
-
 if st.button("Analisar com Gemini"):
     if not prompt_template:
         st.error("O campo de prompt não pode estar vazio.")
@@ -96,35 +105,61 @@ if st.button("Analisar com Gemini"):
         with st.spinner("Analisando documentos... Isso pode levar alguns minutos."):
             try:
                 # Renderiza o prompt (sem contexto de auditado específico nesta página)
-                template = jinja_env.from_string(prompt_template)
+                template = compila_template(prompt_template)
                 rendered_prompt = template.render()
 
                 st.expander("Prompt Final (clique para expandir)").code(rendered_prompt)
 
-                uploaded_file_objects = []
-                if context_files:
-                    st.write("Arquivos de contexto carregados para esta análise:")
-                    for file in context_files:
-                        with tempfile.NamedTemporaryFile(delete=False, suffix=f"_{file.name}") as tmp_file:
-                            tmp_file.write(file.getvalue())
-                            tmp_file_path = tmp_file.name
-
-                        st.info(f"📄 Fazendo upload de '{file.name}' para a API...")
-                        uploaded_file_obj = client.files.create(file=tmp_file_path)
-                        uploaded_file_objects.append(uploaded_file_obj)
-                        os.remove(tmp_file_path)
-                else:
-                    st.warning("Nenhum arquivo de contexto carregado para esta análise.")
-
-                # Gera o conteúdo usando o cliente e o modelo selecionado
-                response, error_message = avalia_gemini(client, rendered_prompt, selected_model_id, temperature, response_format, uploaded_file_objects)
-                
-                if error_message:
-                    st.error(error_message)
-                elif response:
+                # Documentos com texto extraível vão no próprio prompt; os demais são enviados como arquivo
+                extrator = ExtratorTexto() if extrair_texto else None
+                documentos, arquivos_upload = [], []
+                for file in (context_files or []):
+                    texto = extrator.extrai(file) if extrator else None
+                    if texto is not None:
+                        documentos.append((file.name, texto))
+                    else:
+                        arquivos_upload.append(file)
+                if documentos:
+                    st.info(f"📝 Texto extraído localmente e incluído no prompt: {', '.join(nome for nome, _ in documentos)}.")
+                prompt_envio = inclui_documentos(rendered_prompt, documentos)
+
+                # Consulta o cache antes de qualquer upload ou chamada ao modelo
+                cache_respostas = CacheRespostas()
+                hashes_arquivos = [hash_conteudo(file.getvalue()) for file in arquivos_upload]
+                chave_cache = chave_requisicao(selected_model_id, temperature, response_format, prompt_envio, hashes_arquivos)
+                response = None if ignorar_cache else cache_respostas.get(chave_cache)
+
+                if response is not None:
+                    st.success("Resposta recuperada do cache.")
                     st.session_state.gemini_general_result = response.text
                 else:
-                    st.error("Nenhuma resposta foi recebida da API do Gemini.")
+                    uploaded_file_objects = []
+                    if arquivos_upload:
+                        st.write("Arquivos de contexto carregados para esta análise:")
+                        for file in arquivos_upload:
+                            st.info(f"📄 Fazendo upload de '{file.name}' para a API...")
+                            uploaded_file_objects.append(envia_arquivo(client, file))
+                    elif not documentos:
+                        st.warning("Nenhum arquivo de contexto carregado para esta análise.")
+
+                    # Gera o conteúdo usando o cliente e o modelo selecionado
+                    # Exibe o texto à medida que é gerado; o resultado completo é exibido na seção 4
+                    area_parcial = st.empty()
+                    response, error_message = avalia_gemini_stream(
+                        client, prompt_envio, selected_model_id, temperature, response_format, uploaded_file_objects,
+                        ao_receber=area_parcial.markdown, max_tentativas=3,
+                        ao_falhar=lambda tentativa, max_tentativas, mensagem, espera: st.warning(
+                            f"Tentativa {tentativa}/{max_tentativas} falhou. Erro: {mensagem}. Nova tentativa em {espera:.1f} segundos...")
+                    )
+                    area_parcial.empty()
+
+                    if error_message:
+                        st.error(error_message)
+                    elif response:
+                        cache_respostas.set(chave_cache, response.text, {'modelo': selected_model_id})
+                        st.session_state.gemini_general_result = response.text
+                    else:
+                        st.error("Nenhuma resposta foi recebida da API do Gemini.")
 
             except Exception as e:
                 st.error(f"Ocorreu um erro durante a chamada para a API do Gemini: {e}")
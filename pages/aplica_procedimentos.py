@@ -1,11 +1,9 @@
 import streamlit as st
 import pandas as pd
-import re
-import os
 
-from classes import FonteInformacao, AcaoVerificacao, ProcedimentoAuditoria, Auditado, \
-    gerar_tabela_encaminhamentos, gerar_tabela_achados, gerar_tabela_situacoes_inconformes
-from utils import carregar_dados
+from perfilamento import PerfilDesempenho
+from classes import cria_fontes_informacao, cria_acoes_verificacao, cria_procedimentos, cria_auditados, executar_auditoria
+from utils import carregar_dados, obtem_gerenciador_jobs, acompanha_job, painel_jobs
 
 st.set_page_config(page_title="Aplicar Procedimentos", layout="wide")
 
@@ -53,8 +51,28 @@ with st.expander("1. Carregar Arquivos Excel", expanded=True):
     if not arquivo_auditados or not arquivo_mapa_achados or not arquivos_fontes_dados:
         st.info("Por favor, carregue todos os arquivos Excel de entrada.")
 
+def carrega_resultado_auditoria(audit_results):
+    st.session_state.audit_results = audit_results
+    st.session_state.files_processed = True
+    st.session_state.audit_completed = True
+    st.session_state.download_files = {} # Limpa arquivos de download de auditorias anteriores
+    st.session_state.pop('job_downloads', None)
+    st.session_state.pop('job_auditoria', None)
+
 # 2. Processamento dos dados
 if arquivo_auditados and arquivo_mapa_achados and arquivos_fontes_dados:
+    executar_em_segundo_plano = st.toggle(
+        "Executar em segundo plano",
+        value=False,
+        help="A execução dos procedimentos roda em um processo separado e não é interrompida por interações com a página ou troca de página. "
+             "O progresso é acompanhado abaixo e o resultado é carregado automaticamente ao final."
+    )
+    medir_desempenho = st.toggle(
+        "Medir desempenho",
+        value=False,
+        help="Registra o tempo de leitura de cada fonte de informação e de execução de cada procedimento, ação de verificação e critério. "
+             "O resultado é exibido na página 'Desempenho'. A medição acrescenta um pequeno custo à execução."
+    )
     if st.button("Processar arquivos e gerar achados"):
         st.session_state.files_processed = False
         st.session_state.audit_completed = False
@@ -77,96 +95,54 @@ if arquivo_auditados and arquivo_mapa_achados and arquivos_fontes_dados:
 
                 # Mapeia os arquivos de fonte de dados carregados pelo nome
                 fontes_dados_carregadas = {f.name: f for f in arquivos_fontes_dados}
+                perfil = PerfilDesempenho() if medir_desempenho else None
 
                 # 1. Leitura das fontes de informação
                 with st.spinner("Processando fontes de informação..."):
-                    fontes = {}
-                    for _, row in df_fontes.iterrows():
-                        nome_arquivo_fonte = os.path.basename(row['filepath'])
-                        fonte = FonteInformacao(
-                            descricao=row['descricao'],
-                            filepath=fontes_dados_carregadas.get(nome_arquivo_fonte),
-                            chave_jurisdicionado=row['chave_jurisdicionado'],
-                            id=row['id']
-                        )
-                        try:
-                            fonte.read()
-                            fontes[fonte.id] = fonte
-                        except IOError as e:
-                            st.error(f"Erro ao carregar a fonte de informação '{fonte.descricao}': {e}")
-                        except AttributeError:
-                            st.error(f"Arquivo da fonte de informação '{fonte.descricao}' ('{nome_arquivo_fonte}') não foi encontrado nos arquivos carregados. Verifique o nome.")
+                    fontes, erros = cria_fontes_informacao(df_fontes, fontes_dados_carregadas, perfil=perfil)
+                    for erro in erros:
+                        st.error(erro)
 
                 # 2. Leitura das ações de verificação
                 with st.spinner("Processando ações de verificação..."):
-                    acoes = {}
-                    for _, row in df_acoes_verificacao.iterrows():
-                        fonte_informacao = fontes.get(row['id_fonte_informacao'])
-                        if not fonte_informacao:
-                            st.error(f"Ação de verificação '{row['id']}' refere-se a uma fonte de informação ('{row['id_fonte_informacao']}') que não foi encontrada.")
-                            continue
-
-                        acao = AcaoVerificacao(
-                            fonte_informacao=fonte_informacao, informacao_requerida=row['informacao_requerida'],
-                            acao_exclusiva_auditados=row['acao_exclusiva_auditados'], criterio=row['criterio'],
-                            descricao_situacao_inconforme=row['descricao_situacao_inconforme'], descricao_evidencia=row['descricao_evidencia'],
-                            situacao_inconforme=row['situacao_inconforme'], situacao_encontrada_nan_e_achado=row['situacao_encontrada_nan_e_achado'],
-                            tipo_encaminhamento=row['tipo_encaminhamento'], encaminhamento=row['encaminhamento'],
-                            pre_encaminhamento=row['pre_encaminhamento'], auditado_inexistente_e_achado=row['auditado_inexistente_e_achado'],
-                            descricao_auditado_inexistente=row['descricao_auditado_inexistente'], id=row['id']
-                        )
-                        acoes[acao.id] = acao
+                    acoes, erros = cria_acoes_verificacao(df_acoes_verificacao, fontes)
+                    for erro in erros:
+                        st.error(erro)
 
                 # 3. Leitura dos procedimentos de auditoria
                 with st.spinner("Processando procedimentos de auditoria..."):
-                    procedimentos = {}
-                    for _, row in df_procedimentos.iterrows():
-                        procedimento = ProcedimentoAuditoria(
-                            descricao=row['descricao'], logica_achado=row['logica_achado'],
-                            numero_achado=row['numero_achado'], nome_achado=row['nome_achado'], id=row['id']
-                        )
-                        acao_ids = [acao_id for acao_id in re.split(r'[\&\|\~\(\)\s]+', procedimento.logica_achado.replace("(", "").replace(")", "")) if acao_id]
-                        for acao_id in acao_ids:
-                            acao = acoes.get(acao_id.strip())
-                            if acao:
-                                procedimento.adicionar_acao(acao)
-                        procedimentos[procedimento.id] = procedimento
+                    procedimentos = cria_procedimentos(df_procedimentos, acoes)
 
                 # 4. Leitura dos auditados
                 with st.spinner("Carregando lista de auditados..."):
-                    auditados = {}
-                    for _, row in df_jurisdicionados.iterrows():
-                        auditado = Auditado(nome=row['orgao'], sigla=row['sigla'])
-                        auditados[auditado.sigla] = auditado
+                    auditados = cria_auditados(df_jurisdicionados)
 
                 st.success("Arquivos carregados e processados com sucesso!")
                 st.session_state.files_processed = True
 
             # Se já carregou as planilhas mas ainda não finalizou a execução dos procedimentos
             if st.session_state.files_processed and not st.session_state.audit_completed:
-                with st.spinner("Executando procedimentos de auditoria... Por favor, aguarde."):
-                    # Execução da auditoria
-                    for auditado in auditados.values():
-                        auditado.aplicar_procedimentos(procedimentos.values(), debug=False)
-
-                    # Geração das tabelas
-                    tabela_encaminhamentos = gerar_tabela_encaminhamentos(auditados)
-                    tabela_achados = gerar_tabela_achados(auditados)
-                    tabela_situacoes = gerar_tabela_situacoes_inconformes(auditados)
-
-                    st.session_state.audit_results = {
-                        "auditados": auditados,
-                        "tabela_encaminhamentos": tabela_encaminhamentos,
-                        "tabela_achados": tabela_achados,
-                        "tabela_situacoes": tabela_situacoes,
-                    }
-                    st.session_state.audit_completed = True
-                    st.rerun()
+                if executar_em_segundo_plano:
+                    st.session_state.job_auditoria = obtem_gerenciador_jobs().submete(
+                        executar_auditoria, auditados, list(procedimentos.values()), perfil=perfil,
+                        tipo='auditoria', descricao=f"Auditoria de {len(auditados)} auditados ({arquivo_mapa_achados.name})"
+                    )
+                else:
+                    with st.spinner("Executando procedimentos de auditoria... Por favor, aguarde."):
+                        # Execução da auditoria e geração das tabelas
+                        carrega_resultado_auditoria(executar_auditoria(auditados, procedimentos.values(), perfil=perfil))
+                        st.rerun()
 
         except ValueError as e:
             st.error(f"Erro de configuração: {e}")
         except Exception as e:
             st.error(f"Ocorreu um erro inesperado durante o processamento: {e}")
 
+if st.session_state.get('job_auditoria'):
+    acompanha_job(st.session_state.job_auditoria, carrega_resultado_auditoria, chave_sessao='job_auditoria')
+
+with st.expander("Auditorias em segundo plano"):
+    painel_jobs('auditoria', carrega_resultado_auditoria)
+
 if st.session_state.audit_completed:
     st.success("Auditoria concluída! Navegue para 'Visualizar Resultado' ou 'Gerar Relatórios'.")
\ No newline at end of file
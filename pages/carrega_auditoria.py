@@ -1,6 +1,6 @@
 import streamlit as st
 import pickle
-from classes import gerar_tabela_encaminhamentos, gerar_tabela_achados, gerar_tabela_situacoes_inconformes
+from classes import gerar_resultados
 
 st.set_page_config(page_title="Carregar Resultado", layout="wide")
 
@@ -15,21 +15,12 @@ if arquivo_resultado:
             # Carrega o objeto 'auditados' do arquivo pkl
             auditados = pickle.load(arquivo_resultado)
 
-            # Gera novamente as tabelas a partir dos dados carregados
-            tabela_encaminhamentos = gerar_tabela_encaminhamentos(auditados)
-            tabela_achados = gerar_tabela_achados(auditados)
-            tabela_situacoes = gerar_tabela_situacoes_inconformes(auditados)
-
-            # Atualiza o estado da sessão para refletir os dados carregados
-            st.session_state.audit_results = {
-                "auditados": auditados,
-                "tabela_encaminhamentos": tabela_encaminhamentos,
-                "tabela_achados": tabela_achados,
-                "tabela_situacoes": tabela_situacoes,
-            }
+            # Gera novamente as tabelas a partir dos dados carregados e atualiza o estado da sessão
+            st.session_state.audit_results = gerar_resultados(auditados)
             st.session_state.audit_completed = True
             st.session_state.files_processed = True # Marca como processado para consistência
             st.session_state.download_files = {} # Limpa arquivos de download antigos
+            st.session_state.pop('job_downloads', None)
             st.rerun()
 
     except Exception as e:
@@ -0,0 +1,53 @@
+import streamlit as st
+
+from perfilamento import CATEGORIAS
+
+st.set_page_config(page_title="Desempenho", layout="wide")
+
+st.title("Desempenho da Auditoria")
+st.write("Esta seção mostra onde foi gasto o tempo da última aplicação de procedimentos: as fontes de informação, os procedimentos, as ações de verificação e os critérios mais demorados.")
+
+perfil = (st.session_state.get('audit_results') or {}).get('desempenho')
+
+if perfil is None:
+    st.info("Nenhuma medição disponível. Na página 'Aplica Procedimentos', ative 'Medir desempenho' antes de processar os arquivos.")
+    st.stop()
+
+resumo = perfil.resumo()
+colunas = st.columns(len(CATEGORIAS) + 1)
+for coluna, (categoria, titulo) in zip(colunas, CATEGORIAS.items()):
+    dados = resumo.get(categoria, {'chamadas': 0, 'tempo_total_s': 0.0})
+    coluna.metric(titulo, f"{dados['tempo_total_s']:.2f} s", f"{dados['chamadas']} chamadas", delta_color="off")
+colunas[-1].metric("Critérios avaliados por RPN",
+                   f"{resumo['fracao_rpn']:.0%}" if resumo['fracao_rpn'] is not None else "-",
+                   help="Fração das avaliações de critério em que a expressão não pôde ser avaliada diretamente (eval) e "
+                        "seguiu o caminho mais lento de comparação termo a termo (notação polonesa reversa).")
+st.caption("Os tempos de procedimentos incluem os das suas ações, e os das ações, os dos seus critérios. "
+           "A cópia de procedimentos é feita uma vez por auditado e procedimento, antes da execução.")
+
+n = st.slider("Quantidade de itens por categoria", min_value=5, max_value=100, value=10, step=5)
+
+formato_colunas = {
+    'tempo_total_s': st.column_config.NumberColumn("Tempo total (s)", format="%.3f"),
+    'tempo_medio_ms': st.column_config.NumberColumn("Tempo médio (ms)", format="%.3f"),
+    'tempo_max_ms': st.column_config.NumberColumn("Tempo máximo (ms)", format="%.3f"),
+    'chamadas': st.column_config.NumberColumn("Chamadas"),
+    'caminho_eval': st.column_config.NumberColumn("Caminho eval"),
+    'caminho_rpn': st.column_config.NumberColumn("Caminho RPN"),
+}
+for categoria, titulo in CATEGORIAS.items():
+    df = perfil.maiores(categoria, n)
+    if df.empty:
+        continue
+    st.subheader(titulo)
+    ocultas = ['categoria'] + ([] if categoria == 'criterio' else ['caminho_eval', 'caminho_rpn'])
+    if categoria == 'criterio':
+        ocultas.append('descricao')
+    st.dataframe(df.drop(columns=ocultas), hide_index=True, column_config=formato_colunas)
+
+st.header("Baixar Medições", divider="gray")
+col1, col2 = st.columns(2)
+col1.download_button("Baixar Medições (.csv)", data=perfil.exporta_csv(), file_name="desempenho_auditoria.csv",
+                     mime="text/csv", icon=":material/table:")
+col2.download_button("Baixar Medições (.json)", data=perfil.exporta_json(), file_name="desempenho_auditoria.json",
+                     mime="application/json", icon=":material/data_object:")
@@ -3,8 +3,6 @@ import pandas as pd
 import io
 import zipfile
 import logging
-import pypandoc
-from docxtpl import DocxTemplate
 from jinja2 import Environment, BaseLoader, StrictUndefined, exceptions
 
 from classes import gerar_tabela_achados
@@ -20,6 +18,8 @@ if st.session_state.audit_completed:
     auditados = results["auditados"]
 
     if st.button("Gerar Anexo de Evidências"):
+        from docxtpl import DocxTemplate  # Carregado só na geração, e não a cada execução da página
+
         with st.spinner("Gerando anexo..."):
             contexto_anexo = [{'sigla_orgao': a.sigla, 'nome_orgao': a.nome, 'achados': list(a.get_achados().values())} for a in auditados.values()]
             base = DocxTemplate("docs/anexo-evidencias-base.docx")
@@ -1,24 +1,25 @@
 import streamlit as st
 import pandas as pd
-import io
-import zipfile
-import logging
-import pypandoc
-import docx
-import os
 
-from docxtpl import DocxTemplate, RichText, InlineImage
-from docx.shared import Mm
-from jinja2 import Environment, BaseLoader, StrictUndefined, exceptions
-
-from classes import gerar_tabela_achados
-from utils import get_variaveis_template, StreamlitLogHandler, processa_imagens_contexto, cross_ref_figuras
+from utils import get_variaveis_template, le_planilha_carregada, obtem_gerenciador_jobs, acompanha_job, painel_jobs
+from relatorios_individuais import gera_relatorios_individuais, gera_relatorios_individuais_job
 
 st.set_page_config(page_title="Gera Relatórios Individuais", layout="wide")
 
 st.title("Gera Relatórios Individuais")
 st.write("Esta seção permite a geração de relatórios personalizados a partir dos dados de auditoria processados, usando templates em formato Markdown/Jinja2.")
 
+def exibe_mensagem_log(nivel, mensagem):
+    if nivel == 'inicio':
+        st.markdown(f"--- \n#### {mensagem}")
+    else:
+        getattr(st, nivel)(mensagem)
+
+def carrega_relatorios_individuais(resultado):
+    st.session_state.download_files['relatorios_individuais_zip'] = resultado['zip']
+    st.session_state.log_relatorios_individuais = resultado['log']
+    st.session_state.pop('job_relatorios_individuais', None)
+
 if st.session_state.audit_completed:
     results = st.session_state.audit_results
     auditados = results["auditados"]
@@ -30,14 +31,14 @@ if st.session_state.audit_completed:
         st.dataframe(df_auditados, height=200)
     with col2:
         st.write("**Achados**")
-        df_achados = pd.DataFrame([{'nome': nome} for nome in gerar_tabela_achados(auditados).columns])
+        df_achados = pd.DataFrame([{'nome': nome} for nome in results["tabela_achados"].columns])
         st.dataframe(df_achados, height=200)
 
     st.subheader("1. Forneça dados de contexto adicionais (Opcional)")
     arquivo_contexto = st.file_uploader("Carregar Planilha de Contexto (.xlsx)", type=["xlsx"], help="A planilha deve ter uma coluna 'sigla' para identificar o auditado.")
     df_contexto_extra = None
     if arquivo_contexto:
-        df_contexto_extra = pd.read_excel(arquivo_contexto).set_index('sigla')
+        df_contexto_extra = le_planilha_carregada(arquivo_contexto).set_index('sigla')
         df_contexto_extra.columns = [col.strip() for col in df_contexto_extra.columns]
 
         st.dataframe(df_contexto_extra.head())
@@ -148,6 +149,8 @@ if st.session_state.audit_completed:
 
     if arquivo_template_docx:
         try:
+            # python-docx só é carregado quando um template .docx é fornecido
+            import docx
             doc = docx.Document(arquivo_template_docx)
             template_content = "\n".join([para.text for para in doc.paragraphs])
             template_content = template_content.replace("%p", "%").replace('‘', "'").replace('’', "'").replace('“', "'").replace('”', "'")
@@ -163,103 +166,51 @@ if st.session_state.audit_completed:
         st.code(f"{vars_template}")
 
         st.subheader("3. Gere os relatórios")
-        if st.button("Gerar Relatórios Individuais"):
-            # Processamento do template markdown
-            with st.spinner("Gerando relatórios individuais..."):
-                # --- Lógica para lidar com arquivos de contexto (incluindo ZIP) ---
-                env = Environment(loader=BaseLoader(), undefined=StrictUndefined)
-                template_ref_docx = 'docs/template-relatorio-individual.docx'
-                generation_log = st.expander("Log de Geração", expanded=True)
-                zip_buffer = io.BytesIO()
-
-                with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_f:
-                    for sigla, row_auditado in df_auditados.iterrows():
-                        # Mapa para armazenar o caminho de todos os arquivos de contexto disponíveis
-                        context_files_path_map = {}
-                        unzip_dir = os.path.join("tmp", "unzipped_context")
-
-                        for uploaded_file in arquivos_fontes_contexto:
-                            if uploaded_file.name.lower().endswith('.zip'):
-                                os.makedirs(unzip_dir, exist_ok=True)
-                                with zipfile.ZipFile(uploaded_file, 'r') as zip_ref:
-                                    zip_ref.extractall(unzip_dir)
-                                # Mapeia os arquivos extraídos
-                                for root, _, files in os.walk(unzip_dir):
-                                    for filename in files:
-                                        context_files_path_map[filename] = os.path.join(root, filename)
-                            else:
-                                # Salva arquivos individuais em um local temporário
-                                temp_path = os.path.join("tmp", uploaded_file.name)
-                                with open(temp_path, "wb") as f:
-                                    f.write(uploaded_file.getvalue())
-                                context_files_path_map[uploaded_file.name] = temp_path
+        executar_em_segundo_plano = st.toggle(
+            "Executar em segundo plano",
+            value=False,
+            help="A geração roda em um processo separado e não é interrompida por interações com a página ou troca de página. "
+                 "O progresso é acompanhado abaixo e os relatórios são carregados automaticamente ao final."
+        )
 
+        if st.button("Gerar Relatórios Individuais"):
+            st.session_state.download_files.pop('relatorios_individuais_zip', None)
+            st.session_state.pop('log_relatorios_individuais', None)
+            parametros = dict(
+                template_md=template_content if arquivo_template_md else None,
+                template_docx=arquivo_template_docx.getvalue() if arquivo_template_docx else None,
+                contexto_extra=df_contexto_extra,
+                arquivos_contexto={arquivo.name: arquivo.getvalue() for arquivo in arquivos_fontes_contexto},
+            )
+
+            if executar_em_segundo_plano:
+                st.session_state.job_relatorios_individuais = obtem_gerenciador_jobs().submete(
+                    gera_relatorios_individuais_job, auditados, vars_template, **parametros,
+                    tipo='relatorios_individuais', descricao=f"Relatórios individuais de {len(auditados)} auditados"
+                )
+            else:
+                with st.spinner("Gerando relatórios individuais..."):
+                    generation_log = st.expander("Log de Geração", expanded=True)
+
+                    def notifica(sigla, nivel, mensagem):
                         with generation_log:
-                            st.markdown(f"--- \n#### Processando: **{sigla}**")
-                            contexto = row_auditado.to_dict()
-                            contexto['sigla'] = sigla
-
-                            if df_contexto_extra is not None and sigla in df_contexto_extra.index:
-                                contexto.update(df_contexto_extra.loc[sigla].to_dict())
-                            contexto['auditado'] = auditados[sigla]
-
-                            vars_faltantes = set(vars_template) - set(contexto.keys())
-                            if len(vars_faltantes):
-                                st.warning(f'Atenção: As seguintes variáveis estão sendo utilizadas no template, mas não existem nos dados do contexto: {", ".join(vars_faltantes)}\nPara não impedir o processamento da geração, serão preenchidos dados vazios para essas variáveis.')
-                                for var in vars_faltantes:
-                                    contexto[var] = []
-
-                            if arquivo_template_md:
-                                try:
-                                    # Processa as imagens para o contexto do Markdown
-                                    contexto = processa_imagens_contexto(contexto, context_files_path_map, 'md')
-                                    template_content = cross_ref_figuras(template_content)
-
-                                    template_md = env.from_string(template_content)
-                                    conteudo_final_md = template_md.render(contexto)
-
-                                    md_filename = f'tmp/_relatorio-{sigla}.md'
-                                    with open(md_filename, 'w', encoding='utf-8') as f:
-                                        f.write(conteudo_final_md)
-
-                                    docx_filename = f'tmp/relatorio-{sigla}.docx'
-                                    args_docx = ['--figure-caption-position=above', '--reference-doc=' + template_ref_docx]
-                                    pypandoc_logger = logging.getLogger('pypandoc')
-                                    pypandoc_logger.setLevel(logging.WARNING)
-                                    log_container = st.empty()
-                                    handler = StreamlitLogHandler(log_container)
-                                    pypandoc_logger.addHandler(handler)
-
-                                    pypandoc.convert_file(md_filename, to='docx', outputfile=docx_filename, extra_args=args_docx)
-                                    pypandoc_logger.removeHandler(handler)
-
-                                    if not handler.records: st.success(f"Relatório para **{sigla}** gerado.")
-                                    zip_f.write(docx_filename, arcname=f'Relatorio-{sigla}.docx')
-
-                                except exceptions.UndefinedError as e:
-                                    st.error(f"**Erro no template para `{sigla}`:** A variável `{e.message.split(' is undefined')[0]}` não foi encontrada.")
-                                except Exception as e:
-                                    st.error(f"Erro ao gerar relatório para **{sigla}**: {e}")
-                            elif arquivo_template_docx:
-                                try:
-                                    base_docx = DocxTemplate(arquivo_template_docx)
-                                    # Processa as imagens para o contexto do DOCX
-                                    contexto = processa_imagens_contexto(contexto, context_files_path_map, 'docx', base_docx=base_docx)
-                                    base_docx.render(contexto)
-                                except Exception as e:
-                                    st.error(f"Erro ao renderizar o template DOCX para **{sigla}**: {e}")
-
-                                bio = io.BytesIO()
-                                base_docx.save(bio)
-
-                                zip_f.writestr(f"Relatorio-{sigla}.docx", bio.getvalue())
-                                st.success(f"Relatório para **{sigla}** gerado.")
-
-                            else:
-                                st.error("Por favor, forneça um template (colando o texto ou carregando o arquivo).")
-
-                st.session_state.download_files['relatorios_individuais_zip'] = zip_buffer.getvalue()
-            st.success("Geração de relatórios concluída!")
+                            exibe_mensagem_log(nivel, mensagem)
+
+                    st.session_state.download_files['relatorios_individuais_zip'] = gera_relatorios_individuais(
+                        auditados, vars_template, notifica=notifica, **parametros)
+                st.success("Geração de relatórios concluída!")
+
+    if st.session_state.get('job_relatorios_individuais'):
+        acompanha_job(st.session_state.job_relatorios_individuais, carrega_relatorios_individuais,
+                      chave_sessao='job_relatorios_individuais')
+
+    if st.session_state.get('log_relatorios_individuais'):
+        with st.expander("Log de Geração", expanded=False):
+            for _, nivel, mensagem in st.session_state.log_relatorios_individuais:
+                exibe_mensagem_log(nivel, mensagem)
+
+    with st.expander("Gerações em segundo plano"):
+        painel_jobs('relatorios_individuais', carrega_relatorios_individuais)
 
     if 'relatorios_individuais_zip' in st.session_state.download_files:
         st.download_button(
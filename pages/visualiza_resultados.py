@@ -1,8 +1,7 @@
 import streamlit as st
-import pandas as pd
-import io
-import pickle
-import zipfile
+
+from classes import gerar_arquivos_download
+from utils import obtem_gerenciador_jobs, acompanha_job, exibe_tabela_paginada
 
 st.set_page_config(page_title="Visualizar Resultado", layout="wide")
 
@@ -17,92 +16,61 @@ if st.session_state.audit_completed:
     tab_graficos, tab_tabelas = st.tabs(["📊 Visualizar Gráficos", "📄 Visualizar Tabelas"])
 
     with tab_graficos:
+        # Agregados calculados uma única vez, ao concluir a auditoria ou carregar um resultado (ver `classes.gerar_indicadores`)
+        indicadores = results["indicadores"]
+
         st.subheader("Quantitativo de Auditados por Achado")
-        df_achados = results["tabela_achados"]
-        achados_counts = (df_achados == 'X').sum().sort_values(ascending=True)
-        st.bar_chart(achados_counts, horizontal=True)
-
-        all_situations, all_encaminhamentos_texto, all_encaminhamentos_tipo = [], [], []
-        situations_per_auditado, achados_per_auditado = {}, {}
-
-        for sigla, auditado in results["auditados"].items():
-            if auditado.foi_auditado:
-                situacoes = auditado.get_situacoes_inconformes()
-                all_situations.extend(situacoes)
-                situations_per_auditado[sigla] = len(situacoes)
-                achados_per_auditado[sigla] = len(auditado.get_nomes_achados())
-                for p in auditado.procedimentos_executados:
-                    if p.achado:
-                        for e in p.achado.encaminhamentos:
-                            all_encaminhamentos_texto.append(e['encaminhamento'].strip())
-                            all_encaminhamentos_tipo.append(e['tipo'].strip())
+        st.bar_chart(indicadores["auditados_por_achado"], horizontal=True)
 
         col1, col2 = st.columns(2)
         with col1:
             st.subheader("Distribuição por Tipo de Encaminhamento")
-            if all_encaminhamentos_tipo:
-                st.bar_chart(pd.Series(all_encaminhamentos_tipo).value_counts())
+            if not indicadores["auditados_por_tipo_encaminhamento"].empty:
+                st.bar_chart(indicadores["auditados_por_tipo_encaminhamento"])
             else:
                 st.info("Nenhum encaminhamento proposto.")
 
         with col2:
             st.subheader("Top 10 Encaminhamentos Mais Propostos")
-            if all_encaminhamentos_texto:
-                st.bar_chart(pd.Series(all_encaminhamentos_texto).value_counts().nlargest(10).sort_values(ascending=False), sort=False)
+            if not indicadores["encaminhamentos_mais_propostos"].empty:
+                st.bar_chart(indicadores["encaminhamentos_mais_propostos"], sort=False)
             else:
                 st.info("Nenhum encaminhamento proposto.")
 
         st.subheader("Top 10 Situações Inconformes Mais Recorrentes")
-        if all_situations:
-            st.bar_chart(pd.Series(all_situations).value_counts().nlargest(10).sort_values(ascending=False), sort=False)
+        if not indicadores["situacoes_mais_recorrentes"].empty:
+            st.bar_chart(indicadores["situacoes_mais_recorrentes"], sort=False)
         else:
             st.info("Nenhuma situação inconforme encontrada.")
 
         st.subheader("Ranking de Auditados")
-        if situations_per_auditado and achados_per_auditado:
-            df_rank_situacoes = pd.DataFrame.from_dict(situations_per_auditado, orient='index', columns=['Qtd. Situações Inconformes'])
-            df_rank_achados = pd.DataFrame.from_dict(achados_per_auditado, orient='index', columns=['Qtd. Achados Distintos'])
-            df_rank_combined = df_rank_achados.join(df_rank_situacoes).sort_values(by=['Qtd. Achados Distintos', 'Qtd. Situações Inconformes'], ascending=False)
-            st.dataframe(df_rank_combined)
+        if not indicadores["ranking_auditados"].empty:
+            st.dataframe(indicadores["ranking_auditados"])
 
     with tab_tabelas:
         st.subheader("Achados por Auditado")
-        st.dataframe(results["tabela_achados"])
+        exibe_tabela_paginada(results["tabela_achados"], "achados")
         st.subheader("Encaminhamentos por Auditado")
-        st.dataframe(results["tabela_encaminhamentos"])
+        exibe_tabela_paginada(results["tabela_encaminhamentos"], "encaminhamentos")
         st.subheader("Situações Inconformes por Auditado")
-        st.dataframe(results["tabela_situacoes"])
+        exibe_tabela_paginada(results["tabela_situacoes"], "situacoes")
 
     st.header("Baixar Resultados", divider="gray")
 
+    def carrega_arquivos_download(download_files):
+        st.session_state.download_files = download_files
+        st.session_state.pop('job_downloads', None)
+
     if not st.session_state.download_files:
-        with st.spinner("Gerando arquivos para download..."):
-            # 1. Arquivo Pickle
-            pkl_buffer = io.BytesIO()
-            pickle.dump(results["auditados"], pkl_buffer)
-            st.session_state.download_files['pkl'] = pkl_buffer.getvalue()
-
-            # 2. Arquivo Excel
-            excel_buffer = io.BytesIO()
-            with pd.ExcelWriter(excel_buffer, engine='xlsxwriter') as writer:
-                results["tabela_achados"].to_excel(writer, sheet_name='Achados por Auditado')
-                results["tabela_encaminhamentos"].to_excel(writer, sheet_name='Encaminhamentos por Auditado')
-                results["tabela_situacoes"].to_excel(writer, sheet_name='Situações Inconformes')
-            st.session_state.download_files['excel'] = excel_buffer.getvalue()
-
-            # 3. Arquivos DOCX individuais e ZIP
-            zip_buffer = io.BytesIO()
-            with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_f:
-                st.session_state.download_files['docx'] = {}
-                for sigla, auditado in results["auditados"].items():
-                    if auditado.foi_auditado:
-                        doc = auditado.documenta_procedimentos()
-                        bio = io.BytesIO()
-                        doc.save(bio)
-                        docx_bytes = bio.getvalue()
-                        st.session_state.download_files['docx'][sigla] = docx_bytes
-                        zip_f.writestr(f"{auditado.sigla} - Relatorio.docx", docx_bytes)
-            st.session_state.download_files['zip'] = zip_buffer.getvalue()
+        # A geração dos relatórios de todos os auditados pode ser demorada; roda em segundo plano
+        # para não ser perdida se o usuário interagir com a página ou trocar de página
+        if not st.session_state.get('job_downloads'):
+            st.session_state.job_downloads = obtem_gerenciador_jobs().submete(
+                gerar_arquivos_download, results,
+                tipo='arquivos_download', descricao=f"Arquivos para download ({len(results['auditados'])} auditados)"
+            )
+        acompanha_job(st.session_state.job_downloads, carrega_arquivos_download, chave_sessao='job_downloads')
+        st.stop()
 
     st.download_button(
         label="Baixar Objeto Auditados (.pkl)",
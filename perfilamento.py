@@ -0,0 +1,142 @@
+import json
+import time
+
+import pandas as pd
+
+
+# Categorias medidas, na ordem em que aparecem na página 'Desempenho'
+CATEGORIAS = {
+    'fonte': 'Leitura de fontes de informação',
+    'copia': 'Cópia de procedimentos por auditado',
+    'procedimento': 'Procedimentos de auditoria',
+    'acao': 'Ações de verificação',
+    'criterio': 'Critérios (situação inconforme)',
+}
+CAMINHOS = ('eval', 'rpn')
+COLUNAS = ['categoria', 'id', 'descricao', 'chamadas', 'tempo_total_s', 'tempo_medio_ms', 'tempo_max_ms',
+           'caminho_eval', 'caminho_rpn']
+
+# Limite de eventos detalhados guardados quando o rastro está ativo
+MAX_EVENTOS_RASTRO = 50_000
+
+
+class _Medicao:
+    """Mede o bloco `with` e registra o tempo no perfil ao sair; `caminho` pode ser definido dentro do bloco."""
+    __slots__ = ('perfil', 'categoria', 'chave', 'descricao', 'caminho', 'inicio')
+
+    def __init__(self, perfil, categoria, chave, descricao):
+        self.perfil = perfil
+        self.categoria = categoria
+        self.chave = chave
+        self.descricao = descricao
+        self.caminho = None
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.perfil.registra(self.categoria, self.chave, time.perf_counter() - self.inicio,
+                             caminho=self.caminho, descricao=self.descricao)
+        return False
+
+
+class _SemMedicao:
+    """Substituto de `_Medicao` quando não há perfil: não mede nem registra nada."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __setattr__(self, nome, valor):
+        pass
+
+
+_SEM_MEDICAO = _SemMedicao()
+
+
+def mede(perfil, categoria, chave, descricao=None):
+    """
+    Contexto que mede um trecho do processamento no `perfil` (um `PerfilDesempenho`), ou não faz nada
+    quando `perfil` é None — o custo da instrumentação desligada é só o do `with`.
+    """
+    if perfil is None:
+        return _SEM_MEDICAO
+    return _Medicao(perfil, categoria, chave, descricao)
+
+
+class PerfilDesempenho:
+    """
+    Perfil de desempenho de uma auditoria: número de chamadas, tempo acumulado e máximo por fonte de
+    informação, procedimento, ação de verificação e critério, e quantas avaliações de cada critério
+    seguiram o caminho do `eval` ou o da notação polonesa reversa (ver `expressoes.avalia_expressao`).
+
+    Com `rastro=True` guarda também os eventos de cada ação e procedimento executados (situação
+    encontrada, resultado, achado), que substituem as antigas mensagens de depuração. O objeto é
+    passado como argumento (e não guardado nos procedimentos, que são copiados por auditado) e pode ser
+    enviado para e retornado de jobs em segundo plano.
+    """
+    def __init__(self, rastro=False):
+        self.rastro = rastro
+        self._estatisticas = {}
+        self.eventos = []
+
+    def __repr__(self):
+        return f"PerfilDesempenho(itens={len(self._estatisticas)}, eventos={len(self.eventos)})"
+
+    def registra(self, categoria, chave, segundos, caminho=None, descricao=None):
+        estatistica = self._estatisticas.get((categoria, chave))
+        if estatistica is None:
+            estatistica = self._estatisticas[(categoria, chave)] = {
+                'descricao': descricao, 'chamadas': 0, 'tempo_total_s': 0.0, 'tempo_max_s': 0.0,
+                'caminho_eval': 0, 'caminho_rpn': 0,
+            }
+        estatistica['chamadas'] += 1
+        estatistica['tempo_total_s'] += segundos
+        estatistica['tempo_max_s'] = max(estatistica['tempo_max_s'], segundos)
+        if caminho in CAMINHOS:
+            estatistica[f'caminho_{caminho}'] += 1
+
+    def evento(self, tipo, **dados):
+        """Guarda um evento detalhado da execução, se o rastro estiver ativo."""
+        if self.rastro and len(self.eventos) < MAX_EVENTOS_RASTRO:
+            self.eventos.append({'tipo': tipo, **dados})
+
+    def tabela(self, categoria=None):
+        """Retorna as medições como DataFrame, da maior para a menor em tempo acumulado."""
+        linhas = [
+            {
+                'categoria': cat, 'id': chave, 'descricao': e['descricao'], 'chamadas': e['chamadas'],
+                'tempo_total_s': e['tempo_total_s'], 'tempo_medio_ms': 1000 * e['tempo_total_s'] / e['chamadas'],
+                'tempo_max_ms': 1000 * e['tempo_max_s'], 'caminho_eval': e['caminho_eval'], 'caminho_rpn': e['caminho_rpn'],
+            }
+            for (cat, chave), e in self._estatisticas.items() if categoria is None or cat == categoria
+        ]
+        return pd.DataFrame(linhas, columns=COLUNAS).sort_values('tempo_total_s', ascending=False, ignore_index=True)
+
+    def maiores(self, categoria, n=10):
+        """As `n` entradas da categoria com maior tempo acumulado."""
+        return self.tabela(categoria).head(n)
+
+    def resumo(self):
+        """Tempo total e chamadas por categoria, e a fração das avaliações de critério que caiu no caminho RPN."""
+        df = self.tabela()
+        resumo = {
+            categoria: {'chamadas': int(grupo['chamadas'].sum()), 'tempo_total_s': float(grupo['tempo_total_s'].sum())}
+            for categoria, grupo in df.groupby('categoria')
+        }
+        criterios = df[df['categoria'] == 'criterio']
+        avaliacoes = criterios['caminho_eval'].sum() + criterios['caminho_rpn'].sum()
+        resumo['fracao_rpn'] = float(criterios['caminho_rpn'].sum() / avaliacoes) if avaliacoes else None
+        return resumo
+
+    def exporta_csv(self):
+        return self.tabela().to_csv(index=False).encode('utf-8')
+
+    def exporta_json(self):
+        dados = {'resumo': self.resumo(), 'medicoes': json.loads(self.tabela().to_json(orient='records')),
+                 'eventos': self.eventos}
+        return json.dumps(dados, ensure_ascii=False, indent=2, default=str).encode('utf-8')
@@ -0,0 +1,136 @@
+import queue
+import threading
+
+
+# Intervalo com que as etapas verificam o pedido de encerramento enquanto aguardam as filas
+INTERVALO_ESPERA = 0.2
+
+
+class PipelineEnvio:
+    """
+    Antecipa o upload dos arquivos dos próximos auditados enquanto o modelo gera a resposta do atual.
+
+    São três etapas ligadas por filas limitadas: preparação (leitura ou descompressão do arquivo, ou
+    gravação do arquivo temporário), upload e geração. As duas primeiras rodam cada uma em sua thread;
+    a geração é a thread que chama `obtem`. `antecipacao` limita quantos auditados podem estar preparados
+    ou enviados à frente da geração, de modo que a execução fica limitada pela etapa mais lenta, e não
+    pela soma das três, sem acumular arquivos temporários ou uploads sem uso.
+
+    `itens` é a lista, na ordem em que serão usados, de pares (sigla, arquivos a enviar); `prepara(arquivo)`
+    retorna um `arquivos_contexto.ArquivoPreparado` e `envia(preparado)` faz o upload e o descarta. Os
+    eventos das etapas são repassados a `notifica` na thread que chama `obtem` (a exibição no Streamlit
+    só funciona na thread do script).
+    """
+    def __init__(self, itens, prepara, envia, notifica, antecipacao=2):
+        self.itens = [(sigla, arquivos) for sigla, arquivos in itens if arquivos] if antecipacao > 0 else []
+        self.siglas = {sigla for sigla, _ in self.itens}
+        self.prepara = prepara
+        self.envia = envia
+        self.notifica = notifica
+        self._preparados = queue.Queue(maxsize=max(antecipacao, 1))
+        self._enviados = queue.Queue(maxsize=max(antecipacao, 1))
+        self._eventos = queue.Queue()
+        self._parar = threading.Event()
+        self._threads = []
+
+    def __repr__(self):
+        return f"PipelineEnvio(auditados={len(self.itens)}, antecipacao={self._preparados.maxsize})"
+
+    def __contains__(self, sigla):
+        return sigla in self.siglas
+
+    def inicia(self):
+        if not self.itens:
+            return
+        for etapa in (self._etapa_preparacao, self._etapa_upload):
+            thread = threading.Thread(target=etapa, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def encerra(self):
+        """Interrompe as etapas e descarta o que foi preparado e não chegou a ser enviado."""
+        self._parar.set()
+        for thread in self._threads:
+            thread.join(timeout=INTERVALO_ESPERA * 5)
+        while not self._preparados.empty():
+            for preparado in self._preparados.get()[2]:
+                preparado.descarta()
+        self._repassa_eventos()
+
+    def _coloca(self, fila, item):
+        while not self._parar.is_set():
+            try:
+                fila.put(item, timeout=INTERVALO_ESPERA)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _retira(self, fila):
+        while not self._parar.is_set():
+            try:
+                return fila.get(timeout=INTERVALO_ESPERA)
+            except queue.Empty:
+                pass
+        return None
+
+    def _etapa_preparacao(self):
+        for sigla, arquivos in self.itens:
+            preparados, erro = [], None
+            try:
+                for arquivo in arquivos:
+                    preparados.append(self.prepara(arquivo))
+            except Exception as e:
+                erro = e
+                for preparado in preparados:
+                    preparado.descarta()
+                preparados = []
+            if not self._coloca(self._preparados, (sigla, arquivos, preparados, erro)):
+                for preparado in preparados:
+                    preparado.descarta()
+                return
+
+    def _etapa_upload(self):
+        for _ in self.itens:
+            item = self._retira(self._preparados)
+            if item is None:
+                return
+            sigla, arquivos, preparados, erro = item
+            file_objects = []
+            try:
+                for arquivo, preparado in zip(arquivos, preparados):
+                    if erro is None:
+                        self._eventos.put((sigla, 'info', f"📄 Fazendo upload de '{arquivo.name}' para a API..."))
+                        file_objects.append(self.envia(preparado))
+            except Exception as e:
+                erro = e
+            finally:
+                for preparado in preparados:
+                    preparado.descarta()
+            if not self._coloca(self._enviados, (sigla, file_objects, erro)):
+                return
+
+    def _repassa_eventos(self):
+        while not self._eventos.empty():
+            self.notifica(*self._eventos.get())
+
+    def obtem(self, sigla):
+        """
+        Retorna os arquivos enviados do auditado, aguardando o upload se ainda não tiver terminado.
+        Auditados anteriores cujos arquivos não foram pedidos (ex: resposta encontrada no cache nesse
+        meio tempo) são ignorados. Uma falha na preparação ou no upload é relançada aqui.
+        """
+        while True:
+            item = None
+            while item is None:
+                self._repassa_eventos()
+                try:
+                    item = self._enviados.get(timeout=INTERVALO_ESPERA)
+                except queue.Empty:
+                    pass
+            self._repassa_eventos()
+            sigla_item, file_objects, erro = item
+            if sigla_item == sigla:
+                if erro is not None:
+                    raise erro
+                return file_objects
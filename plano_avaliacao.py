@@ -0,0 +1,169 @@
+import math
+
+from expressoes import parse_expression, infix_to_rpn
+
+
+# Custo estimado (em segundos) de buscar e avaliar um campo de uma fonte, antes de haver tempos observados;
+# cresce devagar com o tamanho da fonte (células), pois a busca é indexada pelo auditado
+SEGUNDOS_POR_CAMPO_ESTIMADO = 2e-5
+
+E, OU, NAO, ACAO = 'e', 'ou', 'nao', 'acao'
+
+
+def _arvore(logica_achado, ids_acoes):
+    """
+    Converte a lógica do achado (ex: "(AV01 | AV02) & ~AV03") em uma árvore de tuplas (operador, filhos),
+    agrupando as sequências do mesmo operador ("AV01 | AV02 | AV03" vira um único nó OU com três filhos).
+    Retorna None se a lógica tiver termos que não são ações conhecidas ou não puder ser interpretada.
+    """
+    pilha = []
+    try:
+        for token in infix_to_rpn(parse_expression(logica_achado)):
+            if token in ('&', '|'):
+                direita, esquerda = pilha.pop(), pilha.pop()
+                operador = E if token == '&' else OU
+                filhos = []
+                for filho in (esquerda, direita):
+                    filhos.extend(filho[1] if filho[0] == operador else [filho])
+                pilha.append((operador, filhos))
+            elif token == '~':
+                pilha.append((NAO, pilha.pop()))
+            elif token in ids_acoes:
+                pilha.append((ACAO, token))
+            else:
+                return None
+    except IndexError:
+        return None
+    return pilha[0] if len(pilha) == 1 else None
+
+
+class _Logico:
+    """
+    Valor lógico usado na avaliação da lógica do achado com `eval`: `&`, `|` e `~` são E, OU e NÃO lógicos
+    (em bool do Python, `~False` é -1, que é verdadeiro), com a mesma semântica do plano de avaliação.
+    """
+    __slots__ = ('valor',)
+
+    def __init__(self, valor):
+        self.valor = bool(valor.valor if isinstance(valor, _Logico) else valor)
+
+    def __repr__(self):
+        return f"_Logico({self.valor})"
+
+    def __bool__(self):
+        return self.valor
+
+    def __and__(self, outro):
+        return _Logico(self.valor and bool(outro))
+
+    def __or__(self, outro):
+        return _Logico(self.valor or bool(outro))
+
+    def __invert__(self):
+        return _Logico(not self.valor)
+
+    __rand__, __ror__ = __and__, __or__
+
+
+def avalia_logica(logica_achado, resultados):
+    """
+    Avalia a lógica do achado com `eval`, para as lógicas que não podem ser planejadas, com a mesma semântica
+    do plano: resultados das ações convertidos em bool (None é falso) e `~` como NÃO lógico.
+    """
+    valores = {id_acao: _Logico(resultado) for id_acao, resultado in resultados.items()}
+    return bool(eval(str(logica_achado), {}, valores))
+
+
+class PlanoAvaliacao:
+    """
+    Plano de avaliação em curto-circuito da lógica do achado de um procedimento. A cada avaliação, os
+    termos de cada E/OU são ordenados pelo custo esperado por chance de decidir o resultado (custo /
+    probabilidade de ser falso no E, custo / probabilidade de ser verdadeiro no OU), e os termos que já
+    não podem alterar o resultado deixam de ser avaliados.
+
+    O custo de cada ação começa estimado pelo tamanho da fonte e pelo número de campos buscados e passa
+    a ser o tempo médio observado; a probabilidade de a ação ser verdadeira é a taxa de acerto observada
+    (com suavização de Laplace). O plano é compartilhado pelas cópias do procedimento feitas para cada
+    auditado, acumulando as observações de toda a auditoria.
+    """
+    def __init__(self, logica_achado, arvore, custos_estimados):
+        self.logica_achado = logica_achado
+        self.arvore = arvore
+        self.custos_estimados = custos_estimados
+        # id da ação -> [avaliações, resultados verdadeiros, segundos acumulados]
+        self.observacoes = {id_acao: [0, 0, 0.0] for id_acao in custos_estimados}
+
+    def __repr__(self):
+        avaliacoes = sum(observacao[0] for observacao in self.observacoes.values())
+        return f"PlanoAvaliacao(logica_achado='{self.logica_achado}', acoes={len(self.observacoes)}, avaliacoes={avaliacoes})"
+
+    @classmethod
+    def cria(cls, logica_achado, acoes):
+        """
+        Cria o plano para a lógica e as ações (objetos `AcaoVerificacao`) de um procedimento, ou retorna
+        None se a lógica não puder ser planejada (o procedimento então avalia todas as ações).
+        """
+        acoes = {acao.id: acao for acao in acoes}
+        arvore = _arvore(str(logica_achado), acoes)
+        if arvore is None:
+            return None
+        return cls(logica_achado, arvore, {id_acao: _custo_estimado(acao) for id_acao, acao in acoes.items()})
+
+    def registra(self, id_acao, resultado, segundos):
+        """Registra o resultado e o tempo de uma avaliação da ação."""
+        observacao = self.observacoes[id_acao]
+        observacao[0] += 1
+        observacao[1] += bool(resultado)
+        observacao[2] += segundos
+
+    def avalia(self, avalia_acao):
+        """
+        Avalia a lógica do achado chamando `avalia_acao(id)` (que executa a ação e retorna seu resultado)
+        só para as ações necessárias, na ordem do plano. Retorna se o achado ocorreu.
+        """
+        return self._avalia(self.arvore, avalia_acao)
+
+    def _avalia(self, no, avalia_acao):
+        operador, filhos = no
+        if operador == ACAO:
+            return bool(avalia_acao(filhos))
+        if operador == NAO:
+            return not self._avalia(filhos, avalia_acao)
+        decisivo = operador == OU  # O valor que encerra a avaliação: verdadeiro no OU, falso no E
+        for filho, _, _ in self._ordena(operador, filhos):
+            if self._avalia(filho, avalia_acao) == decisivo:
+                return decisivo
+        return not decisivo
+
+    def _ordena(self, operador, filhos):
+        """Termos de um E/OU com suas estimativas, (filho, probabilidade, custo), na ordem de avaliação."""
+        def prioridade(estimativa):
+            _, probabilidade, custo = estimativa
+            chance_decidir = probabilidade if operador == OU else 1 - probabilidade
+            return custo / chance_decidir if chance_decidir > 0 else math.inf
+        return sorted(((filho, *self._estimativa(filho)) for filho in filhos), key=prioridade)
+
+    def _estimativa(self, no):
+        """Probabilidade de o nó ser verdadeiro e custo esperado da sua avaliação (supondo ações independentes)."""
+        operador, filhos = no
+        if operador == ACAO:
+            avaliacoes, verdadeiros, segundos = self.observacoes[filhos]
+            custo = segundos / avaliacoes if avaliacoes else self.custos_estimados[filhos]
+            return (verdadeiros + 1) / (avaliacoes + 2), custo
+        if operador == NAO:
+            probabilidade, custo = self._estimativa(filhos)
+            return 1 - probabilidade, custo
+
+        # E/OU na ordem do plano: cada termo só é avaliado se os anteriores não decidiram o resultado
+        probabilidade_continuar, custo_esperado = 1.0, 0.0
+        for _, probabilidade, custo in self._ordena(operador, filhos):
+            custo_esperado += probabilidade_continuar * custo
+            probabilidade_continuar *= probabilidade if operador == E else 1 - probabilidade
+        return (probabilidade_continuar if operador == E else 1 - probabilidade_continuar), custo_esperado
+
+
+def _custo_estimado(acao):
+    campos = len(str(acao.informacao_requerida).split('|'))
+    info = getattr(acao.fonte_informacao, 'info', None)
+    celulas = info.size if info is not None else 0
+    return SEGUNDOS_POR_CAMPO_ESTIMADO * campos * (1 + math.log10(1 + celulas))
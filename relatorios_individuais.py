@@ -0,0 +1,269 @@
+import io
+import os
+import re
+import zipfile
+import logging
+import tempfile
+
+from jinja2 import Environment, BaseLoader, StrictUndefined, exceptions
+
+
+# Modelo de estilos usado pelo pandoc na conversão dos relatórios em Markdown
+TEMPLATE_REFERENCIA_DOCX = 'docs/template-relatorio-individual.docx'
+
+EXTENSOES_IMAGEM = ('.png', '.jpg', '.jpeg', '.gif', '.bmp')
+
+
+class _RegistroLog(logging.Handler):
+    """Guarda as mensagens de log emitidas durante a conversão de um relatório."""
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(self.format(record))
+
+
+def processa_imagens_contexto(contexto, context_files_path_map, template_type, base_docx=None, avisos=None):
+    """
+    Substitui nomes de arquivos de imagem no contexto pelos caminhos ou objetos de imagem apropriados.
+    Os problemas encontrados são acrescentados à lista `avisos`, quando informada.
+    """
+    avisos = avisos if avisos is not None else []
+
+    # Itera sobre uma cópia dos itens para permitir a modificação do dicionário
+    for key, value in list(contexto.items()):
+        if isinstance(value, str) and value.lower().endswith(EXTENSOES_IMAGEM):
+            if value in context_files_path_map:
+                image_path = context_files_path_map[value]
+                if template_type == 'docx':
+                    if base_docx is None:
+                        avisos.append("O objeto base_docx é necessário para processar imagens em templates .docx")
+                        continue
+                    # Para docx, substitui pelo objeto InlineImage (docxtpl só é carregado quando há imagem)
+                    from docxtpl import InlineImage
+                    from docx.shared import Mm
+                    contexto[key] = InlineImage(base_docx, image_path, width=Mm(160))
+                elif template_type == 'md':
+                    # Para markdown, substitui pelo caminho do arquivo
+                    contexto[key] = image_path
+            else:
+                avisos.append(f"Arquivo de imagem '{value}' para a variável '{key}' não encontrado. A imagem não será inserida.")
+                contexto[key] = f"[Imagem '{value}' não encontrada]"
+
+    return contexto
+
+def cross_ref_figuras(template_str: str) -> str:
+    """
+    Processa um template de texto para numerar automaticamente as referências
+    de figuras e modificar as legendas das imagens, preservando os
+    atributos de formatação do Pandoc (ex: {width=10cm}).
+
+    A função opera em duas passadas:
+
+    1. Mapeamento:
+       Encontra todas as declarações ({#fig:ID#}) e referências ([@fig:ID])
+       na ordem em que aparecem para criar um mapa de numeração
+       (ex: {'fig_01': 1, 'fig_02': 2}).
+
+    2. Substituição:
+       - Substitui referências de texto (ex: [@fig:fig_01] -> "Figura 1").
+       - Encontra as linhas de imagem (ex: ![Texto]({{path}}){attrs}{#fig:ID#})
+         e as substitui por "![Figura 1 - Texto]({{path}}){attrs}".
+    """
+
+    # --- Passa 1: Mapeamento ---
+
+    figura_map = {}
+    contador = 1
+
+    # Regex combinada (NÃO MUDA)
+    regex_combinado = r"(?:\{#fig:([^#]+)#\}|\[@fig:([^\]]+)\])"
+
+    for match in re.finditer(regex_combinado, template_str):
+        id_declaracao = match.group(1)
+        id_referencia = match.group(2)
+        fig_id = id_declaracao if id_declaracao else id_referencia
+
+        if fig_id and fig_id not in figura_map:
+            figura_map[fig_id] = contador
+            contador += 1
+
+    if not figura_map:
+        return template_str
+
+    # --- Passa 2: Substituições ---
+
+    texto_processado = template_str
+
+    # 1. Substituir referências de TEXTO (NÃO MUDA)
+    regex_ref_texto = r"\[@fig:([^\]]+)\]"
+
+    def substituir_ref_texto(match):
+        fig_id = match.group(1)
+        if fig_id in figura_map:
+            return f"Figura {figura_map[fig_id]}"
+        return match.group(0)
+
+    texto_processado = re.sub(regex_ref_texto, substituir_ref_texto, texto_processado)
+
+    # 2. Modificar linhas de IMAGEM e remover tags de declaração (MODIFICADO)
+
+    # Regex ATUALIZADA:
+    # Grupo 1: ![ (alt text) ]
+    # Grupo 2: (path)
+    # Grupo 3: (bloco de atributos opcional, ex: {width=10cm})
+    # Grupo 4: {#fig: (ID) #}
+    regex_imagem_decl = r"!\[([^\]]*)\](\([^)]*\))\s*(\{[^}]*\})?\s*\{#fig:([^#]+)#\}"
+
+    def modificar_legenda_imagem(match):
+        alt_text = match.group(1)
+        path = match.group(2)
+        attributes = match.group(3)  # O bloco {width=10cm}
+        fig_id = match.group(4)
+
+        if fig_id in figura_map:
+            numero = figura_map[fig_id]
+
+            # Se o grupo de atributos não for encontrado (None),
+            # o transformamos em uma string vazia.
+            attr_str = attributes if attributes else ""
+
+            # Reconstrói a string: ![Figura X - Texto](path){atributos}
+            return f"![Figura {numero} - {alt_text}]{path}{attr_str}"
+
+        return match.group(0) # Failsafe
+
+    texto_processado = re.sub(regex_imagem_decl, modificar_legenda_imagem, texto_processado)
+
+    return texto_processado
+
+
+def _grava_arquivos_contexto(arquivos_contexto, diretorio):
+    """
+    Grava os arquivos de contexto (nome -> bytes) no diretório, extraindo os .zip uma única vez, e
+    retorna o mapa nome do arquivo -> caminho usado para localizar as imagens citadas no contexto.
+    """
+    mapa = {}
+    for nome, conteudo in arquivos_contexto.items():
+        if nome.lower().endswith('.zip'):
+            destino = os.path.join(diretorio, 'zip')
+            with zipfile.ZipFile(io.BytesIO(conteudo), 'r') as zip_ref:
+                zip_ref.extractall(destino)
+            for root, _, files in os.walk(destino):
+                for filename in files:
+                    mapa[filename] = os.path.join(root, filename)
+        else:
+            caminho = os.path.join(diretorio, nome)
+            with open(caminho, 'wb') as f:
+                f.write(conteudo)
+            mapa[nome] = caminho
+    return mapa
+
+
+def gera_relatorios_individuais(auditados, variaveis_template, template_md=None, template_docx=None, contexto_extra=None,
+                                arquivos_contexto=None, notifica=None, progresso=None):
+    """
+    Gera um relatório .docx por auditado a partir de um template Markdown/Jinja2 (convertido pelo pandoc)
+    ou de um template .docx (docxtpl), e retorna o .zip com todos os relatórios (bytes).
+
+    `template_docx` são os bytes do arquivo; `contexto_extra` é o DataFrame da planilha de contexto indexado
+    pela sigla; `arquivos_contexto` mapeia nome -> bytes dos arquivos citados nessa planilha. O andamento é
+    informado a `notifica(sigla, nivel, mensagem)`, com nivel 'inicio', 'success', 'warning' ou 'error', e,
+    quando executado como job, a `progresso`.
+    """
+    # pypandoc e docxtpl são carregados só na geração
+    import pypandoc
+    from docxtpl import DocxTemplate
+
+    notifica = notifica or (lambda sigla, nivel, mensagem: None)
+    template_compilado = None
+    if template_md:
+        template_compilado = Environment(loader=BaseLoader(), undefined=StrictUndefined).from_string(cross_ref_figuras(template_md))
+
+    pypandoc_logger = logging.getLogger('pypandoc')
+    pypandoc_logger.setLevel(logging.WARNING)
+
+    zip_buffer = io.BytesIO()
+    total = len(auditados)
+    with tempfile.TemporaryDirectory() as diretorio, zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_f:
+        context_files_path_map = _grava_arquivos_contexto(arquivos_contexto or {}, diretorio)
+
+        for i, (sigla, auditado) in enumerate(auditados.items(), start=1):
+            notifica(sigla, 'inicio', f"Processando: **{sigla}**")
+            contexto = {'nome': auditado.nome, 'sigla': sigla}
+            if contexto_extra is not None and sigla in contexto_extra.index:
+                contexto.update(contexto_extra.loc[sigla].to_dict())
+            contexto['auditado'] = auditado
+
+            vars_faltantes = set(variaveis_template) - set(contexto.keys())
+            if len(vars_faltantes):
+                notifica(sigla, 'warning', f'Atenção: As seguintes variáveis estão sendo utilizadas no template, mas não existem nos dados do contexto: {", ".join(vars_faltantes)}\nPara não impedir o processamento da geração, serão preenchidos dados vazios para essas variáveis.')
+                for var in vars_faltantes:
+                    contexto[var] = []
+
+            avisos = []
+            if template_compilado is not None:
+                try:
+                    # Processa as imagens para o contexto do Markdown
+                    contexto = processa_imagens_contexto(contexto, context_files_path_map, 'md', avisos=avisos)
+                    conteudo_final_md = template_compilado.render(contexto)
+
+                    md_filename = os.path.join(diretorio, f'_relatorio-{sigla}.md')
+                    with open(md_filename, 'w', encoding='utf-8') as f:
+                        f.write(conteudo_final_md)
+
+                    docx_filename = os.path.join(diretorio, f'relatorio-{sigla}.docx')
+                    args_docx = ['--figure-caption-position=above', '--reference-doc=' + TEMPLATE_REFERENCIA_DOCX]
+                    handler = _RegistroLog()
+                    pypandoc_logger.addHandler(handler)
+                    try:
+                        pypandoc.convert_file(md_filename, to='docx', outputfile=docx_filename, extra_args=args_docx)
+                    finally:
+                        pypandoc_logger.removeHandler(handler)
+                    avisos.extend(handler.records)
+
+                    zip_f.write(docx_filename, arcname=f'Relatorio-{sigla}.docx')
+                    for aviso in avisos:
+                        notifica(sigla, 'warning', aviso)
+                    if not handler.records:
+                        notifica(sigla, 'success', f"Relatório para **{sigla}** gerado.")
+
+                except exceptions.UndefinedError as e:
+                    notifica(sigla, 'error', f"**Erro no template para `{sigla}`:** A variável `{e.message.split(' is undefined')[0]}` não foi encontrada.")
+                except Exception as e:
+                    notifica(sigla, 'error', f"Erro ao gerar relatório para **{sigla}**: {e}")
+            elif template_docx:
+                try:
+                    base_docx = DocxTemplate(io.BytesIO(template_docx))
+                    # Processa as imagens para o contexto do DOCX
+                    contexto = processa_imagens_contexto(contexto, context_files_path_map, 'docx', base_docx=base_docx, avisos=avisos)
+                    base_docx.render(contexto)
+
+                    bio = io.BytesIO()
+                    base_docx.save(bio)
+                    zip_f.writestr(f"Relatorio-{sigla}.docx", bio.getvalue())
+                    for aviso in avisos:
+                        notifica(sigla, 'warning', aviso)
+                    notifica(sigla, 'success', f"Relatório para **{sigla}** gerado.")
+                except Exception as e:
+                    notifica(sigla, 'error', f"Erro ao renderizar o template DOCX para **{sigla}**: {e}")
+            else:
+                notifica(sigla, 'error', "Por favor, forneça um template (colando o texto ou carregando o arquivo).")
+
+            if progresso:
+                progresso.atualiza(i / total, f"Relatório de {sigla} processado ({i}/{total}).")
+
+    return zip_buffer.getvalue()
+
+
+def gera_relatorios_individuais_job(auditados, variaveis_template, progresso=None, **kwargs):
+    """
+    Versão de `gera_relatorios_individuais` para execução como job em segundo plano: retorna o .zip e o
+    log da geração, lista de (sigla, nivel, mensagem), que a página exibe ao carregar o resultado.
+    """
+    log = []
+    zip_relatorios = gera_relatorios_individuais(auditados, variaveis_template, progresso=progresso,
+                                                 notifica=lambda sigla, nivel, mensagem: log.append((sigla, nivel, mensagem)),
+                                                 **kwargs)
+    return {'zip': zip_relatorios, 'log': log}
@@ -0,0 +1,122 @@
+import json
+import time
+import threading
+
+import pandas as pd
+
+
+COLUNAS = ['tipo', 'rotulo', 'modelo', 'inicio', 'duracao_s', 'latencia_s', 'primeiro_token_s', 'tentativas', 'erro',
+           'tokens_entrada', 'tokens_saida', 'tokens_cache', 'tokens_raciocinio', 'bytes']
+COLUNAS_NUMERICAS = ['inicio', 'duracao_s', 'latencia_s', 'primeiro_token_s', 'tentativas',
+                     'tokens_entrada', 'tokens_saida', 'tokens_cache', 'tokens_raciocinio', 'bytes']
+
+
+def _uso(response):
+    """Extrai as contagens de tokens do `usage_metadata` da resposta, quando disponível."""
+    uso = getattr(response, 'usage_metadata', None)
+    return {
+        'tokens_entrada': getattr(uso, 'prompt_token_count', None),
+        'tokens_saida': getattr(uso, 'candidates_token_count', None),
+        'tokens_cache': getattr(uso, 'cached_content_token_count', None),
+        'tokens_raciocinio': getattr(uso, 'thoughts_token_count', None),
+    }
+
+
+class Telemetria:
+    """
+    Registro das chamadas ao Gemini e dos uploads de uma execução, para identificar se ela está
+    limitada pelo envio de arquivos, pela latência do modelo ou pela cota (novas tentativas).
+
+    Cada requisição gera um evento com duração total (incluindo esperas entre tentativas), latência
+    da tentativa final, tempo até o primeiro trecho (streaming), número de tentativas, erro e tokens
+    de entrada/saída; cada upload, um evento com duração e bytes enviados. Pode ser compartilhada
+    entre threads.
+    """
+    def __init__(self):
+        self._eventos = []
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"Telemetria(eventos={len(self._eventos)})"
+
+    def __getstate__(self):
+        estado = self.__dict__.copy()
+        del estado['_lock']
+        return estado
+
+    def __setstate__(self, estado):
+        self.__dict__.update(estado)
+        self._lock = threading.Lock()
+
+    def _registra(self, evento):
+        with self._lock:
+            self._eventos.append(evento)
+
+    def registra_geracao(self, modelo, rotulo, inicio, latencia, tentativas, response=None, erro=None, primeiro_token=None):
+        """Registra uma requisição de geração. `inicio` é o `time.time()` do começo da primeira tentativa."""
+        self._registra({
+            'tipo': 'geracao',
+            'rotulo': rotulo,
+            'modelo': modelo,
+            'inicio': inicio,
+            'duracao_s': time.time() - inicio,
+            'latencia_s': latencia,
+            'primeiro_token_s': primeiro_token,
+            'tentativas': tentativas,
+            'erro': erro,
+            **_uso(response),
+        })
+
+    def registra_upload(self, rotulo, inicio, tamanho, erro=None):
+        """Registra o upload de um arquivo de contexto."""
+        duracao = time.time() - inicio
+        self._registra({
+            'tipo': 'upload',
+            'rotulo': rotulo,
+            'inicio': inicio,
+            'duracao_s': duracao,
+            'latencia_s': duracao,
+            'tentativas': 1,
+            'erro': erro,
+            'bytes': tamanho,
+        })
+
+    def tabela(self):
+        """Retorna todos os eventos registrados como DataFrame."""
+        with self._lock:
+            eventos = list(self._eventos)
+        df = pd.DataFrame(eventos, columns=COLUNAS)
+        df[COLUNAS_NUMERICAS] = df[COLUNAS_NUMERICAS].apply(pd.to_numeric, errors='coerce')
+        return df
+
+    def resumo(self):
+        """Agregados da execução: latência p50/p95, tokens por segundo, taxa de erro, novas tentativas e uploads."""
+        df = self.tabela()
+        geracoes = df[df['tipo'] == 'geracao']
+        uploads = df[df['tipo'] == 'upload']
+        sucesso = geracoes[geracoes['erro'].isna()]
+
+        tempo_geracao = sucesso['latencia_s'].sum()
+        tokens_saida = sucesso['tokens_saida'].fillna(0).sum()
+        return {
+            'requisicoes': len(geracoes),
+            'erros': int(geracoes['erro'].notna().sum()),
+            'taxa_erro': float(geracoes['erro'].notna().mean()) if len(geracoes) else 0.0,
+            'novas_tentativas': int((geracoes['tentativas'].fillna(1) - 1).sum()),
+            'latencia_p50_s': float(sucesso['latencia_s'].quantile(0.5)) if len(sucesso) else None,
+            'latencia_p95_s': float(sucesso['latencia_s'].quantile(0.95)) if len(sucesso) else None,
+            'tokens_entrada': int(sucesso['tokens_entrada'].fillna(0).sum()),
+            'tokens_saida': int(tokens_saida),
+            'tokens_por_segundo': float(tokens_saida / tempo_geracao) if tempo_geracao else None,
+            'tempo_espera_s': float((geracoes['duracao_s'] - geracoes['latencia_s']).sum()),
+            'uploads': len(uploads),
+            'bytes_enviados': int(uploads['bytes'].fillna(0).sum()),
+            'tempo_upload_s': float(uploads['duracao_s'].sum()),
+        }
+
+    def exporta_csv(self):
+        return self.tabela().to_csv(index=False).encode('utf-8')
+
+    def exporta_json(self):
+        dados = {'resumo': self.resumo(), 'eventos': json.loads(self.tabela().to_json(orient='records'))}
+        return json.dumps(dados, ensure_ascii=False, indent=2).encode('utf-8')
@@ -1,22 +1,65 @@
-import re
+import io
+import time
 import streamlit as st
 import pandas as pd
 import jinja2
 from jinja2 import Environment, BaseLoader, StrictUndefined
-from google.genai import types
-from docxtpl import InlineImage
-from docx.shared import Mm
 import logging
 
+from classes import le_planilha, pagina_tabela
+from cache_respostas import hash_conteudo
+from jobs import GerenciadorJobs, STATUS_CONCLUIDO, STATUS_ERRO, STATUS_FINAIS
+
+
+# Caches compartilhados entre sessões e reruns: planilhas carregadas (pelo hash do conteúdo), clientes do
+# Gemini e templates compilados. Entradas expiram após TTL_CACHE segundos e cada cache guarda no máximo
+# MAX_ENTRADAS_CACHE entradas, descartando as mais antigas, para limitar a memória do servidor.
+TTL_CACHE = 60 * 60
+MAX_ENTRADAS_CACHE = 32
+LINHAS_POR_PAGINA = 200  # Linhas das tabelas consolidadas exibidas por vez
+
+
+@st.cache_data(ttl=TTL_CACHE, max_entries=MAX_ENTRADAS_CACHE, show_spinner=False)
+def _le_planilha_cache(hash_arquivo, _conteudo, sheet_name, skiprows, limpa_textos):
+    # O conteúdo (prefixo '_') não entra na chave do cache; a chave é o hash dele
+    if limpa_textos:
+        return le_planilha(io.BytesIO(_conteudo), sheet_name=sheet_name, skiprows=skiprows)
+    return pd.read_excel(io.BytesIO(_conteudo), sheet_name=sheet_name, skiprows=skiprows)
+
+def le_planilha_carregada(arquivo, sheet_name=0, skiprows=0, limpa_textos=False):
+    """
+    Lê a planilha de um arquivo carregado no Streamlit, reaproveitando a leitura entre reruns e sessões
+    enquanto o conteúdo for o mesmo. Cada chamada recebe sua própria cópia do DataFrame.
+    `limpa_textos` remove os espaços nas bordas dos textos (ver `classes.le_planilha`).
+    """
+    conteudo = arquivo.getvalue()
+    return _le_planilha_cache(hash_conteudo(conteudo), conteudo, sheet_name, skiprows, limpa_textos)
 
 def carregar_dados(filepath, sheet_name=0, skiprows=2):
     """Lê um arquivo Excel e retorna um DataFrame, tratando erros."""
     try:
-        return pd.read_excel(filepath, sheet_name=sheet_name, skiprows=skiprows).map(lambda x: x.strip() if isinstance(x, str) else x)
+        if hasattr(filepath, 'getvalue'):
+            return le_planilha_carregada(filepath, sheet_name=sheet_name, skiprows=skiprows, limpa_textos=True)
+        return le_planilha(filepath, sheet_name=sheet_name, skiprows=skiprows)
     except Exception as e:
         st.error(f"Erro ao carregar a planilha '{sheet_name}': {e}")
         return None
 
+@st.cache_resource(ttl=TTL_CACHE, max_entries=MAX_ENTRADAS_CACHE, show_spinner=False)
+def _cliente_gemini(hash_chave, _api_key):
+    from google import genai
+    return genai.Client(api_key=_api_key)
+
+def obtem_cliente_gemini(api_key):
+    """Retorna o cliente da API do Gemini para a chave, criado uma vez e compartilhado (a chave entra no cache só como hash)."""
+    return _cliente_gemini(hash_conteudo(api_key), api_key)
+
+@st.cache_resource(ttl=TTL_CACHE, max_entries=MAX_ENTRADAS_CACHE, show_spinner=False)
+def compila_template(texto_template):
+    """Compila um template Jinja2 (com `StrictUndefined`) uma única vez por conteúdo; o template compilado pode ser usado por várias sessões."""
+    return Environment(loader=BaseLoader(), undefined=StrictUndefined).from_string(texto_template)
+
+@st.cache_data(ttl=TTL_CACHE, max_entries=MAX_ENTRADAS_CACHE, show_spinner=False)
 def get_variaveis_template(template_md_content):
     """Coleta as variáveis presentes em um template Jinja2."""
     if not template_md_content:
@@ -38,234 +81,91 @@ class StreamlitLogHandler(logging.Handler):
         self.container.warning(msg)
 
 
-def parse_expression(expression):
-    tokens = []
-    current_token = ''
-
-    for char in expression:
-        if char in {'|', '&', '~', '(', ')'}:
-            if current_token:
-                tokens.append(current_token.strip())
-                current_token = ''
-            tokens.append(char)
-        else:
-            current_token += char
-
-    if current_token:
-        tokens.append(current_token.strip())
-
-    return tokens
-
-def infix_to_rpn(tokens):
-    precedence = {'~': 3, '&': 2, '|': 1}
-    output = []
-    stack = []
-
-    for token in tokens:
-        if token == '(':
-            # Abre parêntese
-            stack.append(token)
-        elif token == ')':
-            # Fecha parêntese
-            while stack and stack[-1] != '(':
-                output.append(stack.pop())
-            stack.pop()  # Remove o '('
-        elif token in precedence:
-            # Operador
-            while stack and stack[-1] in precedence and precedence[stack[-1]] >= precedence[token]:
-                output.append(stack.pop())
-            stack.append(token)
-        else:
-            output.append(token)
-
-    while stack:
-        output.append(stack.pop())
-
-    return list(filter(lambda x: x != '', output))
-
-def avalia_expressao(expressao_achado, situacao_encontrada, debug=False):
-    expressao_achado = str(expressao_achado)
-    situacao_encontrada = str(situacao_encontrada)
-
-    # Primeiro tenta se é o caso de um eval
-    try:
-        if debug:
-            print(f"Testando se {situacao_encontrada} {expressao_achado} = {eval(f'{situacao_encontrada} {expressao_achado}')}")
-        return eval(f'{situacao_encontrada} {expressao_achado}')
-    except Exception as e:
-        parsed_tokens = parse_expression(expressao_achado)
-        tokens = infix_to_rpn(parsed_tokens)
-
-        #print(tokens)
+@st.cache_resource
+def obtem_gerenciador_jobs():
+    """Retorna o gerenciador de jobs em segundo plano, único para todo o servidor."""
+    return GerenciadorJobs()
 
-        pilha = []
-
-        for token in tokens:
-            if token == '|':
-                # Operador OR
-                y = pilha.pop()
-                x = pilha.pop()
-                pilha.append(x or y)
-            elif token == '&':
-                # Operador AND
-                y = pilha.pop()
-                x = pilha.pop()
-                pilha.append(x and y)
-            elif token == '~':
-                x = pilha.pop()
-                pilha.append(not x)
-            else:
-                # Aqui se remove o '.' no final da string pois não está padronizada as respostas.
-                # Assim, encontra-se resposta terminando em '.' como 'Não adota' ou 'Não adota.'
-                a = re.sub(r'\.$', '', token)
-                b = re.sub(r'\.$', '', situacao_encontrada)
-                if debug:
-                    print(f"    Checa se {a} == {b} - ", a == b)
-                pilha.append(a == b)
-
-        if len(pilha) == 1:
-            if debug:
-                print('        Achado:', pilha[0])
+@st.fragment(run_every=2)
+def acompanha_job(job_id, ao_concluir, chave_sessao=None):
+    """
+    Exibe o progresso de um job e, quando ele termina com sucesso, entrega o resultado a `ao_concluir`.
 
-            return pilha[0]
+    Se o job falhar ou for cancelado e `chave_sessao` (a chave do estado da sessão que guarda o id do job)
+    for informada, exibe um botão que a descarta, permitindo submeter o job novamente.
+    """
+    gerenciador = obtem_gerenciador_jobs()
+    job = gerenciador.status(job_id)
+    if job is None:
+        return
+
+    if job['status'] == STATUS_CONCLUIDO:
+        ao_concluir(gerenciador.resultado(job_id))
+        st.rerun(scope='app')
+    elif job['status'] in STATUS_FINAIS:
+        if job['status'] == STATUS_ERRO:
+            st.error(f"O job '{job['descricao']}' falhou: {job['erro'].splitlines()[0]}")
+            with st.expander("Detalhes do erro"):
+                st.code(job['erro'])
         else:
-            raise ValueError("Expressão lógica inválida")
-
-def processa_imagens_contexto(contexto, context_files_path_map, template_type, base_docx=None):
-    """Substitui nomes de arquivos de imagem no contexto pelos caminhos ou objetos de imagem apropriados."""
-    image_extensions = ('.png', '.jpg', '.jpeg', '.gif', '.bmp')
-
-    # Itera sobre uma cópia dos itens para permitir a modificação do dicionário
-    for key, value in list(contexto.items()):
-        if isinstance(value, str) and value.lower().endswith(image_extensions):
-            if value in context_files_path_map:
-                image_path = context_files_path_map[value]
-                if template_type == 'docx':
-                    if base_docx is None:
-                        st.error("O objeto base_docx é necessário para processar imagens em templates .docx")
-                        continue
-                    # Para docx, substitui pelo objeto InlineImage
-                    contexto[key] = InlineImage(base_docx, image_path, width=Mm(160))
-                elif template_type == 'md':
-                    # Para markdown, substitui pelo caminho do arquivo
-                    contexto[key] = image_path
-            else:
-                st.warning(f"Arquivo de imagem '{value}' para a variável '{key}' não encontrado. A imagem não será inserida.")
-                contexto[key] = f"[Imagem '{value}' não encontrada]"
-
-    return contexto
-
-def cross_ref_figuras(template_str: str) -> str:
+            st.warning(f"O job '{job['descricao']}' terminou com status '{job['status']}'.")
+        if chave_sessao and st.button("Tentar novamente", key=f"tenta_novamente_{job_id}"):
+            st.session_state.pop(chave_sessao, None)
+            st.rerun(scope='app')
+    else:
+        st.progress(min(1.0, job['progresso'] or 0.0), text=f"{job['descricao']}: {job['mensagem'] or job['status']}")
+        if st.button("Cancelar", key=f"cancela_{job_id}"):
+            gerenciador.cancela(job_id)
+
+@st.fragment(run_every=5)
+def painel_jobs(tipo, ao_carregar, rotulo_carregar="Carregar resultado"):
     """
-    Processa um template de texto para numerar automaticamente as referências
-    de figuras e modificar as legendas das imagens, preservando os
-    atributos de formatação do Pandoc (ex: {width=10cm}).
-
-    A função opera em duas passadas:
-
-    1. Mapeamento:
-       Encontra todas as declarações ({#fig:ID#}) e referências ([@fig:ID])
-       na ordem em que aparecem para criar um mapa de numeração
-       (ex: {'fig_01': 1, 'fig_02': 2}).
-
-    2. Substituição:
-       - Substitui referências de texto (ex: [@fig:fig_01] -> "Figura 1").
-       - Encontra as linhas de imagem (ex: ![Texto]({{path}}){attrs}{#fig:ID#})
-         e as substitui por "![Figura 1 - Texto]({{path}}){attrs}".
+    Lista os jobs recentes do tipo informado (de qualquer sessão), com status, progresso e log,
+    permitindo carregar o resultado dos concluídos, cancelar os em andamento e remover os finalizados.
     """
-
-    # --- Passa 1: Mapeamento ---
-
-    figura_map = {}
-    contador = 1
-
-    # Regex combinada (NÃO MUDA)
-    regex_combinado = r"(?:\{#fig:([^#]+)#\}|\[@fig:([^\]]+)\])"
-
-    for match in re.finditer(regex_combinado, template_str):
-        id_declaracao = match.group(1)
-        id_referencia = match.group(2)
-        fig_id = id_declaracao if id_declaracao else id_referencia
-
-        if fig_id and fig_id not in figura_map:
-            figura_map[fig_id] = contador
-            contador += 1
-
-    if not figura_map:
-        return template_str
-
-    # --- Passa 2: Substituições ---
-
-    texto_processado = template_str
-
-    # 1. Substituir referências de TEXTO (NÃO MUDA)
-    regex_ref_texto = r"\[@fig:([^\]]+)\]"
-
-    def substituir_ref_texto(match):
-        fig_id = match.group(1)
-        if fig_id in figura_map:
-            return f"Figura {figura_map[fig_id]}"
-        return match.group(0)
-
-    texto_processado = re.sub(regex_ref_texto, substituir_ref_texto, texto_processado)
-
-    # 2. Modificar linhas de IMAGEM e remover tags de declaração (MODIFICADO)
-
-    # Regex ATUALIZADA:
-    # Grupo 1: ![ (alt text) ]
-    # Grupo 2: (path)
-    # Grupo 3: (bloco de atributos opcional, ex: {width=10cm})
-    # Grupo 4: {#fig: (ID) #}
-    regex_imagem_decl = r"!\[([^\]]*)\](\([^)]*\))\s*(\{[^}]*\})?\s*\{#fig:([^#]+)#\}"
-
-    def modificar_legenda_imagem(match):
-        alt_text = match.group(1)
-        path = match.group(2)
-        attributes = match.group(3)  # O bloco {width=10cm}
-        fig_id = match.group(4)
-
-        if fig_id in figura_map:
-            numero = figura_map[fig_id]
-
-            # Se o grupo de atributos não for encontrado (None),
-            # o transformamos em uma string vazia.
-            attr_str = attributes if attributes else ""
-
-            # Reconstrói a string: ![Figura X - Texto](path){atributos}
-            return f"![Figura {numero} - {alt_text}]{path}{attr_str}"
-
-        return match.group(0) # Failsafe
-
-    texto_processado = re.sub(regex_imagem_decl, modificar_legenda_imagem, texto_processado)
-
-    return texto_processado
-
-
-def avalia_gemini(client, prompt_text: str, modelo, temperature, response_format_choice, file_objects = []):
+    gerenciador = obtem_gerenciador_jobs()
+    jobs_tipo = gerenciador.lista(tipo)
+    if not jobs_tipo:
+        st.caption("Nenhum job em segundo plano.")
+        return
+
+    for job in jobs_tipo:
+        with st.container(border=True):
+            col1, col2 = st.columns([4, 1])
+            with col1:
+                criado_em = time.strftime('%d/%m/%Y %H:%M:%S', time.localtime(job['criado_em']))
+                st.markdown(f"**{job['descricao'] or job['tipo']}** — {job['status']} (enviado em {criado_em})")
+                if job['status'] not in STATUS_FINAIS:
+                    st.progress(min(1.0, job['progresso'] or 0.0), text=job['mensagem'] or '')
+                elif job['status'] == STATUS_ERRO:
+                    st.error(job['erro'].splitlines()[0])
+                if job['log']:
+                    with st.expander("Log"):
+                        st.code(job['log'])
+            with col2:
+                if job['status'] not in STATUS_FINAIS:
+                    if st.button("Cancelar", key=f"painel_cancela_{job['id']}"):
+                        gerenciador.cancela(job['id'])
+                        st.rerun(scope='fragment')
+                else:
+                    if job['status'] == STATUS_CONCLUIDO and st.button(rotulo_carregar, key=f"painel_carrega_{job['id']}"):
+                        ao_carregar(gerenciador.resultado(job['id']))
+                        st.rerun(scope='app')
+                    if st.button("Remover", key=f"painel_remove_{job['id']}"):
+                        gerenciador.remove(job['id'])
+                        st.rerun(scope='fragment')
+
+@st.fragment
+def exibe_tabela_paginada(tabela, chave, linhas_por_pagina=LINHAS_POR_PAGINA):
     """
-    Chama a API do Gemini com a configuração apropriada.
-    Retorna a resposta do modelo e uma mensagem de erro (se houver).
+    Exibe uma tabela consolidada (colunas booleanas esparsas) uma página por vez: só as linhas da página
+    são convertidas para 'X'/'' e enviadas ao navegador. Trocar de página reexecuta apenas o fragmento.
     """
-    try:
-        contents = [prompt_text] + file_objects
-        # st.info(f'Avaliando com o modelo {modelo}...') # Comentado para evitar chamadas Streamlit em utils
-
-        generation_config = types.GenerateContentConfig(
-            max_output_tokens=65536, # Usando o valor sugerido de 65536
-            temperature=temperature,
-        )
-
-        if response_format_choice == 'Estruturada':
-            generation_config.response_mime_type = 'application/json'
-
-        # Cria o conteúdo para a API
-        response = client.models.generate_content(
-            model=modelo,
-            contents=contents,
-            config=generation_config
-        )
-
-        return response, None
-
-    except Exception as e:
-        return None, f"Erro ao chamar a API Gemini: {e}"
\ No newline at end of file
+    total = len(tabela)
+    paginas = max(1, -(-total // linhas_por_pagina))
+    pagina = 1
+    if paginas > 1:
+        pagina = st.number_input(f"Página (de {paginas})", min_value=1, max_value=paginas, value=1, step=1, key=f"pagina_{chave}")
+    inicio = (pagina - 1) * linhas_por_pagina
+    st.dataframe(pagina_tabela(tabela, inicio, linhas_por_pagina))
+    st.caption(f"Auditados {min(inicio + 1, total)} a {min(inicio + linhas_por_pagina, total)} de {total}; {len(tabela.columns)} colunas.")